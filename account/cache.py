@@ -0,0 +1,73 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from decouple import config
+
+AUTH_USER_CACHE_TTL_SEC = config("AUTH_USER_CACHE_TTL_SEC", default=60, cast=int)
+AUTH_USER_CACHE_SIZE = config("AUTH_USER_CACHE_SIZE", default=10000, cast=int)
+
+
+@dataclass(frozen=True, slots=True)
+class AuthUser: 
+  # what request handlers need to know about the caller, without the ORM row
+  id: int
+  email: str
+  is_active: bool
+  is_admin: bool
+  is_verified: bool
+  token_version: int
+
+  @classmethod
+  def from_user(cls, user) -> "AuthUser": 
+    return cls(
+      id=user.id,
+      email=user.email,
+      is_active=user.is_active,
+      is_admin=user.is_admin,
+      is_verified=user.is_verified,
+      token_version=user.token_version
+    )
+
+  @classmethod
+  def from_claims(cls, user_id: int, payload: dict) -> "AuthUser": 
+    return cls(
+      id=user_id,
+      email=payload.get("email", ""),
+      is_active=bool(payload.get("act")),
+      is_admin=bool(payload.get("adm")),
+      is_verified=bool(payload.get("ver")),
+      token_version=int(payload["tv"])
+    )
+
+
+class UserCache: 
+  # small LRU of AuthUser snapshots, each entry lives at most `ttl` seconds
+  def __init__(self, maxsize: int, ttl: int): 
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self._entries: OrderedDict[int, tuple[float, AuthUser]] = OrderedDict()
+
+  def get(self, user_id: int) -> AuthUser | None: 
+    entry = self._entries.get(user_id)
+    if entry is None: 
+      return None
+
+    expires_at, user = entry
+    if expires_at < time.monotonic(): 
+      del self._entries[user_id]
+      return None
+
+    self._entries.move_to_end(user_id)
+    return user
+
+  def set(self, user: AuthUser) -> None: 
+    self._entries[user.id] = (time.monotonic() + self.ttl, user)
+    self._entries.move_to_end(user.id)
+    while len(self._entries) > self.maxsize: 
+      self._entries.popitem(last=False)
+
+  def invalidate(self, user_id: int) -> None: 
+    self._entries.pop(user_id, None)
+
+
+user_cache = UserCache(maxsize=AUTH_USER_CACHE_SIZE, ttl=AUTH_USER_CACHE_TTL_SEC)
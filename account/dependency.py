@@ -1,11 +1,25 @@
 from fastapi import Depends, Request, HTTPException, status
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from decouple import config
 from .utils import decode_token
-from sqlalchemy import select
 from .models import User
+from .cache import AuthUser, user_cache
 from db.config import session
 
-async def get_current_user(session: session, request: Request): 
+# trust the signed is_admin/is_active/is_verified claims on a cache miss instead of
+# loading the user; flag changes then reach other workers when the token expires
+AUTH_VERIFIED_CLAIMS = config("AUTH_VERIFIED_CLAIMS", default=False, cast=bool)
+
+
+def _user_not_found() -> HTTPException: 
+  return HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED, 
+    detail="User not found",
+    headers={"WWW-Authenticate": "Bearer"}
+  )
+
+async def get_current_user(session: session, request: Request) -> AuthUser: 
   token = request.cookies.get("access_token")
   
   if not token: 
@@ -25,21 +39,47 @@ async def get_current_user(session: session, request: Request):
         headers={"WWW-Authenticate": "Bearer"},
     )
   
-  stmt = select(User).where(User.id == int(user_id))
-  result = await session.scalars(stmt)
-  user = result.first()
+  user_id = int(user_id)
+
+  # token_version is read on every request (a primary key lookup), never from the per-worker
+  # cache, so a password change revokes old tokens on every worker at once
+  token_version = await session.scalar(select(User.token_version).where(User.id == user_id))
+  if token_version is None: 
+    raise _user_not_found()
 
-  if not user:
+  # password changes bump the version, which revokes every access token issued before
+  if "tv" in payload and payload["tv"] != token_version: 
     raise HTTPException(
       status_code=status.HTTP_401_UNAUTHORIZED, 
-      detail="User not found",
+      detail="Token has been revoked",
       headers={"WWW-Authenticate": "Bearer"}
-    ) 
+    )
+
+  # the cache only saves loading the flags; an entry from before a version bump is reloaded
+  user = user_cache.get(user_id)
+  if user is not None and user.token_version == token_version: 
+    return user
+
+  if AUTH_VERIFIED_CLAIMS and "tv" in payload: 
+    user = AuthUser.from_claims(user_id, payload)
+  else: 
+    db_user = await session.get(User, user_id)
+    if not db_user:
+      raise _user_not_found()
+    user = AuthUser.from_user(db_user)
 
+  user_cache.set(user)
   return user
 
-async def require_admin(user: User = Depends(get_current_user)):
+async def get_current_db_user(session: session, user: AuthUser = Depends(get_current_user)) -> User: 
+  # for the few handlers that modify the user row itself
+  db_user = await session.get(User, user.id)
+  if not db_user: 
+    raise _user_not_found()
+  return db_user
+
+async def require_admin(user: AuthUser = Depends(get_current_user)):
   if not user.is_admin:
     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
   return user
-  
\ No newline at end of file
+  
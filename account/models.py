@@ -1,6 +1,6 @@
 from __future__ import annotations
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Boolean, DateTime, ForeignKey
+from sqlalchemy import String, CHAR, Boolean, DateTime, ForeignKey, Integer, Index
 from datetime import datetime, timezone
 from typing import TYPE_CHECKING, List, Optional
 from db.base import Base
@@ -20,6 +20,8 @@ class User(Base):
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
     is_admin: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     is_verified: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    # bumped on password change/reset, access tokens carrying an older version are rejected
+    token_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
 
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), 
@@ -60,9 +62,9 @@ class RefreshToken(Base):
         ForeignKey("users.id", ondelete="CASCADE"), 
         nullable=False
     )
-    token: Mapped[str] = mapped_column(String(255), nullable=False)
+    # sha256 hex of the token handed to the client, the token itself is never stored
+    token_hash: Mapped[str] = mapped_column(CHAR(64), nullable=False)
     expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
-    revoked: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
 
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), 
@@ -75,3 +77,9 @@ class RefreshToken(Base):
         "User",
         back_populates="refresh_tokens"
     )
+
+    __table_args__ = (
+        Index("ix_refresh_tokens_token_hash", "token_hash", unique=True),
+        # for the purge of expired tokens
+        Index("ix_refresh_tokens_expires_at", "expires_at"),
+    )
@@ -5,6 +5,9 @@ from . import schemas
 from db.config import session
 from . import dependency as dep 
 from .models import User
+from .cache import AuthUser
+from cart.guest import load_guest_cart, clear_guest_cart
+from cart.services import merge_guest_cart
 
 
 router = APIRouter(tags=['Account'])
@@ -14,7 +17,7 @@ async def register(session: session, user: schemas.UserCreate):
   return await services.create_user(session, user)
 
 @router.post("/login")
-async def login(session: session, user_login: schemas.UserLogin): 
+async def login(session: session, request: Request, user_login: schemas.UserLogin): 
   user = await services.authenticate_user(session, user_login)
 
   if not user: 
@@ -23,6 +26,12 @@ async def login(session: session, user_login: schemas.UserLogin):
   tokens = await services.create_token(session, user)
   response = JSONResponse(content={"message": "Login successfully"})
 
+  # move whatever was put in the cart before logging in into the user's cart;
+  # if that fails the guest cart stays, so nothing the shopper picked is lost
+  guest_items = await load_guest_cart(request)
+  if guest_items and await merge_guest_cart(session, user.id, guest_items): 
+    await clear_guest_cart(request, response)
+
   # set access_token into the cookie
   response.set_cookie(
     key="access_token",
@@ -45,7 +54,7 @@ async def login(session: session, user_login: schemas.UserLogin):
   return response
 
 @router.get("/me", response_model=schemas.UserOut)
-async def me(user: User =Depends(dep.get_current_user)): 
+async def me(user: AuthUser =Depends(dep.get_current_user)): 
   return user
 
 
@@ -55,11 +64,10 @@ async def refresh_token(session: session, request: Request):
   if not token: 
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing refresh token")
   
-  user = await services.verify_refresh_token(session, token) 
-  if not user: 
+  token = await services.rotate_refresh_token(session, token) 
+  if not token: 
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid or expired refresh token")
   
-  token = await services.create_token(session, user)
   response = JSONResponse(content={"message": "Token refreshed successfully"})
   
   response.set_cookie(
@@ -92,7 +100,7 @@ async def verify_email(session: session, token:str):
   return await services.verify_email_token(session, token)
 
 @router.put('/change-password')
-async def change_user_password(session: session, data: schemas.ChangePassword, user: User = Depends(dep.get_current_user)): 
+async def change_user_password(session: session, data: schemas.ChangePassword, user: User = Depends(dep.get_current_db_user)): 
   return await services.update_and_verify_new_password(session, user, data) 
 
 
@@ -108,12 +116,12 @@ async def reset_password(session: session, data: schemas.ResetPassword):
 
 
 @router.get('/admin')
-async def admin(user: User = Depends(dep.require_admin)): 
+async def admin(user: AuthUser = Depends(dep.require_admin)): 
   return {"msg": f"Welcome admin {user.email}"}
 
 
 @router.post("/logout")
-async def logout(session: session, request: Request, user: User = Depends(dep.get_current_user)): 
+async def logout(session: session, request: Request, user: AuthUser = Depends(dep.get_current_user)): 
   refresh_token = request.cookies.get("refresh_token")
   if refresh_token: 
     await services.revoke_refresh_token(session, refresh_token)
@@ -124,6 +132,6 @@ async def logout(session: session, request: Request, user: User = Depends(dep.ge
   return response
    
 @router.put("/make-me-admin", response_model=schemas.UserOut)
-async def make_admin(session: session, user: User = Depends(dep.get_current_user)):
+async def make_admin(session: session, user: User = Depends(dep.get_current_db_user)):
   return await services.make_admin(session, user)
 
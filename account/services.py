@@ -1,12 +1,21 @@
 from account.models import User, RefreshToken
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import select, update, delete
 from . import schemas
 from . import utils
-import uuid
+from .cache import user_cache
+import asyncio
+import logging
 from decouple import config
 from datetime import datetime, timezone, timedelta
+from db.config import async_session
+
+logger = logging.getLogger(__name__)
+
+JWT_REFRESH_TOKEN_TIME_DAY = config("JWT_REFRESH_TOKEN_TIME_DAY", cast=int) 
+REFRESH_TOKEN_PURGE_INTERVAL_SEC = config("REFRESH_TOKEN_PURGE_INTERVAL_SEC", default=3600, cast=int)
+REFRESH_TOKEN_PURGE_BATCH_SIZE = config("REFRESH_TOKEN_PURGE_BATCH_SIZE", default=1000, cast=int)
 
 
 async def create_user(session: AsyncSession, user: schemas.UserCreate): 
@@ -21,7 +30,7 @@ async def create_user(session: AsyncSession, user: schemas.UserCreate):
   # create user
   new_user = User(
     email = user.email, 
-    hashed_password = utils.hash_password(user.password)
+    hashed_password = await utils.password_hasher.hash(user.password)
   )
 
   session.add(new_user)
@@ -36,23 +45,32 @@ async def authenticate_user(session: AsyncSession, user_login: schemas.UserLogin
   result = await session.scalars(stmt)
   user = result.first()
 
-  if not user or not utils.verify_password(user_login.password, user.hashed_password):
+  if not user: 
     return None
+
+  is_valid, new_hash = await utils.password_hasher.verify_and_update(user_login.password, user.hashed_password)
+  if not is_valid: 
+    return None
+
+  # argon2 parameters changed since this hash was made, store it with the current ones
+  if new_hash: 
+    user.hashed_password = new_hash
+    session.add(user)
+    await session.commit()
   
   return user
 
  
 
 async def create_token(session: AsyncSession, user: User): 
-  access_token = utils.create_access_token(data={"sub": str(user.id)})
-  JWT_REFRESH_TOKEN_TIME_DAY = config("JWT_REFRESH_TOKEN_TIME_DAY", cast=int) 
-  refresh_token_str = str(uuid.uuid4())
+  access_token = utils.create_access_token(data=utils.access_token_claims(user))
+  refresh_token_str = utils.generate_refresh_token()
 
   expires_at = datetime.now(timezone.utc) + timedelta(days=JWT_REFRESH_TOKEN_TIME_DAY)
   
   refresh_token = RefreshToken(
     user_id=user.id, 
-    token=refresh_token_str, 
+    token_hash=utils.hash_refresh_token(refresh_token_str), 
     expires_at=expires_at
   )
   session.add(refresh_token)
@@ -65,23 +83,36 @@ async def create_token(session: AsyncSession, user: User):
   }
 
 
-async def verify_refresh_token(session: AsyncSession, token: str): 
-  query = await session.scalars(select(RefreshToken).where(token == RefreshToken.token))
-  object = query.first()
-  
-  if object and not object.revoked: 
-    expires_at = object.expires_at
-
-    if expires_at.tzinfo is None: 
-      expires_at = expires_at.replace(tzinfo=timezone.utc)
+async def rotate_refresh_token(session: AsyncSession, token: str): 
+  # swaps the token for a new one in a single UPDATE on the unique hash index: a token that is
+  # unknown, revoked (deleted), expired or already rotated by a concurrent refresh matches no row
+  now = datetime.now(timezone.utc)
+  new_token = utils.generate_refresh_token()
+  new_hash = utils.hash_refresh_token(new_token)
+
+  stmt = (
+    update(RefreshToken)
+    .where(
+      RefreshToken.token_hash == utils.hash_refresh_token(token),
+      RefreshToken.expires_at > now
+    )
+    .values(token_hash=new_hash, expires_at=now + timedelta(days=JWT_REFRESH_TOKEN_TIME_DAY))
+    .execution_options(synchronize_session=False)
+  )
+  result = await session.execute(stmt)
+  if result.rowcount != 1: 
+    await session.rollback()
+    return None
 
-    if expires_at > datetime.now(timezone.utc):
-      user_stmt =select(User).where(User.id == object.user_id)
-      query = await session.scalars(user_stmt)
-      object = query.first()
-      return object
+  user_stmt = select(User).join(RefreshToken, RefreshToken.user_id == User.id).where(RefreshToken.token_hash == new_hash)
+  user = (await session.execute(user_stmt)).scalar_one()
+  await session.commit()
 
-  return None 
+  return {
+    "access_token": utils.create_access_token(data=utils.access_token_claims(user)), 
+    "refresh_token": new_token,
+    "token_type": "bearer"
+  }
 
 
 async def create_email_verification_token(user_id: int): 
@@ -107,17 +138,22 @@ async def verify_email_token(session: AsyncSession, token: str):
   user.is_verified = True 
   session.add(user)
   await session.commit()
+  user_cache.invalidate(user.id)
   return {"msg": "Email verifid successfully"}
 
 
 
 async def update_and_verify_new_password(session: AsyncSession, user: User, data: schemas.ChangePassword): 
-  if not utils.verify_password(data.old_password, user.hashed_password): 
+  if not await utils.password_hasher.verify(data.old_password, user.hashed_password): 
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Old password is incorrect")
   
-  user.hashed_password = utils.hash_password(data.new_password)
+  user.hashed_password = await utils.password_hasher.hash(data.new_password)
+  user.token_version += 1
   session.add(user) 
+  # refreshing would otherwise hand out access tokens carrying the new version
+  await session.execute(delete(RefreshToken).where(RefreshToken.user_id == user.id))
   await session.commit()
+  user_cache.invalidate(user.id)
 
   return {"msg": "Password changed successfully"}
 
@@ -155,23 +191,61 @@ async def verify_token_and_reset_password(session: AsyncSession, data: schemas.R
   if not user: 
     raise HTTPException(detail="User not found", status_code=status.HTTP_400_BAD_REQUEST)
 
-  user.hashed_password = utils.hash_password(data.new_password) 
+  user.hashed_password = await utils.password_hasher.hash(data.new_password) 
+  user.token_version += 1
   session.add(user)
+  # a stolen refresh token must not survive the reset
+  await session.execute(delete(RefreshToken).where(RefreshToken.user_id == user.id))
   await session.commit()
+  user_cache.invalidate(user.id)
   return {"msg": "Reset password successfully"}
 
 
 
 async def revoke_refresh_token(session: AsyncSession, token: str): 
-  stmt = select(RefreshToken).where(RefreshToken.token== token)
-  result = await session.scalars(stmt)
-  db_token = result.first()
-
-  if db_token: 
-    db_token.revoked = True
-    await session.commit()
+  # nothing to keep once it is revoked
+  stmt = delete(RefreshToken).where(RefreshToken.token_hash == utils.hash_refresh_token(token))
+  await session.execute(stmt)
+  await session.commit()
   
 
+async def purge_refresh_tokens(session: AsyncSession, batch_size: int = REFRESH_TOKEN_PURGE_BATCH_SIZE) -> int: 
+  # revoked tokens are deleted on the spot, so only expired ones are left to purge;
+  # small batches on the expires_at index, so a purge never holds many row locks at once
+  now = datetime.now(timezone.utc)
+  stmt = (
+    select(RefreshToken.id)
+    .where(RefreshToken.expires_at < now)
+    .order_by(RefreshToken.expires_at)
+    .limit(batch_size)
+  )
+  ids = list((await session.execute(stmt)).scalars().all())
+  if not ids: 
+    await session.rollback()
+    return 0
+
+  await session.execute(delete(RefreshToken).where(RefreshToken.id.in_(ids)))
+  await session.commit()
+  return len(ids)
+
+
+async def run_refresh_token_purge(
+    interval: int = REFRESH_TOKEN_PURGE_INTERVAL_SEC, 
+    batch_size: int = REFRESH_TOKEN_PURGE_BATCH_SIZE
+) -> None: 
+  while True: 
+    try: 
+      async with async_session() as session: 
+        while await purge_refresh_tokens(session, batch_size) == batch_size: 
+          pass
+    except asyncio.CancelledError: 
+      raise
+    except Exception: 
+      logger.exception("purging expired refresh tokens failed")
+
+    await asyncio.sleep(interval)
+
+
 async def make_admin(session: AsyncSession, user: User): 
   if not user: 
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only authenticated users can promote themselves to admin")
@@ -180,4 +254,5 @@ async def make_admin(session: AsyncSession, user: User):
   session.add(user)
   await session.commit()
   await session.refresh(user)
+  user_cache.invalidate(user.id)
   return user
\ No newline at end of file
@@ -1,3 +1,8 @@
+import asyncio
+import hashlib
+import secrets
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from passlib.context import CryptContext
 from decouple import config
 from datetime import timedelta, datetime, timezone
@@ -10,7 +15,23 @@ JWT_ACCESS_TOKEN_TIME_MIN = config("JWT_ACCESS_TOKEN_TIME_MIN", cast=int)
 EMAIL_VERIFICATION_TOKEN_TIME_HOUR = config("EMAIL_VERIFICATION_TOKEN_TIME_HOUR", cast=int) 
 EMAIL_PASSWORD_RESET_TOKEN_TIME_HOUR = config("EMAIL_PASSWORD_RESET_TOKEN_TIME_HOUR", cast=int) 
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# hashes made with other parameters are upgraded on the next successful login
+ARGON2_TIME_COST = config("ARGON2_TIME_COST", default=3, cast=int)
+ARGON2_MEMORY_COST = config("ARGON2_MEMORY_COST", default=65536, cast=int)
+ARGON2_PARALLELISM = config("ARGON2_PARALLELISM", default=4, cast=int)
+
+# argon2 runs in this pool so it never blocks the event loop
+PASSWORD_HASH_EXECUTOR = config("PASSWORD_HASH_EXECUTOR", default="thread")
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", default=4, cast=int)
+PASSWORD_HASH_MAX_CONCURRENCY = config("PASSWORD_HASH_MAX_CONCURRENCY", default=PASSWORD_HASH_WORKERS, cast=int)
+
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
 
 
 def hash_password(password: str):
@@ -19,12 +40,102 @@ def hash_password(password: str):
 def verify_password(given_plan_password: str, real_hashed_password: str):
     return pwd_context.verify(given_plan_password, real_hashed_password)
 
+def verify_and_update_password(given_plan_password: str, real_hashed_password: str) -> tuple[bool, str | None]:
+    # returns a new hash as well when the stored one uses outdated parameters
+    return pwd_context.verify_and_update(given_plan_password, real_hashed_password)
+
+
+class PasswordHasher:
+    def __init__(self, executor: str, workers: int, max_concurrency: int):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"PASSWORD_HASH_EXECUTOR must be 'thread' or 'process', got {executor!r}")
+        self.executor_kind = executor
+        self.workers = workers
+        self._executor: Executor | None = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.queue_seconds = 0.0
+        self.run_seconds = 0.0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            pool = ProcessPoolExecutor if self.executor_kind == "process" else ThreadPoolExecutor
+            self._executor = pool(max_workers=self.workers)
+        return self._executor
+
+    async def _run(self, fn, *args):
+        enqueued_at = time.perf_counter()
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        started_at = time.perf_counter()
+        self.queue_seconds += started_at - enqueued_at
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.run_seconds += time.perf_counter() - started_at
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, given_plan_password: str, real_hashed_password: str) -> bool:
+        return await self._run(verify_password, given_plan_password, real_hashed_password)
+
+    async def verify_and_update(self, given_plan_password: str, real_hashed_password: str) -> tuple[bool, str | None]:
+        return await self._run(verify_and_update_password, given_plan_password, real_hashed_password)
+
+    def metrics(self) -> dict:
+        return {
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "queue_seconds_total": self.queue_seconds,
+            "run_seconds_total": self.run_seconds,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_CONCURRENCY)
+
+def generate_refresh_token() -> str: 
+    return secrets.token_urlsafe(32)
+
+def hash_refresh_token(token: str) -> str: 
+    # the token is random, a fast hash is enough to make a stolen table useless
+    return hashlib.sha256(token.encode()).hexdigest()
+
 def create_access_token(data: dict, expires_delta: timedelta = None): 
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=JWT_ACCESS_TOKEN_TIME_MIN))
     to_encode.update({'exp': expire})
     return jwt.encode(to_encode, JWT_SECRET_KEY, JWT_ALGORITHM)
 
+def access_token_claims(user) -> dict: 
+    # lets get_current_user authorize the request without loading the user
+    return {
+        "sub": str(user.id),
+        "email": user.email,
+        "adm": user.is_admin,
+        "act": user.is_active,
+        "ver": user.is_verified,
+        "tv": user.token_version,
+    }
+
 def decode_token(token):
     try:
         return jwt.decode(token, JWT_SECRET_KEY, algorithms=JWT_ALGORITHM )
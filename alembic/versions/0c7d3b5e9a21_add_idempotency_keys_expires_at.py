@@ -0,0 +1,37 @@
+"""add idempotency_keys expires_at
+
+Revision ID: 0c7d3b5e9a21
+Revises: f2a6c9d4b173
+Create Date: 2026-10-18 19:04:33.281946
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0c7d3b5e9a21'
+down_revision: Union[str, Sequence[str], None] = 'f2a6c9d4b173'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('idempotency_keys', sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True))
+    # existing rows keep the windows they had: a day of replay, two minutes of lock
+    op.execute(
+        "UPDATE idempotency_keys SET expires_at = CASE status "
+        "WHEN 'completed' THEN created_at + INTERVAL 1 DAY "
+        "ELSE updated_at + INTERVAL 2 MINUTE END"
+    )
+    op.alter_column('idempotency_keys', 'expires_at', existing_type=sa.DateTime(timezone=True), nullable=False)
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_column('idempotency_keys', 'expires_at')
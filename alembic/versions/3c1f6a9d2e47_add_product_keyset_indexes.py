@@ -0,0 +1,30 @@
+"""add product keyset indexes
+
+Revision ID: 3c1f6a9d2e47
+Revises: 4b7853fbbef0
+Create Date: 2026-10-18 09:12:31.418230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f6a9d2e47'
+down_revision: Union[str, Sequence[str], None] = '4b7853fbbef0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_products_created_at_id', 'products', ['created_at', 'id'], unique=False)
+    op.create_index('ix_products_price_id', 'products', ['price', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_price_id', table_name='products')
+    op.drop_index('ix_products_created_at_id', table_name='products')
@@ -0,0 +1,30 @@
+"""drop refresh_tokens.revoked
+
+Revision ID: 3d9a6f2e1c84
+Revises: 7b1e4f0c8d56
+Create Date: 2026-10-18 21:04:51.318027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9a6f2e1c84'
+down_revision: Union[str, Sequence[str], None] = '7b1e4f0c8d56'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # revoking deletes the row now; what is left flagged can never be used again
+    op.execute("DELETE FROM refresh_tokens WHERE revoked = 1")
+    op.drop_column('refresh_tokens', 'revoked')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('refresh_tokens', sa.Column('revoked', sa.Boolean(), server_default=sa.false(), nullable=False))
@@ -0,0 +1,28 @@
+"""add product image variants
+
+Revision ID: 5e8b2c7a9d14
+Revises: d42a9f6c1b03
+Create Date: 2026-10-18 14:06:19.662035
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8b2c7a9d14'
+down_revision: Union[str, Sequence[str], None] = 'd42a9f6c1b03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('products', sa.Column('image_variants', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('products', 'image_variants')
@@ -0,0 +1,41 @@
+"""add cart items user product unique
+
+Revision ID: 6f3d9a1c2b87
+Revises: 5e8b2c7a9d14
+Create Date: 2026-10-18 15:12:44.508317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f3d9a1c2b87'
+down_revision: Union[str, Sequence[str], None] = '5e8b2c7a9d14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # fold duplicate (user_id, product_id) rows into the oldest one before adding the constraint
+    op.execute(
+        "UPDATE cart_items c JOIN ("
+        "SELECT MIN(id) AS id, SUM(quantity) AS quantity FROM cart_items "
+        "WHERE product_id IS NOT NULL GROUP BY user_id, product_id HAVING COUNT(*) > 1"
+        ") d ON c.id = d.id SET c.quantity = d.quantity"
+    )
+    op.execute(
+        "DELETE c FROM cart_items c JOIN cart_items k "
+        "ON k.user_id = c.user_id AND k.product_id = c.product_id AND k.id < c.id"
+    )
+    op.create_unique_constraint('uq_cart_items_user_product', 'cart_items', ['user_id', 'product_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # the constraint also backs the user_id foreign key since MySQL dropped its own index for it
+    op.create_index('user_id', 'cart_items', ['user_id'], unique=False)
+    op.drop_constraint('uq_cart_items_user_product', 'cart_items', type_='unique')
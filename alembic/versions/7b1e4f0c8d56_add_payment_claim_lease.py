@@ -0,0 +1,42 @@
+"""add payment claim lease
+
+Revision ID: 7b1e4f0c8d56
+Revises: 0c7d3b5e9a21
+Create Date: 2026-10-18 19:37:12.660184
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1e4f0c8d56'
+down_revision: Union[str, Sequence[str], None] = '0c7d3b5e9a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column('payments', 'status',
+               existing_type=sa.Enum('pending', 'success', 'failed', 'cancelled', name='paymentstatus'),
+               type_=sa.Enum('pending', 'processing', 'success', 'failed', 'cancelled', name='paymentstatusenum'),
+               existing_nullable=False)
+    op.add_column('payments', sa.Column('simulate_success', sa.Boolean(), nullable=True))
+    op.add_column('payments', sa.Column('lease_owner', sa.String(length=64), nullable=True))
+    op.add_column('payments', sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # claims in flight go back to pending, the older worker re-queues those on startup
+    op.execute("UPDATE payments SET status = 'pending' WHERE status = 'processing'")
+    op.drop_column('payments', 'lease_expires_at')
+    op.drop_column('payments', 'lease_owner')
+    op.drop_column('payments', 'simulate_success')
+    op.alter_column('payments', 'status',
+               existing_type=sa.Enum('pending', 'processing', 'success', 'failed', 'cancelled', name='paymentstatusenum'),
+               type_=sa.Enum('pending', 'success', 'failed', 'cancelled', name='paymentstatus'),
+               existing_nullable=False)
@@ -0,0 +1,28 @@
+"""add product fulltext index
+
+Revision ID: 8a5d0e7b4f19
+Revises: 3c1f6a9d2e47
+Create Date: 2026-10-18 10:02:47.903114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a5d0e7b4f19'
+down_revision: Union[str, Sequence[str], None] = '3c1f6a9d2e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ft_products_title_description', 'products', ['title', 'description'], unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ft_products_title_description', table_name='products')
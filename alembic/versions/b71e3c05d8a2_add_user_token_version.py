@@ -0,0 +1,28 @@
+"""add user token version
+
+Revision ID: b71e3c05d8a2
+Revises: 8a5d0e7b4f19
+Create Date: 2026-10-18 11:20:05.517642
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b71e3c05d8a2'
+down_revision: Union[str, Sequence[str], None] = '8a5d0e7b4f19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'token_version')
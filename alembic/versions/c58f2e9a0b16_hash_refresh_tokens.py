@@ -0,0 +1,41 @@
+"""hash refresh tokens
+
+Revision ID: c58f2e9a0b16
+Revises: a93e5c1f7d20
+Create Date: 2026-10-18 16:20:37.845102
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c58f2e9a0b16'
+down_revision: Union[str, Sequence[str], None] = 'a93e5c1f7d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('refresh_tokens', sa.Column('token_hash', sa.CHAR(length=64), nullable=True))
+    # existing tokens keep working: their hash is what the app now looks up
+    op.execute("UPDATE refresh_tokens SET token_hash = SHA2(token, 256)")
+    op.alter_column('refresh_tokens', 'token_hash', existing_type=sa.CHAR(length=64), nullable=False)
+    op.create_index('ix_refresh_tokens_token_hash', 'refresh_tokens', ['token_hash'], unique=True)
+    op.create_index('ix_refresh_tokens_expires_at', 'refresh_tokens', ['expires_at'], unique=False)
+    op.drop_column('refresh_tokens', 'token')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # the plain tokens can't be recovered, every refresh token stops working
+    op.add_column('refresh_tokens', sa.Column('token', mysql.VARCHAR(length=255), nullable=True))
+    op.execute("UPDATE refresh_tokens SET token = token_hash, revoked = 1")
+    op.alter_column('refresh_tokens', 'token', existing_type=mysql.VARCHAR(length=255), nullable=False)
+    op.drop_index('ix_refresh_tokens_expires_at', table_name='refresh_tokens')
+    op.drop_index('ix_refresh_tokens_token_hash', table_name='refresh_tokens')
+    op.drop_column('refresh_tokens', 'token_hash')
@@ -0,0 +1,49 @@
+"""add hot path indexes
+
+Revision ID: e7b4d2a8c935
+Revises: c58f2e9a0b16
+Create Date: 2026-10-18 16:58:12.406733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b4d2a8c935'
+down_revision: Union[str, Sequence[str], None] = 'c58f2e9a0b16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_orders_user_id_created_at', 'orders', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_orders_status_created_at', 'orders', ['status', 'created_at'], unique=False)
+    op.create_index('ix_payments_user_id', 'payments', ['user_id'], unique=False)
+    op.create_index('ix_payments_status', 'payments', ['status'], unique=False)
+    op.create_index('ix_shipping_address_user_id', 'shipping_address', ['user_id'], unique=False)
+    # keep the newest status if an order somehow got more than one
+    op.execute(
+        "DELETE s FROM shipping_status s JOIN shipping_status n "
+        "ON n.order_id = s.order_id AND n.id > s.id"
+    )
+    op.create_unique_constraint('uq_shipping_status_order_id', 'shipping_status', ['order_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # MySQL dropped its own foreign key indexes when these took over, put plain ones back first
+    op.create_index('order_id', 'shipping_status', ['order_id'], unique=False)
+    op.create_index('user_id', 'shipping_address', ['user_id'], unique=False)
+    op.create_index('user_id', 'payments', ['user_id'], unique=False)
+    op.create_index('user_id', 'orders', ['user_id'], unique=False)
+
+    op.drop_constraint('uq_shipping_status_order_id', 'shipping_status', type_='unique')
+    op.drop_index('ix_shipping_address_user_id', table_name='shipping_address')
+    op.drop_index('ix_payments_status', table_name='payments')
+    op.drop_index('ix_payments_user_id', table_name='payments')
+    op.drop_index('ix_orders_status_created_at', table_name='orders')
+    op.drop_index('ix_orders_user_id_created_at', table_name='orders')
@@ -0,0 +1,33 @@
+"""split product fulltext index
+
+Revision ID: f2a6c9d4b173
+Revises: e7b4d2a8c935
+Create Date: 2026-10-18 18:21:05.517342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a6c9d4b173'
+down_revision: Union[str, Sequence[str], None] = 'e7b4d2a8c935'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # title and description are matched separately, and MATCH() needs an index on exactly its columns
+    op.create_index('ft_products_title', 'products', ['title'], unique=False, mysql_prefix='FULLTEXT')
+    op.create_index('ft_products_description', 'products', ['description'], unique=False, mysql_prefix='FULLTEXT')
+    op.drop_index('ft_products_title_description', table_name='products')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ft_products_title_description', 'products', ['title', 'description'], unique=False, mysql_prefix='FULLTEXT')
+    op.drop_index('ft_products_description', table_name='products')
+    op.drop_index('ft_products_title', table_name='products')
@@ -0,0 +1,17 @@
+"""Runnable benchmarks, one module per hot path: `python -m benchmarks.<name> --help`.
+
+Each module exposes an async benchmark() returning plain dicts (like
+product.search.benchmark) and prints them as JSON when run directly.
+"""
+from statistics import median
+
+
+def summarize(samples_ms: list[float]) -> dict[str, float]:
+  ordered = sorted(samples_ms)
+  if not ordered:
+    return {"p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+  return {
+    "p50_ms": round(median(ordered), 3),
+    "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+    "max_ms": round(ordered[-1], 3),
+  }
@@ -0,0 +1,84 @@
+"""Checkout latency against cart size.
+
+Seeds one user, a shipping address and enough products into the configured database,
+then for each cart size fills the cart through apply_cart_batch and times
+order.services.checkout on its own session. Checkout should cost the same number of
+round trips whatever the size, so latency should grow only with the rows written.
+
+The rows are left behind (orders stay pending, the payment worker is not started), so
+point DB_NAME at a scratch database.
+
+  python -m benchmarks.checkout --sizes 1 10 50 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from account.models import User
+from benchmarks import summarize
+from cart.schemas import CartBatchOp
+from cart.services import apply_cart_batch
+from db.config import DB_QUERY_STATS, async_session, engine
+from db.querystats import install_query_stats, track_queries
+from order.services import checkout
+from payment.schemas import PaymentCreate
+from product.models import Product
+from shipping.models import ShippingAddress
+
+
+async def seed(products: int) -> tuple[int, int, list[int]]:
+  run_id = uuid.uuid4().hex[:12]
+  async with async_session() as session:
+    user = User(email=f"bench-{run_id}@example.com", hashed_password="!", is_verified=True)
+    session.add(user)
+    await session.flush()
+
+    address = ShippingAddress(
+      user_id=user.id, name="Bench", address_line1="1 Bench St",
+      city="Bench", state="Bench", pin_code="00000", country="Bench"
+    )
+    items = [
+      Product(title=f"bench {run_id} {i}", slug=f"bench-{run_id}-{i}", price=1.0, stock_quantity=1_000_000)
+      for i in range(products)
+    ]
+    session.add(address)
+    session.add_all(items)
+    await session.commit()
+    return user.id, address.id, [product.id for product in items]
+
+
+async def run(user_id: int, address_id: int, product_ids: list[int], size: int, repeat: int) -> dict[str, float]:
+  samples, statements = [], 0
+  for _ in range(repeat):
+    async with async_session() as session:
+      await apply_cart_batch(session, user_id, [CartBatchOp(product_id=pid, quantity=1) for pid in product_ids[:size]])
+
+    payment = PaymentCreate(amount=size, shipping_address_id=address_id, simulate_success=True)
+    async with async_session() as session:
+      with track_queries() as stats:
+        started_at = time.perf_counter()
+        await checkout(session, user_id, payment)
+        samples.append((time.perf_counter() - started_at) * 1000)
+      statements = stats.count
+
+  return {"statements": statements, **summarize(samples)}
+
+
+async def benchmark(sizes: list[int], repeat: int = 5) -> dict[int, dict[str, float]]:
+  """Checkout latency and statement count per cart size."""
+  if not DB_QUERY_STATS:
+    install_query_stats(engine)
+  try:
+    user_id, address_id, product_ids = await seed(max(sizes))
+    return {size: await run(user_id, address_id, product_ids, size, repeat) for size in sizes}
+  finally:
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50])
+  parser.add_argument("--repeat", type=int, default=5)
+  args = parser.parse_args()
+  print(json.dumps(asyncio.run(benchmark(args.sizes, args.repeat)), indent=2))
@@ -0,0 +1,108 @@
+"""Serialization time and bytes on the wire for the large list responses.
+
+Builds 100 products (PaginatedProductOut) and 100 orders with items, address and
+shipping status (list[OrderOut]) from plain objects, as the routers do with ORM rows,
+then renders them with the stdlib JSONResponse and with FastJSONResponse and measures
+the body with gzip and brotli at CompressionMiddleware's default levels.
+
+  python -m benchmarks.json_responses --items 100 --repeat 50
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from statistics import median
+from types import SimpleNamespace
+from fastapi.responses import JSONResponse
+from benchmarks import summarize
+from core.compression import _Compressor, brotli
+from core.responses import FastJSONResponse, fast_json_available
+from order.schemas import OrderOut
+from product.schemas import PaginatedProductOut
+
+
+def sample_products(items: int) -> SimpleNamespace:
+  products = [
+    SimpleNamespace(
+      id=i, title=f"Product {i}", description="A reasonably long product description. " * 4,
+      price=19.99 + i, stock_quantity=100, slug=f"product-{i}",
+      categories=[SimpleNamespace(id=1, name="Shoes"), SimpleNamespace(id=2, name="Sale")],
+      image_url=f"/media/images/{i}.jpg",
+      image_variants={"thumbnail": f"/media/images/{i}-thumb.webp", "medium": f"/media/images/{i}-medium.webp"},
+    )
+    for i in range(items)
+  ]
+  return SimpleNamespace(total=items * 10, page=1, limit=items, items=products, next_cursor="eyJ2IjoxfQ", prev_cursor=None)
+
+
+def sample_orders(items: int) -> list[SimpleNamespace]:
+  now = datetime.now(timezone.utc)
+  address = SimpleNamespace(
+    id=1, user_id=1, name="Jane Doe", address_line1="1 Main St", address_line2=None,
+    city="Springfield", state="IL", pin_code="62701", country="US"
+  )
+  return [
+    SimpleNamespace(
+      id=i, user_id=1, total_price=59.97, status="confirmed", created_at=now,
+      shipping_address=address,
+      shipping_status=SimpleNamespace(id=i, order_id=i, status="pending", updated_at=now),
+      orderitems=[
+        SimpleNamespace(
+          id=i * 3 + n, product_id=n, quantity=1, price=19.99,
+          product=SimpleNamespace(title=f"Product {n}", description="A product description.")
+        )
+        for n in range(3)
+      ],
+    )
+    for i in range(items)
+  ]
+
+
+def validate(name: str, source) -> object:
+  # what the routers hand to the response class
+  if name == "PaginatedProductOut":
+    return PaginatedProductOut.model_validate(source).model_dump(mode="json")
+  return [OrderOut.model_validate(order).model_dump(mode="json") for order in source]
+
+
+def _wire_sizes(body: bytes) -> dict[str, int]:
+  sizes = {"identity_bytes": len(body), "gzip_bytes": len(_Compressor("gzip", 6, 4).finish(body))}
+  if brotli is not None:
+    sizes["br_bytes"] = len(_Compressor("br", 6, 4).finish(body))
+  return sizes
+
+
+def _time_ms(fn, repeat: int) -> list[float]:
+  samples = []
+  for _ in range(repeat):
+    started_at = time.perf_counter()
+    fn()
+    samples.append((time.perf_counter() - started_at) * 1000)
+  return samples
+
+
+async def benchmark(items: int = 100, repeat: int = 50) -> dict[str, dict[str, dict]]:
+  """Render time and body sizes per payload and response class, plus the validation cost both share."""
+  classes = {"json": JSONResponse}
+  if fast_json_available():
+    classes["fast_json"] = FastJSONResponse
+
+  sources = {"PaginatedProductOut": sample_products(items), "list[OrderOut]": sample_orders(items)}
+  results: dict[str, dict[str, dict]] = {}
+  for name, source in sources.items():
+    results[name] = {"validation": summarize(_time_ms(lambda: validate(name, source), repeat))}
+    content = validate(name, source)
+    for label, response_class in classes.items():
+      samples = _time_ms(lambda: response_class(content), repeat)
+      results[name][label] = {"render_p50_ms": round(median(samples), 3), **_wire_sizes(response_class(content).body)}
+
+  return results
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--items", type=int, default=100)
+  parser.add_argument("--repeat", type=int, default=50)
+  args = parser.parse_args()
+  print(json.dumps(asyncio.run(benchmark(args.items, args.repeat)), indent=2))
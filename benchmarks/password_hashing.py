@@ -0,0 +1,68 @@
+"""Event-loop lag while concurrent logins verify argon2 hashes.
+
+Runs `logins` verifications, at most `concurrency` at a time, either inline on the
+event loop (how the account services used to call passlib) or through
+account.utils.password_hasher. Meanwhile a probe task sleeps 1 ms at a time and
+records how late it wakes up. That lateness is what every other request in the
+worker would wait.
+
+  python -m benchmarks.password_hashing --logins 32 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import time
+from account.utils import hash_password, verify_password, password_hasher
+from benchmarks import summarize
+
+PASSWORD = "benchmark-password"
+
+
+async def _probe(stop: asyncio.Event, interval: float, lags: list[float]) -> None:
+  while not stop.is_set():
+    started_at = time.perf_counter()
+    await asyncio.sleep(interval)
+    lags.append((time.perf_counter() - started_at - interval) * 1000)
+
+
+async def _verify_inline(password: str, hashed: str) -> bool:
+  return verify_password(password, hashed)
+
+
+async def run(mode: str, hashed: str, logins: int, concurrency: int, interval: float = 0.001) -> dict[str, float]:
+  verify = password_hasher.verify if mode == "pool" else _verify_inline
+  semaphore = asyncio.Semaphore(concurrency)
+
+  async def login() -> None:
+    async with semaphore:
+      if not await verify(PASSWORD, hashed):
+        raise RuntimeError("verification failed")
+
+  lags: list[float] = []
+  stop = asyncio.Event()
+  probe = asyncio.create_task(_probe(stop, interval, lags))
+
+  started_at = time.perf_counter()
+  await asyncio.gather(*(login() for _ in range(logins)))
+  elapsed = time.perf_counter() - started_at
+
+  stop.set()
+  await probe
+  return {"logins_per_sec": round(logins / elapsed, 1), **{f"loop_lag_{k}": v for k, v in summarize(lags).items()}}
+
+
+async def benchmark(logins: int = 32, concurrency: int = 8) -> dict[str, dict[str, float]]:
+  """Login throughput and event-loop lag, inline (the baseline) and through the hashing pool."""
+  hashed = hash_password(PASSWORD)
+  try:
+    return {mode: await run(mode, hashed, logins, concurrency) for mode in ("inline", "pool")}
+  finally:
+    password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--logins", type=int, default=32)
+  parser.add_argument("--concurrency", type=int, default=8)
+  args = parser.parse_args()
+  print(json.dumps(asyncio.run(benchmark(args.logins, args.concurrency)), indent=2))
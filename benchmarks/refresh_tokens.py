@@ -0,0 +1,112 @@
+"""Refresh latency against a large refresh_tokens table.
+
+Tops refresh_tokens up to `tokens` rows (10M by default, a tenth of them expired,
+spread over a handful of seeded users), then times rotate_refresh_token on a chain of
+real tokens and purge_refresh_tokens on full batches of expired rows. Rotation is a
+single UPDATE on the unique token_hash index, so its latency should not move with the
+table size; rerunning with a smaller --tokens only re-times, it never deletes rows.
+
+Seeding 10M rows takes a while; point DB_NAME at a scratch database.
+
+  python -m benchmarks.refresh_tokens --tokens 10000000 --refreshes 200
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import func, insert, select
+from account.models import RefreshToken, User
+from account.services import create_token, purge_refresh_tokens, rotate_refresh_token
+from benchmarks import summarize
+from db.config import async_session, engine
+
+SEED_BATCH_SIZE = 10_000
+SEED_USERS = 100
+
+
+async def seed(tokens: int) -> int:
+  run_id = uuid.uuid4().hex[:12]
+  async with async_session() as session:
+    existing = await session.scalar(select(func.count(RefreshToken.id)))
+    if existing >= tokens:
+      return existing
+
+    users = [User(email=f"bench-{run_id}-{i}@example.com", hashed_password="!") for i in range(SEED_USERS)]
+    session.add_all(users)
+    await session.flush()
+    user_ids = [user.id for user in users]
+
+    now = datetime.now(timezone.utc)
+    for start in range(existing, tokens, SEED_BATCH_SIZE):
+      rows = []
+      for i in range(start, min(start + SEED_BATCH_SIZE, tokens)):
+        expired = i % 10 == 0
+        rows.append({
+          "user_id": user_ids[i % SEED_USERS],
+          "token_hash": hashlib.sha256(f"{run_id}-{i}".encode()).hexdigest(),
+          "expires_at": now + (timedelta(days=-1) if expired else timedelta(days=7)),
+        })
+      await session.execute(insert(RefreshToken), rows)
+      await session.commit()
+
+    total = await session.scalar(select(func.count(RefreshToken.id)))
+    await session.commit()
+    return total
+
+
+async def time_refreshes(refreshes: int) -> list[float]:
+  async with async_session() as session:
+    user = User(email=f"bench-{uuid.uuid4().hex[:12]}@example.com", hashed_password="!")
+    session.add(user)
+    await session.flush()
+    token = (await create_token(session, user))["refresh_token"]
+
+  samples = []
+  for _ in range(refreshes):
+    async with async_session() as session:
+      started_at = time.perf_counter()
+      tokens = await rotate_refresh_token(session, token)
+      samples.append((time.perf_counter() - started_at) * 1000)
+    if tokens is None:
+      raise RuntimeError("rotation unexpectedly rejected the previous token")
+    token = tokens["refresh_token"]
+  return samples
+
+
+async def time_purges(batches: int) -> tuple[list[float], int]:
+  samples, purged = [], 0
+  for _ in range(batches):
+    async with async_session() as session:
+      started_at = time.perf_counter()
+      count = await purge_refresh_tokens(session)
+      samples.append((time.perf_counter() - started_at) * 1000)
+    purged += count
+    if count == 0:
+      break
+  return samples, purged
+
+
+async def benchmark(tokens: int = 10_000_000, refreshes: int = 200, purge_batches: int = 5) -> dict[str, dict]:
+  """Rotation and purge-batch latency with the table holding at least `tokens` rows."""
+  try:
+    table_rows = await seed(tokens)
+    purge_samples, purged = await time_purges(purge_batches)
+    return {
+      "table": {"rows": table_rows},
+      "rotate": summarize(await time_refreshes(refreshes)),
+      "purge_batch": {"rows_purged": purged, **summarize(purge_samples)},
+    }
+  finally:
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--tokens", type=int, default=10_000_000)
+  parser.add_argument("--refreshes", type=int, default=200)
+  parser.add_argument("--purge-batches", type=int, default=5)
+  args = parser.parse_args()
+  print(json.dumps(asyncio.run(benchmark(args.tokens, args.refreshes, args.purge_batches)), indent=2))
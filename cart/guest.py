@@ -0,0 +1,123 @@
+"""Carts for shoppers who have not logged in.
+
+A guest cart is just {product_id: quantity}. It never touches MySQL: it lives either
+inside the signed `guest_cart` cookie itself ("cookie") or in a per-process TTL store
+keyed by a random id that the cookie carries ("memory"). Stock is not held for guests;
+it is checked when the cart is merged into cart_items on login.
+"""
+import secrets
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from decouple import config
+from fastapi import Request, Response
+from jose import jwt, JWTError
+from account.utils import JWT_SECRET_KEY, JWT_ALGORITHM
+
+GUEST_CART_STORE = config("GUEST_CART_STORE", default="cookie")
+GUEST_CART_TTL_SEC = config("GUEST_CART_TTL_SEC", default=60*60*24*7, cast=int)
+GUEST_CART_MAX_ITEMS = config("GUEST_CART_MAX_ITEMS", default=50, cast=int)
+GUEST_CART_STORE_SIZE = config("GUEST_CART_STORE_SIZE", default=100_000, cast=int)
+
+GUEST_CART_COOKIE = "guest_cart"
+
+
+class GuestCartStore(ABC):
+  @abstractmethod
+  async def load(self, token: str | None) -> dict[int, int]:
+    """Items of the cart behind a cookie value, {} if it is missing, expired or forged."""
+
+  @abstractmethod
+  async def save(self, token: str | None, items: dict[int, int]) -> str:
+    """Store items and return the cookie value to send back."""
+
+  async def clear(self, token: str | None) -> None:
+    pass
+
+
+class CookieGuestCartStore(GuestCartStore):
+  # the whole cart rides in a signed JWT, nothing is kept server side
+  async def load(self, token):
+    if not token:
+      return {}
+    try:
+      payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=JWT_ALGORITHM)
+    except JWTError:
+      return {}
+    if payload.get("type") != "guest_cart":
+      return {}
+    return {int(pid): int(qty) for pid, qty in payload.get("items", {}).items()}
+
+  async def save(self, token, items):
+    payload = {
+      "type": "guest_cart",
+      "items": {str(pid): qty for pid, qty in items.items()},
+      "exp": datetime.now(timezone.utc) + timedelta(seconds=GUEST_CART_TTL_SEC),
+    }
+    return jwt.encode(payload, JWT_SECRET_KEY, JWT_ALGORITHM)
+
+
+class MemoryGuestCartStore(GuestCartStore):
+  # carts keyed by an unguessable id; stand-in for a shared KV store such as Redis
+  def __init__(self, ttl: int, maxsize: int):
+    self.ttl = ttl
+    self.maxsize = maxsize
+    self._carts: OrderedDict[str, tuple[float, dict[int, int]]] = OrderedDict()
+
+  async def load(self, token):
+    entry = self._carts.get(token) if token else None
+    if entry is None:
+      return {}
+
+    expires_at, items = entry
+    if expires_at < time.monotonic():
+      del self._carts[token]
+      return {}
+    return dict(items)
+
+  async def save(self, token, items):
+    if not token or token not in self._carts:
+      token = secrets.token_urlsafe(32)
+
+    self._carts[token] = (time.monotonic() + self.ttl, dict(items))
+    self._carts.move_to_end(token)
+    while len(self._carts) > self.maxsize:
+      self._carts.popitem(last=False)
+    return token
+
+  async def clear(self, token):
+    if token:
+      self._carts.pop(token, None)
+
+
+def get_guest_cart_store(name: str) -> GuestCartStore:
+  if name == "cookie":
+    return CookieGuestCartStore()
+  if name == "memory":
+    return MemoryGuestCartStore(ttl=GUEST_CART_TTL_SEC, maxsize=GUEST_CART_STORE_SIZE)
+  raise ValueError(f"Unknown GUEST_CART_STORE {name!r}, expected 'cookie' or 'memory'")
+
+
+guest_cart_store = get_guest_cart_store(GUEST_CART_STORE)
+
+
+async def load_guest_cart(request: Request) -> dict[int, int]:
+  return await guest_cart_store.load(request.cookies.get(GUEST_CART_COOKIE))
+
+
+async def save_guest_cart(request: Request, response: Response, items: dict[int, int]) -> None:
+  token = await guest_cart_store.save(request.cookies.get(GUEST_CART_COOKIE), items)
+  response.set_cookie(
+    key=GUEST_CART_COOKIE,
+    value=token,
+    httponly=True,
+    secure=True,
+    samesite="lax",
+    max_age=GUEST_CART_TTL_SEC
+  )
+
+
+async def clear_guest_cart(request: Request, response: Response) -> None:
+  await guest_cart_store.clear(request.cookies.get(GUEST_CART_COOKIE))
+  response.delete_cookie(GUEST_CART_COOKIE)
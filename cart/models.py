@@ -1,6 +1,6 @@
 from __future__ import annotations
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import Float, Integer, ForeignKey
+from sqlalchemy import Float, Integer, ForeignKey, UniqueConstraint
 from db.base import Base
 
 from typing import TYPE_CHECKING
@@ -21,3 +21,8 @@ class CartItem(Base):
     # Use string-based relationships
     user: Mapped["User"] = relationship("User", back_populates="cart_items")
     product: Mapped["Product"] = relationship("Product", back_populates="cart_items")
+
+    # one row per product in a cart, so bulk writes can upsert on it
+    __table_args__ = (
+        UniqueConstraint("user_id", "product_id", name="uq_cart_items_user_product"),
+    )
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from account.dependency import get_current_user
-from account.models import User
+from account.cache import AuthUser
 from db.config import session
+from db.replicas import read_session
 from . import schemas as sc
 from . import services as ss
+from .guest import load_guest_cart, save_guest_cart
 from typing import Union
 
 router = APIRouter()
@@ -12,24 +14,63 @@ router = APIRouter()
 async def add_item_to_cart(
   session: session, 
   item: sc.CartItemCreate,
-  user: User = Depends(get_current_user)
+  user: AuthUser = Depends(get_current_user)
 ): 
   return await ss.add_to_cart(session=session, user_id=user.id, data=item)
 
 
+@router.post('/batch', response_model=sc.CartSummary)
+async def batch_update_cart(
+  session: session, 
+  batch: sc.CartBatch,
+  user: AuthUser = Depends(get_current_user)
+): 
+  return await ss.apply_cart_batch(session=session, user_id=user.id, ops=batch.items)
+
+
+@router.get('/guest', response_model=sc.GuestCartSummary)
+async def guest_cart(
+  session: read_session, 
+  request: Request
+): 
+  items = await load_guest_cart(request)
+  return await ss.guest_cart_summary(session, items)
+
+
+@router.post('/guest/batch', response_model=sc.GuestCartSummary)
+async def batch_update_guest_cart(
+  session: read_session, 
+  batch: sc.CartBatch,
+  request: Request,
+  response: Response
+): 
+  # no login and no writes: the cart goes back in the guest_cart cookie / store
+  items = await ss.apply_guest_cart_batch(session, await load_guest_cart(request), batch.items)
+  await save_guest_cart(request, response, items)
+  return await ss.guest_cart_summary(session, items)
+
+
 @router.get("", response_model=sc.CartSummary)
 async def list_user_cart_items(
-  session: session, 
-  user: User = Depends(get_current_user)
+  session: read_session, 
+  user: AuthUser = Depends(get_current_user)
   ): 
   return await ss.list_user_cart(session, user.id)
 
 
+@router.get("/summary", response_model=sc.CartBadge)
+async def user_cart_badge(
+  session: read_session, 
+  user: AuthUser = Depends(get_current_user)
+  ): 
+  return await ss.get_cart_badge(session, user.id)
+
+
 @router.patch("/increase/{product_id}", response_model=sc.CartItemOut)
 async def increase_product_quantity(
   product_id: int, 
   session: session, 
-  user: User = Depends(get_current_user)
+  user: AuthUser = Depends(get_current_user)
   ): 
   return await ss.change_cart_item_qunatity_by_product(session, user.id, product_id, delta=1)
 
@@ -39,7 +80,7 @@ async def increase_product_quantity(
 async def decrease_product_quantity(
   product_id: int, 
   session: session, 
-  user: User = Depends(get_current_user)
+  user: AuthUser = Depends(get_current_user)
   ): 
   return await ss.change_cart_item_qunatity_by_product(session, user.id, product_id, delta=-1)
 
@@ -49,7 +90,7 @@ async def decrease_product_quantity(
 async def cart_item_delete(
   session: session, 
   item_id: int, 
-  user: User = Depends(get_current_user)
+  user: AuthUser = Depends(get_current_user)
   ): 
 
-  return await ss.delete_user_cart_item(session, item_id)
\ No newline at end of file
+  return await ss.delete_user_cart_item(session, user.id, item_id)
\ No newline at end of file
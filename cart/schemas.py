@@ -1,8 +1,9 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 class CartItemBase(BaseModel):
   product_id: int 
-  quantity: int 
+  # adds to the line; lowering or removing goes through the batch endpoint
+  quantity: int = Field(gt=0)
 
 class CartItemCreate(CartItemBase): 
   price: float | None = None 
@@ -24,4 +25,39 @@ class CartSummary(BaseModel):
   total_quantity: int 
   total_price: float
 
-  
\ No newline at end of file
+
+class CartBadge(BaseModel): 
+  item_count: int 
+  total_quantity: int 
+  total_price: float
+
+
+class CartBatchOp(BaseModel): 
+  # either set the quantity outright or move it by delta; 0 / a negative result removes the item
+  product_id: int 
+  quantity: int | None = Field(default=None, ge=0)
+  delta: int | None = None
+
+  @model_validator(mode="after")
+  def one_of_quantity_or_delta(self): 
+    if (self.quantity is None) == (self.delta is None): 
+      raise ValueError("Give exactly one of quantity or delta")
+    return self
+
+
+class CartBatch(BaseModel): 
+  items: list[CartBatchOp] = Field(min_length=1, max_length=100)
+
+
+class GuestCartItemOut(BaseModel): 
+  product_id: int
+  product_title: str
+  quantity: int 
+  price: float
+  total: float
+
+
+class GuestCartSummary(BaseModel): 
+  items: list[GuestCartItemOut]
+  total_quantity: int 
+  total_price: float
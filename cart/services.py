@@ -1,10 +1,24 @@
+import logging
 from fastapi import status, HTTPException
-from sqlalchemy  import select
+from sqlalchemy  import select, func, delete
+from sqlalchemy.dialects.mysql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from cart.models import CartItem
 from product.models import Product
+from inventory.services import InsufficientStock, release_stock, reserve_stock_many, release_stock_many
 from . import schemas as sc
-from sqlalchemy.orm import selectinload
+from .guest import GUEST_CART_MAX_ITEMS
+
+logger = logging.getLogger(__name__)
+
+
+async def _hold_stock(session: AsyncSession, user_id: int, quantities: dict[int, int]) -> None: 
+  # the inventory functions leave the rollback to us, so nothing of this request is kept
+  try: 
+    await reserve_stock_many(session, user_id, quantities)
+  except InsufficientStock: 
+    await session.rollback()
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient stock")
 
 async def add_to_cart(
     session: AsyncSession, 
@@ -16,8 +30,8 @@ async def add_to_cart(
   if not product: 
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
   
-  if product.stock_quantity < data.quantity: 
-    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient stock")
+  # hold the stock now, so checkout can't fail on it while the hold lasts
+  await _hold_stock(session, user_id, {product.id: data.quantity})
   
   stmt = select(CartItem).where(CartItem.user_id == user_id, CartItem.product_id == data.product_id)
   result = await session.execute(stmt)
@@ -55,40 +69,132 @@ async def list_user_cart(
     user_id: int
   ) -> sc.CartSummary: 
 
-  stmt = select(CartItem).where(CartItem.user_id==user_id).options(selectinload(CartItem.product))
+  # one joined query; items whose product was deleted are skipped by the inner join
+  stmt = (
+    select(CartItem.id, CartItem.product_id, CartItem.quantity, CartItem.price, Product.title)
+    .join(Product, Product.id == CartItem.product_id)
+    .where(CartItem.user_id == user_id)
+    .order_by(CartItem.id)
+  )
   result = await session.execute(stmt)
-  cart_items = result.scalars().all()
 
   cart_data: list[sc.CartItemOut] = []
   total_quantity = 0
   total_price = 0.0
 
-  for item in cart_items: 
-    if not item.product: 
-      continue 
-
-    price = item.price 
-    quantity = item.quantity
-    total = price * quantity
+  for row in result: 
+    total = row.price * row.quantity
     total_price += total
-    total_quantity += quantity 
+    total_quantity += row.quantity 
 
     cart_data.append(sc.CartItemOut(
-      id=item.id,
-      product_id=item.product_id, 
-      product_title = item.product.title,
-      quantity=quantity,
-      price=price,
-      total=total 
+      id=row.id,
+      product_id=row.product_id, 
+      product_title = row.title,
+      quantity=row.quantity,
+      price=row.price,
+      total=round(total, 2)
     ))
 
-    return sc.CartSummary(
-      items=cart_data,
-      total_quantity=total_quantity,
-      total_price=total_price
+  return sc.CartSummary(
+    items=cart_data,
+    total_quantity=total_quantity,
+    total_price=round(total_price, 2)
+  )
+
+
+async def get_cart_badge(
+    session: AsyncSession,
+    user_id: int
+  ) -> sc.CartBadge: 
+
+  # aggregated in the database, nothing per item comes back
+  stmt = (
+    select(
+      func.count(CartItem.id).label("item_count"),
+      func.coalesce(func.sum(CartItem.quantity), 0).label("total_quantity"),
+      func.coalesce(func.sum(CartItem.quantity * CartItem.price), 0).label("total_price")
     )
+    .join(Product, Product.id == CartItem.product_id)
+    .where(CartItem.user_id == user_id)
+  )
+  row = (await session.execute(stmt)).one()
+  return sc.CartBadge(
+    item_count=row.item_count,
+    total_quantity=row.total_quantity,
+    total_price=round(float(row.total_price), 2)
+  )
   
 
+async def apply_cart_batch(
+    session: AsyncSession, 
+    user_id: int, 
+    ops: list[sc.CartBatchOp],
+    strict: bool = True
+  ) -> sc.CartSummary: 
+  # strict=False (guest cart merge) drops unknown products and trims to the stock left
+  # instead of rejecting the whole batch
+
+  product_ids = {op.product_id for op in ops}
+
+  # one IN query for every product touched by the batch
+  stmt = select(Product.id, Product.price, Product.stock_quantity).where(Product.id.in_(product_ids))
+  products = {row.id: row for row in await session.execute(stmt)}
+
+  missing = product_ids - products.keys()
+  if missing and strict: 
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Products not found: {sorted(missing)}")
+  if missing: 
+    ops = [op for op in ops if op.product_id in products]
+    product_ids -= missing
+    if not ops: 
+      return await list_user_cart(session, user_id)
+
+  stmt = (
+    select(CartItem.product_id, CartItem.quantity)
+    .where(CartItem.user_id == user_id, CartItem.product_id.in_(product_ids))
+    .with_for_update()
+  )
+  current = {row.product_id: row.quantity for row in await session.execute(stmt)}
+
+  # ops run in order, so [{quantity: 2}, {delta: 1}] ends at 3
+  target = {pid: current.get(pid, 0) for pid in product_ids}
+  for op in ops: 
+    quantity = op.quantity if op.quantity is not None else target[op.product_id] + op.delta
+    target[op.product_id] = max(quantity, 0)
+
+  changes = {pid: target[pid] - current.get(pid, 0) for pid in product_ids}
+  extra = {pid: change for pid, change in changes.items() if change > 0}
+
+  short = sorted(pid for pid, change in extra.items() if change > products[pid].stock_quantity)
+  if short and strict: 
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Insufficient stock for products: {short}")
+  for pid in short: 
+    extra[pid] = products[pid].stock_quantity
+    target[pid] = current.get(pid, 0) + extra[pid]
+    changes[pid] = extra[pid]
+
+  # the conditional UPDATE in reserve_stock_many still guards against a concurrent buyer
+  await _hold_stock(session, user_id, extra)
+  await release_stock_many(session, user_id, {pid: -change for pid, change in changes.items() if change < 0})
+
+  rows = [
+    {"user_id": user_id, "product_id": pid, "quantity": quantity, "price": products[pid].price}
+    for pid, quantity in target.items() if quantity > 0
+  ]
+  if rows: 
+    stmt = insert(CartItem).values(rows)
+    stmt = stmt.on_duplicate_key_update(quantity=stmt.inserted.quantity, price=stmt.inserted.price)
+    await session.execute(stmt)
+
+  removed = [pid for pid, quantity in target.items() if quantity == 0 and pid in current]
+  if removed: 
+    await session.execute(delete(CartItem).where(CartItem.user_id == user_id, CartItem.product_id.in_(removed)))
+
+  await session.commit()
+  return await list_user_cart(session, user_id)
+
+
 async def change_cart_item_qunatity_by_product(
     session: AsyncSession, 
     user_id: int, 
@@ -109,8 +215,7 @@ async def change_cart_item_qunatity_by_product(
     if delta < 0: 
       raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Item not in cart")
 
-    if product.stock_quantity <1: 
-      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient stock")  
+    await _hold_stock(session, user_id, {product_id: 1})
     
     # creating an object
     item = CartItem(
@@ -127,13 +232,16 @@ async def change_cart_item_qunatity_by_product(
   else:
     new_quantity = item.quantity + delta
     if new_quantity <= 0: # if minus happened
+      await release_stock(session, user_id, product_id, item.quantity)
       await session.delete(item)
       await session.commit()
       return  {"message": "Item removed"}
 
-    # if we don't have products, then raise error
-    if product.stock_quantity < new_quantity: 
-      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient stock") 
+    # raises if we don't have products for the extra quantity
+    if delta > 0: 
+      await _hold_stock(session, user_id, {product_id: delta})
+    else: 
+      await release_stock(session, user_id, product_id, -delta)
     
 
     item.quantity = new_quantity
@@ -156,15 +264,102 @@ async def change_cart_item_qunatity_by_product(
 
 async def delete_user_cart_item(
     session: AsyncSession, 
+    user_id: int, 
     cart_item_id: int
   ): 
 
-  item = await session.get(CartItem, cart_item_id)
+  # another user's item is "not found" too, deleting it would free their stock hold
+  stmt = select(CartItem).where(CartItem.id == cart_item_id, CartItem.user_id == user_id)
+  item = (await session.execute(stmt)).scalar_one_or_none()
   if not item: 
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="item not found")
 
+  if item.product_id: 
+    await release_stock(session, user_id, item.product_id, item.quantity)
   await session.delete(item)
   await session.commit()
   return item
 
-  
\ No newline at end of file
+
+async def apply_guest_cart_batch(
+    session: AsyncSession, 
+    items: dict[int, int], 
+    ops: list[sc.CartBatchOp]
+  ) -> dict[int, int]: 
+  # same rules as apply_cart_batch, but only reads: guest carts hold no stock
+  product_ids = {op.product_id for op in ops}
+
+  stmt = select(Product.id, Product.stock_quantity).where(Product.id.in_(product_ids))
+  stock = {row.id: row.stock_quantity for row in await session.execute(stmt)}
+
+  missing = product_ids - stock.keys()
+  if missing: 
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Products not found: {sorted(missing)}")
+
+  items = dict(items)
+  for op in ops: 
+    quantity = op.quantity if op.quantity is not None else items.get(op.product_id, 0) + op.delta
+    items[op.product_id] = max(quantity, 0)
+
+  short = sorted(pid for pid in product_ids if items[pid] > stock[pid])
+  if short: 
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Insufficient stock for products: {short}")
+
+  items = {pid: quantity for pid, quantity in items.items() if quantity > 0}
+  if len(items) > GUEST_CART_MAX_ITEMS: 
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Guest cart is limited to {GUEST_CART_MAX_ITEMS} products")
+  return items
+
+
+async def guest_cart_summary(
+    session: AsyncSession, 
+    items: dict[int, int]
+  ) -> sc.GuestCartSummary: 
+
+  cart_data: list[sc.GuestCartItemOut] = []
+  total_quantity = 0
+  total_price = 0.0
+
+  if items: 
+    stmt = select(Product.id, Product.title, Product.price).where(Product.id.in_(items)).order_by(Product.id)
+    # products deleted since they were added simply drop out
+    for row in await session.execute(stmt): 
+      quantity = items[row.id]
+      total = row.price * quantity
+      total_price += total
+      total_quantity += quantity
+
+      cart_data.append(sc.GuestCartItemOut(
+        product_id=row.id,
+        product_title=row.title,
+        quantity=quantity,
+        price=row.price,
+        total=round(total, 2)
+      ))
+
+  return sc.GuestCartSummary(
+    items=cart_data,
+    total_quantity=total_quantity,
+    total_price=round(total_price, 2)
+  )
+
+
+async def merge_guest_cart(
+    session: AsyncSession, 
+    user_id: int, 
+    items: dict[int, int]
+  ) -> bool: 
+  # guest quantities are added on top of what the user already has, in one batch;
+  # False means nothing was merged and the guest cart should be kept
+  if not items: 
+    return True
+
+  ops = [sc.CartBatchOp(product_id=pid, delta=quantity) for pid, quantity in items.items()]
+  try: 
+    await apply_cart_batch(session, user_id, ops, strict=False)
+  except HTTPException: 
+    # stock ran out between the check and the hold; logging in must still work
+    await session.rollback()
+    logger.warning("merging guest cart for user %s failed", user_id, exc_info=True)
+    return False
+  return True
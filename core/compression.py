@@ -0,0 +1,127 @@
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try: 
+  import brotli
+except ImportError: 
+  brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/", "application/javascript", "image/svg+xml")
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None: 
+  accepted = {}
+  for part in accept_encoding.split(","): 
+    coding, _, params = part.strip().partition(";")
+    quality = 1.0
+    params = params.strip()
+    if params.startswith("q="): 
+      try: 
+        quality = float(params[2:])
+      except ValueError: 
+        quality = 0.0
+    accepted[coding.strip().lower()] = quality
+
+  if brotli is not None and accepted.get("br", 0) > 0: 
+    return "br"
+  if accepted.get("gzip", 0) > 0: 
+    return "gzip"
+  return None
+
+
+class _Compressor: 
+  def __init__(self, encoding: str, gzip_level: int, brotli_quality: int): 
+    if encoding == "br": 
+      self._brotli = brotli.Compressor(quality=brotli_quality)
+    else: 
+      self._brotli = None
+      self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+  def chunk(self, data: bytes) -> bytes: 
+    # flushed per chunk so streamed responses reach the client as they are produced
+    if self._brotli is not None: 
+      return self._brotli.process(data) + self._brotli.flush()
+    return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+  def finish(self, data: bytes = b"") -> bytes: 
+    if self._brotli is not None: 
+      return self._brotli.process(data) + self._brotli.finish()
+    return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware: 
+  """gzip/brotli for JSON and text responses of at least `minimum_size` bytes, picked by Accept-Encoding."""
+
+  def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4): 
+    self.app = app
+    self.minimum_size = minimum_size
+    self.gzip_level = gzip_level
+    self.brotli_quality = brotli_quality
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None: 
+    if scope["type"] != "http": 
+      await self.app(scope, receive, send)
+      return
+
+    encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+    if encoding is None: 
+      await self.app(scope, receive, send)
+      return
+
+    start_message: Message | None = None
+    compressor: _Compressor | None = None
+    passthrough = False
+
+    async def send_wrapper(message: Message) -> None: 
+      nonlocal start_message, compressor, passthrough
+
+      if message["type"] == "http.response.start": 
+        headers = Headers(raw=message["headers"])
+        content_type = headers.get("content-type", "")
+        if (
+          "content-encoding" in headers
+          or message["status"] in (204, 206, 304)
+          or not content_type.startswith(COMPRESSIBLE_TYPES)
+        ): 
+          passthrough = True
+          await send(message)
+        else: 
+          # hold the headers until the first body chunk shows whether compressing pays off
+          start_message = message
+        return
+
+      if passthrough or message["type"] != "http.response.body": 
+        await send(message)
+        return
+
+      body = message.get("body", b"")
+      more_body = message.get("more_body", False)
+
+      if start_message is not None: 
+        headers = MutableHeaders(raw=start_message["headers"])
+        if not more_body and len(body) < self.minimum_size: 
+          passthrough = True
+          await send(start_message)
+          await send(message)
+          return
+
+        compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+        headers["content-encoding"] = encoding
+        headers.add_vary_header("Accept-Encoding")
+        if more_body: 
+          del headers["content-length"]
+          body = compressor.chunk(body)
+        else: 
+          body = compressor.finish(body)
+          headers["content-length"] = str(len(body))
+
+        await send(start_message)
+        start_message = None
+        await send({"type": "http.response.body", "body": body, "more_body": more_body})
+        return
+
+      body = compressor.chunk(body) if more_body else compressor.finish(body)
+      await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    await self.app(scope, receive, send_wrapper)
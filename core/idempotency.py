@@ -0,0 +1,283 @@
+"""Idempotency-Key support for endpoints that must not run twice, e.g. checkout.
+
+The first request with a key claims it and runs; its JSON response is stored under the
+key. Retries with the same key and body get that response back without running again,
+and duplicates that arrive while the first attempt is still running wait for it (up to
+IDEMPOTENCY_WAIT_SEC) instead of starting a second one. An attempt whose handler raised
+releases the key so the client can retry; once the handler has succeeded the key stays
+claimed, even if storing its response fails, so its work is never run a second time.
+
+Keys live in the idempotency_keys table ("db", shared by all workers) or in process
+memory ("memory", single worker / local runs), picked with IDEMPOTENCY_STORE. Expired
+rows of the table are deleted in batches by run_idempotency_key_purge().
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable
+from decouple import config
+from fastapi import HTTPException, status
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.config import async_session
+from core.models import IdempotencyKey, IdempotencyStatusEnum
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_STORE = config("IDEMPOTENCY_STORE", default="db")
+# how long a completed response is replayed
+IDEMPOTENCY_TTL_SEC = config("IDEMPOTENCY_TTL_SEC", default=60*60*24, cast=int)
+# how long a duplicate waits for the first attempt before giving up with 409
+IDEMPOTENCY_WAIT_SEC = config("IDEMPOTENCY_WAIT_SEC", default=10, cast=float)
+IDEMPOTENCY_POLL_SEC = config("IDEMPOTENCY_POLL_SEC", default=0.1, cast=float)
+# an attempt still in progress after this long is treated as crashed and can be taken over
+IDEMPOTENCY_LOCK_TIMEOUT_SEC = config("IDEMPOTENCY_LOCK_TIMEOUT_SEC", default=120, cast=int)
+# tries at storing a response after the handler succeeded
+IDEMPOTENCY_COMPLETE_ATTEMPTS = config("IDEMPOTENCY_COMPLETE_ATTEMPTS", default=3, cast=int)
+IDEMPOTENCY_PURGE_INTERVAL_SEC = config("IDEMPOTENCY_PURGE_INTERVAL_SEC", default=3600, cast=int)
+IDEMPOTENCY_PURGE_BATCH_SIZE = config("IDEMPOTENCY_PURGE_BATCH_SIZE", default=1000, cast=int)
+
+CLAIMED = "claimed"
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+
+def fingerprint(body: str | bytes) -> str:
+  if isinstance(body, str):
+    body = body.encode()
+  return hashlib.sha256(body).hexdigest()
+
+
+def _mismatch() -> HTTPException:
+  return HTTPException(
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    detail="Idempotency-Key was already used with a different request"
+  )
+
+
+class IdempotencyStore(ABC):
+  @abstractmethod
+  async def try_claim(self, scope: str, key: str, fingerprint: str) -> tuple[str, Any]:
+    """Return (CLAIMED, None), (IN_PROGRESS, None) or (COMPLETED, stored response)."""
+
+  @abstractmethod
+  async def complete(self, scope: str, key: str, response: Any) -> None: ...
+
+  @abstractmethod
+  async def release(self, scope: str, key: str) -> None: ...
+
+
+class SqlIdempotencyStore(IdempotencyStore):
+  # every call commits on its own short session, so the claim is visible to other workers at once
+  async def try_claim(self, scope, key, fingerprint):
+    now = datetime.now(timezone.utc)
+    lock_expires_at = now + timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT_SEC)
+    async with async_session() as session:
+      session.add(IdempotencyKey(scope=scope, key=key, fingerprint=fingerprint, expires_at=lock_expires_at))
+      try:
+        await session.commit()
+        return CLAIMED, None
+      except IntegrityError:
+        await session.rollback()
+
+      # take the key over if its response has expired or its attempt looks crashed
+      stmt = (
+        update(IdempotencyKey)
+        .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key, IdempotencyKey.expires_at < now)
+        .values(
+          status=IdempotencyStatusEnum.in_progress, fingerprint=fingerprint, response=None,
+          created_at=now, updated_at=now, expires_at=lock_expires_at
+        )
+        .execution_options(synchronize_session=False)
+      )
+      result = await session.execute(stmt)
+      await session.commit()
+      if result.rowcount == 1:
+        return CLAIMED, None
+
+      stmt = select(IdempotencyKey).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+      record = (await session.execute(stmt)).scalar_one_or_none()
+
+    # released between our insert and select: the next attempt can claim it
+    if record is None:
+      return IN_PROGRESS, None
+    if record.fingerprint != fingerprint:
+      raise _mismatch()
+    if record.status == IdempotencyStatusEnum.completed:
+      return COMPLETED, record.response
+    return IN_PROGRESS, None
+
+  async def complete(self, scope, key, response):
+    async with async_session() as session:
+      await session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+        .values(
+          status=IdempotencyStatusEnum.completed, response=response,
+          expires_at=datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_TTL_SEC)
+        )
+        .execution_options(synchronize_session=False)
+      )
+      await session.commit()
+
+  async def release(self, scope, key):
+    async with async_session() as session:
+      await session.execute(
+        delete(IdempotencyKey)
+        .where(
+          IdempotencyKey.scope == scope,
+          IdempotencyKey.key == key,
+          IdempotencyKey.status == IdempotencyStatusEnum.in_progress
+        )
+        .execution_options(synchronize_session=False)
+      )
+      await session.commit()
+
+
+async def purge_idempotency_keys(session: AsyncSession, batch_size: int = IDEMPOTENCY_PURGE_BATCH_SIZE) -> int:
+  # small batches on the expires_at index, like the refresh token purge
+  stmt = (
+    select(IdempotencyKey.id)
+    .where(IdempotencyKey.expires_at < datetime.now(timezone.utc))
+    .order_by(IdempotencyKey.expires_at)
+    .limit(batch_size)
+  )
+  ids = list((await session.execute(stmt)).scalars().all())
+  if not ids:
+    await session.rollback()
+    return 0
+
+  await session.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(ids)))
+  await session.commit()
+  return len(ids)
+
+
+async def run_idempotency_key_purge(
+    interval: int = IDEMPOTENCY_PURGE_INTERVAL_SEC,
+    batch_size: int = IDEMPOTENCY_PURGE_BATCH_SIZE
+) -> None:
+  while True:
+    try:
+      async with async_session() as session:
+        while await purge_idempotency_keys(session, batch_size) == batch_size:
+          pass
+    except asyncio.CancelledError:
+      raise
+    except Exception:
+      logger.exception("purging expired idempotency keys failed")
+
+    await asyncio.sleep(interval)
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+  def __init__(self):
+    # (scope, key) -> [status, fingerprint, response, expires_at]
+    self._records: dict[tuple[str, str], list] = {}
+
+  async def try_claim(self, scope, key, fingerprint):
+    now = time.monotonic()
+    record = self._records.get((scope, key))
+    if record is None or record[3] < now:
+      self._records[(scope, key)] = [IN_PROGRESS, fingerprint, None, now + IDEMPOTENCY_LOCK_TIMEOUT_SEC]
+      return CLAIMED, None
+
+    if record[1] != fingerprint:
+      raise _mismatch()
+    return record[0], record[2]
+
+  async def complete(self, scope, key, response):
+    record = self._records.get((scope, key))
+    if record is not None:
+      record[0], record[2], record[3] = COMPLETED, response, time.monotonic() + IDEMPOTENCY_TTL_SEC
+
+    # drop expired keys now and then so the dict does not grow forever
+    now = time.monotonic()
+    for stale in [k for k, r in self._records.items() if r[3] < now]:
+      del self._records[stale]
+
+  async def release(self, scope, key):
+    record = self._records.get((scope, key))
+    if record is not None and record[0] == IN_PROGRESS:
+      del self._records[(scope, key)]
+
+
+def get_idempotency_store(name: str) -> IdempotencyStore:
+  if name == "db":
+    return SqlIdempotencyStore()
+  if name == "memory":
+    return MemoryIdempotencyStore()
+  raise ValueError(f"Unknown IDEMPOTENCY_STORE {name!r}, expected 'db' or 'memory'")
+
+
+idempotency_store = get_idempotency_store(IDEMPOTENCY_STORE)
+
+async def _store_response(store: IdempotencyStore, scope: str, key: str, response: Any) -> None:
+  for attempt in range(1, IDEMPOTENCY_COMPLETE_ATTEMPTS + 1):
+    try:
+      await store.complete(scope, key, response)
+      return
+    except Exception:
+      if attempt == IDEMPOTENCY_COMPLETE_ATTEMPTS:
+        # the claim stays until IDEMPOTENCY_LOCK_TIMEOUT_SEC; retries get 409 meanwhile
+        logger.exception("storing the response of idempotency key %s/%s failed", scope, key)
+        return
+      await asyncio.sleep(IDEMPOTENCY_POLL_SEC * 2 ** (attempt - 1))
+
+
+# attempts running in this process, so local duplicates wake up as soon as they finish
+_running: dict[tuple[str, str], asyncio.Event] = {}
+
+
+async def run_idempotent(
+    scope: str,
+    key: str,
+    fingerprint: str,
+    handler: Callable[[], Awaitable[Any]],
+    store: IdempotencyStore | None = None
+) -> Any:
+  """Run handler once per (scope, key) and return its JSON-ready result, replaying it for retries."""
+  store = store or idempotency_store
+  deadline = time.monotonic() + IDEMPOTENCY_WAIT_SEC
+
+  while True:
+    state, response = await store.try_claim(scope, key, fingerprint)
+    if state == COMPLETED:
+      return response
+    if state == CLAIMED:
+      break
+
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+      raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is still being processed"
+      )
+
+    event = _running.get((scope, key))
+    try:
+      if event is not None:
+        await asyncio.wait_for(event.wait(), timeout=min(remaining, IDEMPOTENCY_POLL_SEC * 10))
+      else:
+        await asyncio.sleep(min(remaining, IDEMPOTENCY_POLL_SEC))
+    except asyncio.TimeoutError:
+      pass
+
+  event = _running[(scope, key)] = asyncio.Event()
+  try:
+    try:
+      response = await handler()
+    except BaseException:
+      # the handler did not finish, so a retry runs it again
+      await asyncio.shield(store.release(scope, key))
+      raise
+    # its work is committed: never release from here on, even if this task is cancelled
+    await asyncio.shield(_store_response(store, scope, key, response))
+  finally:
+    event.set()
+    _running.pop((scope, key), None)
+
+  return response
@@ -0,0 +1,145 @@
+"""Prometheus metrics in the text exposition format, without a client library.
+
+MetricsMiddleware records a latency histogram per (method, route template, status) and
+the number of requests in flight; it does a dict lookup and a bisect per request and
+nothing else. Everything owned by other subsystems (pools, caches, queues) is read only
+when /metrics is scraped, through collectors registered with register_collector().
+"""
+import bisect
+import time
+from typing import Callable
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+  return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+  if not labels:
+    return ""
+  return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Counter:
+  def __init__(self, name: str, help: str):
+    self.name = name
+    self.help = help
+    self._values: dict[tuple, float] = {}
+
+  def inc(self, amount: float = 1, **labels) -> None:
+    key = tuple(sorted(labels.items()))
+    self._values[key] = self._values.get(key, 0) + amount
+
+  def render(self) -> list[str]:
+    lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+    for key, value in self._values.items():
+      lines.append(f"{self.name}_total{_labels(dict(key))} {value}")
+    return lines
+
+
+class Histogram:
+  def __init__(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+    self.name = name
+    self.help = help
+    self.buckets = buckets
+    # labels -> [per-bucket counts (+Inf last), sum, count]
+    self._series: dict[tuple, list] = {}
+
+  def observe(self, value: float, labels: tuple) -> None:
+    series = self._series.get(labels)
+    if series is None:
+      series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+    series[0][bisect.bisect_left(self.buckets, value)] += 1
+    series[1] += value
+    series[2] += 1
+
+  def render(self, label_names: tuple[str, ...]) -> list[str]:
+    lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+    for key, (counts, total, count) in self._series.items():
+      labels = dict(zip(label_names, key))
+      cumulative = 0
+      for bound, n in zip((*self.buckets, "+Inf"), counts):
+        cumulative += n
+        lines.append(f"{self.name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+      lines.append(f"{self.name}_sum{_labels(labels)} {total}")
+      lines.append(f"{self.name}_count{_labels(labels)} {count}")
+    return lines
+
+
+http_request_duration = Histogram("http_request_duration_seconds", "Request latency by route template and status")
+http_in_flight = 0
+
+checkout_outcomes = Counter("checkout_outcomes", "Checkout attempts by outcome")
+
+_collectors: list[Callable[[], list[str]]] = []
+
+
+def register_collector(collector: Callable[[], list[str]]) -> None:
+  _collectors.append(collector)
+
+
+def gauges(prefix: str, values: dict, label: str | None = None) -> list[str]:
+  """Lines for a metrics dict, or a {label value: metrics dict} mapping when label is given."""
+  lines = []
+  groups = values.items() if label else [(None, values)]
+  for label_value, metrics in groups:
+    labels = {label: label_value} if label else {}
+    for metric, value in metrics.items():
+      if isinstance(value, bool) or not isinstance(value, (int, float)):
+        continue
+      lines.append(f"{prefix}_{metric}{_labels(labels)} {value}")
+  return lines
+
+
+def render() -> str:
+  lines = http_request_duration.render(("method", "route", "status"))
+  lines += ["# TYPE http_requests_in_flight gauge", f"http_requests_in_flight {http_in_flight}"]
+  lines += checkout_outcomes.render()
+  for collector in _collectors:
+    lines += collector()
+  return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+  def __init__(self, app: ASGIApp):
+    self.app = app
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    global http_in_flight
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    status_code = 500
+
+    async def send_wrapper(message: Message) -> None:
+      nonlocal status_code
+      if message["type"] == "http.response.start":
+        status_code = message["status"]
+      await send(message)
+
+    http_in_flight += 1
+    started_at = time.perf_counter()
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      http_in_flight -= 1
+      # the route template keeps the label set bounded, unmatched paths share one series
+      route = scope.get("route")
+      template = getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+      http_request_duration.observe(time.perf_counter() - started_at, (scope["method"], template, status_code))
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+  return PlainTextResponse(render(), media_type=CONTENT_TYPE)
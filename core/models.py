@@ -0,0 +1,33 @@
+from __future__ import annotations
+import enum
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import DateTime, Enum, Index, JSON, String, UniqueConstraint
+from datetime import datetime, timezone
+from db.base import Base
+
+
+class IdempotencyStatusEnum(str, enum.Enum):
+    in_progress = "in_progress"
+    completed = "completed"
+
+
+class IdempotencyKey(Base):
+    # one row per (scope, Idempotency-Key): claimed when a request starts, holds its response once done
+    __tablename__ = "idempotency_keys"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    scope: Mapped[str] = mapped_column(String(100), nullable=False)
+    key: Mapped[str] = mapped_column(String(255), nullable=False)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    status: Mapped[IdempotencyStatusEnum] = mapped_column(Enum(IdempotencyStatusEnum), default=IdempotencyStatusEnum.in_progress, nullable=False)
+    response: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    # end of the lock while in progress, end of the replay window once completed;
+    # past it the key can be taken over, and the purge deletes it
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("scope", "key", name="uq_idempotency_keys_scope_key"),
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
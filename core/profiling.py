@@ -0,0 +1,286 @@
+"""Sampling profiler for production requests.
+
+Two ways in:
+
+  on demand    an admin sends `X-Profile: 1` (or `?profile=1`); that one request is
+               profiled and the report id comes back in X-Profile-Id, to be fetched from
+               GET /api/profiling/reports/{id}. With pyinstrument installed the report is
+               speedscope JSON, otherwise folded stacks from the built-in sampler.
+  background   with PROFILING_SAMPLER_INTERVAL_SEC > 0 a daemon thread samples the event
+               loop thread at that (low) rate and aggregates folded stacks per route,
+               served by GET /api/profiling/stacks.
+
+Folded stacks ("outer;inner;leaf count" per line) load straight into flamegraph.pl,
+speedscope or inferno. All requests share the event loop thread, so samples taken while
+profiling one request can include work of others running concurrently.
+"""
+import itertools
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from types import FrameType
+from decouple import config
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse, Response
+from starlette.datastructures import Headers, MutableHeaders, QueryParams
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from jose import JWTError
+from account.cache import AuthUser
+from account.dependency import require_admin
+from account.utils import decode_token
+
+try:
+  from pyinstrument import Profiler
+  from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:
+  Profiler = None
+
+PROFILING_ENABLED = config("PROFILING_ENABLED", default=True, cast=bool)
+# auto (pyinstrument when installed) | sampler
+PROFILING_BACKEND = config("PROFILING_BACKEND", default="auto")
+PROFILING_INTERVAL_MS = config("PROFILING_INTERVAL_MS", default=1.0, cast=float)
+PROFILING_MAX_REPORTS = config("PROFILING_MAX_REPORTS", default=50, cast=int)
+# 0 disables the background sampler; 0.05 is ~20 samples a second
+PROFILING_SAMPLER_INTERVAL_SEC = config("PROFILING_SAMPLER_INTERVAL_SEC", default=0.0, cast=float)
+PROFILING_MAX_STACKS_PER_ROUTE = config("PROFILING_MAX_STACKS_PER_ROUTE", default=2000, cast=int)
+
+
+def _frame_name(frame: FrameType) -> str:
+  code = frame.f_code
+  module = frame.f_globals.get("__name__", code.co_filename)
+  return f"{module}:{code.co_name}"
+
+
+def folded_stack(frame: FrameType | None, limit: int = 128) -> tuple[str, tuple]:
+  """The stack ending in frame as "outer;...;leaf", plus the code objects on it."""
+  names, codes = [], []
+  while frame is not None and len(names) < limit:
+    names.append(_frame_name(frame))
+    codes.append(frame.f_code)
+    frame = frame.f_back
+  names.reverse()
+  return ";".join(names), tuple(codes)
+
+
+def render_folded(stacks: Counter) -> str:
+  return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class StackSampler:
+  """Samples one thread's stack from a daemon thread until stopped."""
+
+  def __init__(self, thread_id: int, interval: float):
+    self.thread_id = thread_id
+    self.interval = interval
+    self.stacks: Counter[str] = Counter()
+    self._stop = threading.Event()
+    self._thread: threading.Thread | None = None
+
+  def sample(self) -> FrameType | None:
+    return sys._current_frames().get(self.thread_id)
+
+  def record(self, frame: FrameType) -> None:
+    stack, _ = folded_stack(frame)
+    self.stacks[stack] += 1
+
+  def _run(self) -> None:
+    while not self._stop.wait(self.interval):
+      frame = self.sample()
+      if frame is not None:
+        self.record(frame)
+
+  def start(self) -> None:
+    self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+    self._thread.start()
+
+  def stop(self) -> None:
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+
+
+class RouteSampler(StackSampler):
+  """Background sampler that files each stack under the route whose endpoint is on it."""
+
+  def __init__(self, thread_id: int, interval: float, max_stacks: int):
+    super().__init__(thread_id, interval)
+    self.max_stacks = max_stacks
+    self.endpoints: dict = {}
+    self.by_route: dict[str, Counter] = {}
+    self.samples = 0
+    # record() runs on the sampler thread, report() and reset() on the event loop
+    self._lock = threading.Lock()
+
+  def register_routes(self, routes) -> None:
+    for route in routes:
+      endpoint = getattr(route, "endpoint", None)
+      code = getattr(endpoint, "__code__", None)
+      if code is not None:
+        self.endpoints[code] = getattr(route, "path", endpoint.__name__)
+
+  def record(self, frame):
+    stack, codes = folded_stack(frame)
+    route = next((self.endpoints[code] for code in codes if code in self.endpoints), None)
+    # the loop waiting for I/O, or work outside any request
+    if route is None:
+      return
+
+    with self._lock:
+      self.samples += 1
+      stacks = self.by_route.setdefault(route, Counter())
+      if stack in stacks or len(stacks) < self.max_stacks:
+        stacks[stack] += 1
+
+  def report(self, route: str | None = None) -> str:
+    with self._lock:
+      if route is not None:
+        return render_folded(Counter(self.by_route.get(route, {})))
+      # every route, with the route as the root frame
+      merged: Counter[str] = Counter()
+      for name, stacks in self.by_route.items():
+        for stack, count in stacks.items():
+          merged[f"{name};{stack}"] += count
+    return render_folded(merged)
+
+  def reset(self) -> None:
+    with self._lock:
+      self.by_route.clear()
+      self.samples = 0
+
+
+class ReportStore:
+  # the last `maxsize` on-demand reports
+  def __init__(self, maxsize: int):
+    self.maxsize = maxsize
+    self._ids = itertools.count(1)
+    self._reports: OrderedDict[int, dict] = OrderedDict()
+
+  def next_id(self) -> int:
+    return next(self._ids)
+
+  def add(self, report_id: int, method: str, path: str, duration: float, report_format: str, body: str) -> None:
+    self._reports[report_id] = {
+      "id": report_id,
+      "method": method,
+      "path": path,
+      "duration_ms": round(duration * 1000, 3),
+      "format": report_format,
+      "body": body,
+    }
+    while len(self._reports) > self.maxsize:
+      self._reports.popitem(last=False)
+
+  def get(self, report_id: int) -> dict | None:
+    return self._reports.get(report_id)
+
+  def list(self) -> list[dict]:
+    return [{k: v for k, v in report.items() if k != "body"} for report in reversed(self._reports.values())]
+
+
+report_store = ReportStore(PROFILING_MAX_REPORTS)
+route_sampler: RouteSampler | None = None
+
+
+def wants_profile(scope: Scope) -> bool:
+  if Headers(scope=scope).get("x-profile") == "1":
+    return True
+  return QueryParams(scope.get("query_string", b"")).get("profile") == "1"
+
+
+def is_admin_request(scope: Scope) -> bool:
+  # only decides whether to profile; the signed claim is enough here because reading
+  # reports back goes through require_admin, which checks the user itself
+  token = cookie_parser(Headers(scope=scope).get("cookie", "")).get("access_token")
+  if not token:
+    return False
+  try:
+    return bool(decode_token(token).get("adm"))
+  except (HTTPException, JWTError):
+    return False
+
+
+class ProfilingMiddleware:
+  def __init__(self, app: ASGIApp, backend: str = PROFILING_BACKEND, interval_ms: float = PROFILING_INTERVAL_MS):
+    self.app = app
+    self.use_pyinstrument = Profiler is not None and backend == "auto"
+    self.interval = interval_ms / 1000
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope["type"] != "http" or not wants_profile(scope) or not is_admin_request(scope):
+      await self.app(scope, receive, send)
+      return
+
+    report_id = report_store.next_id()
+
+    async def send_wrapper(message: Message) -> None:
+      if message["type"] == "http.response.start":
+        MutableHeaders(scope=message)["X-Profile-Id"] = str(report_id)
+      await send(message)
+
+    started_at = time.perf_counter()
+    if self.use_pyinstrument:
+      profiler = Profiler(interval=self.interval, async_mode="enabled")
+      profiler.start()
+      try:
+        await self.app(scope, receive, send_wrapper)
+      finally:
+        profiler.stop()
+        report_format, body = "speedscope", profiler.output(SpeedscopeRenderer())
+    else:
+      sampler = StackSampler(threading.get_ident(), self.interval)
+      sampler.start()
+      try:
+        await self.app(scope, receive, send_wrapper)
+      finally:
+        sampler.stop()
+        report_format, body = "folded", render_folded(sampler.stacks)
+
+    report_store.add(report_id, scope["method"], scope["path"], time.perf_counter() - started_at, report_format, body)
+
+
+def start_route_sampler(routes) -> RouteSampler | None:
+  global route_sampler
+  if PROFILING_SAMPLER_INTERVAL_SEC <= 0:
+    return None
+  route_sampler = RouteSampler(threading.get_ident(), PROFILING_SAMPLER_INTERVAL_SEC, PROFILING_MAX_STACKS_PER_ROUTE)
+  route_sampler.register_routes(routes)
+  route_sampler.start()
+  return route_sampler
+
+
+def stop_route_sampler() -> None:
+  if route_sampler is not None:
+    route_sampler.stop()
+
+
+router = APIRouter()
+
+
+@router.get("/reports")
+async def list_reports(user: AuthUser = Depends(require_admin)):
+  return report_store.list()
+
+
+@router.get("/reports/{report_id}")
+async def get_report(report_id: int, user: AuthUser = Depends(require_admin)):
+  report = report_store.get(report_id)
+  if not report:
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Report not found")
+  media_type = "application/json" if report["format"] == "speedscope" else "text/plain"
+  return Response(report["body"], media_type=media_type)
+
+
+@router.get("/stacks", response_class=PlainTextResponse)
+async def route_stacks(route: str | None = None, user: AuthUser = Depends(require_admin)):
+  if route_sampler is None:
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Background sampler is disabled")
+  return route_sampler.report(route)
+
+
+@router.delete("/stacks", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_route_stacks(user: AuthUser = Depends(require_admin)):
+  if route_sampler is not None:
+    route_sampler.reset()
@@ -0,0 +1,24 @@
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try: 
+  import orjson
+except ImportError: 
+  orjson = None
+
+try: 
+  import msgspec
+except ImportError: 
+  msgspec = None
+
+
+def fast_json_available() -> bool: 
+  return orjson is not None or msgspec is not None
+
+
+class FastJSONResponse(JSONResponse): 
+  # encodes with orjson (or msgspec) instead of the stdlib json module
+  def render(self, content: Any) -> bytes: 
+    if orjson is not None: 
+      return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return msgspec.json.encode(content)
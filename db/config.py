@@ -1,7 +1,11 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from fastapi import Depends, Request
 from typing import AsyncGenerator, Annotated
 from decouple import config
+from .pool import InstrumentedAsyncPool, pool_metrics
+from .sticky import STICKY_WRITES_ENABLED, mark_written
+from .querystats import install_query_stats
 
 DB_USER = config("DB_USER")
 DB_PASS = config("DB_PASS")
@@ -11,12 +15,73 @@ DB_HOST = config("DB_HOST")
 
 DATABASE_URL = f"mysql+aiomysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+# dev | prod | bench, size the pool per uvicorn worker
+DB_PROFILE = config("DB_PROFILE", default="dev")
+# count statements per request (X-DB-* response headers, N+1 warnings), on in dev
+DB_QUERY_STATS = config("DB_QUERY_STATS", default=DB_PROFILE == "dev", cast=bool)
+
+ENGINE_PROFILES = {
+  "dev": {
+    "echo": True,
+    "pool_size": 5,
+    "max_overflow": 5,
+    "pool_timeout": 30,
+    "pool_recycle": 1800,
+    "pool_pre_ping": True,
+    "query_cache_size": 500,
+  },
+  "prod": {
+    "echo": False,
+    "pool_size": 10,
+    "max_overflow": 10,
+    "pool_timeout": 10,
+    "pool_recycle": 1800,
+    "pool_pre_ping": True,
+    "query_cache_size": 1200,
+  },
+  "bench": {
+    "echo": False,
+    "pool_size": 20,
+    "max_overflow": 0,
+    "pool_timeout": 5,
+    "pool_recycle": 3600,
+    "pool_pre_ping": False,
+    "query_cache_size": 2000,
+  },
+}
+
+
+def engine_options(profile: str) -> dict: 
+  if profile not in ENGINE_PROFILES: 
+    raise ValueError(f"Unknown DB_PROFILE {profile!r}, expected one of {sorted(ENGINE_PROFILES)}")
+
+  # each setting can still be overridden on its own, e.g. DB_POOL_SIZE=30
+  return {
+    key: config(f"DB_{key.upper()}", default=value, cast=type(value))
+    for key, value in ENGINE_PROFILES[profile].items()
+  }
+
+
+def make_engine(url: str, profile: str = DB_PROFILE) -> AsyncEngine: 
+  engine = create_async_engine(url, poolclass=InstrumentedAsyncPool, **engine_options(profile))
+  if DB_QUERY_STATS: 
+    install_query_stats(engine)
+  return engine
+
+
+engine = make_engine(DATABASE_URL)
 
 async_session = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
 
-async def get_session() -> AsyncGenerator[AsyncSession, None]: 
+async def get_session(request: Request) -> AsyncGenerator[AsyncSession, None]: 
   async with async_session() as session: 
+    # after this client commits, keep its reads on the primary for a moment (see db/sticky.py)
+    if STICKY_WRITES_ENABLED: 
+      event.listen(session.sync_session, "after_commit", lambda _: mark_written(request))
     yield session
 
-session = Annotated[AsyncSession, Depends(get_session)]
\ No newline at end of file
+session = Annotated[AsyncSession, Depends(get_session)]
+
+
+def db_pool_metrics() -> dict[str, dict]: 
+  return {"primary": pool_metrics(engine.pool)}
@@ -9,3 +9,5 @@ from shipping import models as shipping_models
 
 from order import models as order_models
 from payment import models as payment_models
+from inventory import models as inventory_models
+from core import models as core_models
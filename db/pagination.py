@@ -0,0 +1,33 @@
+import base64
+import json
+from fastapi import HTTPException, status
+from sqlalchemy import Select, and_, or_, asc, desc
+
+
+def encode_cursor(data: dict) -> str:
+  raw = json.dumps(data, default=str, separators=(",", ":")).encode()
+  return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+  try:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+  except (ValueError, TypeError):
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+  if not isinstance(data, dict):
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+  return data
+
+
+def apply_keyset(stmt: Select, column, id_column, value, last_id: int, forward: bool, descending: bool = False) -> Select:
+  # seek past (value, id) instead of OFFSET, so the index on (column, id) is used for every page
+  after = (column > value) if forward != descending else (column < value)
+  tie = (id_column > last_id) if forward != descending else (id_column < last_id)
+  return stmt.where(or_(after, and_(column == value, tie)))
+
+
+def keyset_order(column, id_column, forward: bool, descending: bool = False) -> tuple:
+  direction = asc if forward != descending else desc
+  return direction(column), direction(id_column)
@@ -0,0 +1,50 @@
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolStats: 
+  def __init__(self): 
+    self.checkouts = 0
+    self.timeouts = 0
+    self.wait_seconds_total = 0.0
+    self.wait_seconds_max = 0.0
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool): 
+  # measures how long a session waits to get a connection out of the pool
+  def __init__(self, *args, **kwargs): 
+    super().__init__(*args, **kwargs)
+    self.stats = PoolStats()
+
+  def _do_get(self): 
+    started_at = time.perf_counter()
+    try: 
+      return super()._do_get()
+    except exc.TimeoutError: 
+      self.stats.timeouts += 1
+      raise
+    finally: 
+      waited = time.perf_counter() - started_at
+      self.stats.checkouts += 1
+      self.stats.wait_seconds_total += waited
+      self.stats.wait_seconds_max = max(self.stats.wait_seconds_max, waited)
+
+
+def pool_metrics(pool) -> dict: 
+  metrics = {
+    "size": pool.size(),
+    "checked_out": pool.checkedout(),
+    "checked_in": pool.checkedin(),
+    "overflow": pool.overflow(),
+  }
+
+  stats = getattr(pool, "stats", None)
+  if stats is not None: 
+    metrics.update({
+      "checkouts": stats.checkouts,
+      "timeouts": stats.timeouts,
+      "wait_seconds_total": stats.wait_seconds_total,
+      "wait_seconds_max": stats.wait_seconds_max,
+    })
+  return metrics
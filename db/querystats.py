@@ -0,0 +1,142 @@
+"""Per-request SQL statistics: statement count, DB time and repeated statement shapes.
+
+Engine events record every statement into the QueryStats of the current context, so
+anything wrapped in track_queries() (a request via QueryStatsMiddleware, or a test via
+query_budget()) sees exactly the statements it caused. The same parameterized SQL run
+several times in one request is the usual sign of an N+1 (lazy loads, a get() per row).
+
+  async with query_budget(5, max_duplicates=1):
+    await client.get("/api/order")
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar["QueryStats | None"] = ContextVar("query_stats", default=None)
+
+
+class QueryStats:
+  def __init__(self, parent: "QueryStats | None" = None):
+    self.parent = parent
+    self.count = 0
+    self.total_ms = 0.0
+    self.shapes: Counter[str] = Counter()
+
+  def record(self, statement: str, elapsed_ms: float) -> None:
+    stats = self
+    while stats is not None:
+      stats.count += 1
+      stats.total_ms += elapsed_ms
+      stats.shapes[statement] += 1
+      stats = stats.parent
+
+  def duplicates(self) -> dict[str, int]:
+    return {shape: n for shape, n in self.shapes.most_common() if n > 1}
+
+  def report(self) -> str:
+    lines = [f"{self.count} statements in {self.total_ms:.1f} ms"]
+    for shape, n in self.duplicates().items():
+      lines.append(f"  {n}x {' '.join(shape.split())[:200]}")
+    return "\n".join(lines)
+
+
+@contextmanager
+def track_queries():
+  stats = QueryStats(parent=_current.get())
+  token = _current.set(stats)
+  try:
+    yield stats
+  finally:
+    _current.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  if _current.get() is not None:
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  stats = _current.get()
+  if stats is None:
+    return
+  starts = conn.info.get("query_start")
+  if not starts:
+    return
+  stats.record(statement, (time.perf_counter() - starts.pop()) * 1000)
+
+
+def _handle_error(context):
+  # a failed statement never reaches after_cursor_execute; drop its start time, or it
+  # would stay on the pooled connection and be paired with a later statement
+  conn = context.connection
+  if conn is None or context.cursor is None:
+    return
+  starts = conn.info.get("query_start")
+  if starts:
+    starts.pop()
+
+
+def install_query_stats(engine: AsyncEngine) -> None:
+  # cheap when nothing is tracked: one context variable lookup per statement
+  event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+  event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+  event.listen(engine.sync_engine, "handle_error", _handle_error)
+
+
+class QueryStatsMiddleware:
+  """Adds X-DB-Query-Count, X-DB-Time-Ms and X-DB-Duplicate-Queries to responses and logs likely N+1s."""
+
+  def __init__(self, app: ASGIApp, duplicate_warning: int = 3):
+    self.app = app
+    self.duplicate_warning = duplicate_warning
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    with track_queries() as stats:
+      async def send_wrapper(message: Message) -> None:
+        if message["type"] == "http.response.start":
+          headers = MutableHeaders(scope=message)
+          headers["X-DB-Query-Count"] = str(stats.count)
+          headers["X-DB-Time-Ms"] = f"{stats.total_ms:.1f}"
+          headers["X-DB-Duplicate-Queries"] = str(sum(n - 1 for n in stats.duplicates().values()))
+        await send(message)
+
+      await self.app(scope, receive, send_wrapper)
+
+    worst = max(stats.shapes.values(), default=0)
+    if worst >= self.duplicate_warning:
+      logger.warning("possible N+1 on %s %s: %s", scope["method"], scope["path"], stats.report())
+
+
+class QueryBudgetExceeded(AssertionError):
+  pass
+
+
+@asynccontextmanager
+async def query_budget(max_queries: int, max_duplicates: int | None = None):
+  """For tests: fail when the wrapped calls run more statements than budgeted.
+
+  Works with in-process clients such as httpx.AsyncClient(transport=ASGITransport(app)),
+  which run the app in the test's own context. With starlette's TestClient (another
+  thread) read the X-DB-Query-Count header from QueryStatsMiddleware instead.
+  """
+  with track_queries() as stats:
+    yield stats
+
+  if stats.count > max_queries:
+    raise QueryBudgetExceeded(f"query budget {max_queries} exceeded: {stats.report()}")
+  if max_duplicates is not None:
+    worst = max(stats.shapes.values(), default=0)
+    if worst > max_duplicates:
+      raise QueryBudgetExceeded(f"a statement ran {worst} times (budget {max_duplicates}): {stats.report()}")
@@ -0,0 +1,106 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import AsyncGenerator, Annotated
+from decouple import config, Csv
+from fastapi import Depends, Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from .config import make_engine, async_session
+from .pool import pool_metrics
+from .sticky import is_sticky
+
+logger = logging.getLogger(__name__)
+
+# comma separated SQLAlchemy URLs of read replicas, empty sends every read to the primary
+DB_REPLICA_URLS = config("DB_REPLICA_URLS", default="", cast=Csv())
+DB_REPLICA_MAX_LAG_SEC = config("DB_REPLICA_MAX_LAG_SEC", default=5, cast=int)
+DB_REPLICA_CHECK_INTERVAL_SEC = config("DB_REPLICA_CHECK_INTERVAL_SEC", default=5, cast=int)
+
+
+class Replica: 
+  def __init__(self, url: str): 
+    self.engine = make_engine(url)
+    self.sessionmaker = async_sessionmaker(bind=self.engine, expire_on_commit=False, class_=AsyncSession)
+    self.name = self.engine.url.render_as_string(hide_password=True)
+    self.healthy = False
+    self.lag: float | None = None
+    self.checked_at = 0.0
+    self._lock = asyncio.Lock()
+
+  async def _read_lag(self) -> float | None: 
+    async with self.engine.connect() as conn: 
+      # local stand-ins (e.g. SQLite files) have no replication to be behind on
+      if conn.dialect.name != "mysql": 
+        return 0.0
+
+      try: 
+        row = (await conn.execute(text("SHOW REPLICA STATUS"))).mappings().first()
+        lag = row.get("Seconds_Behind_Source") if row else None
+      except Exception: 
+        # MySQL before 8.0.22
+        row = (await conn.execute(text("SHOW SLAVE STATUS"))).mappings().first()
+        lag = row.get("Seconds_Behind_Master") if row else None
+
+      # NULL means the replication thread is not running
+      return None if lag is None else float(lag)
+
+  async def refresh(self, interval: int) -> None: 
+    if self.checked_at + interval > time.monotonic() or self._lock.locked(): 
+      return
+
+    async with self._lock: 
+      try: 
+        self.lag = await self._read_lag()
+        self.healthy = self.lag is not None
+      except Exception: 
+        logger.warning("read replica %s is unreachable", self.name, exc_info=True)
+        self.healthy = False
+        self.lag = None
+      self.checked_at = time.monotonic()
+
+
+class ReplicaRouter: 
+  def __init__(self, urls: list[str], max_lag: int, check_interval: int): 
+    self.replicas = [Replica(url) for url in urls]
+    self.max_lag = max_lag
+    self.check_interval = check_interval
+    self._order = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+
+  async def choose(self) -> Replica | None: 
+    # round robin over the replicas that are up and within the lag budget
+    for _ in range(len(self.replicas)): 
+      replica = self.replicas[next(self._order)]
+      await replica.refresh(self.check_interval)
+      if replica.healthy and replica.lag <= self.max_lag: 
+        return replica
+    return None
+
+
+replica_router = ReplicaRouter(DB_REPLICA_URLS, DB_REPLICA_MAX_LAG_SEC, DB_REPLICA_CHECK_INTERVAL_SEC)
+
+
+async def read_sessionmaker() -> async_sessionmaker: 
+  # a usable replica's sessionmaker, or the primary's
+  replica = await replica_router.choose() if replica_router.replicas else None
+  return replica.sessionmaker if replica else async_session
+
+
+async def get_read_session(request: Request) -> AsyncGenerator[AsyncSession, None]: 
+  # for read-only handlers; falls back to the primary when no replica is usable
+  # or when this client wrote something within the last DB_REPLICA_STICKY_SEC
+  maker = async_session
+  if replica_router.replicas and not is_sticky(request): 
+    replica = await replica_router.choose()
+    if replica: 
+      maker = replica.sessionmaker
+
+  async with maker() as session: 
+    yield session
+
+read_session = Annotated[AsyncSession, Depends(get_read_session)]
+
+
+def replica_pool_metrics() -> dict[str, dict]: 
+  return {replica.name: pool_metrics(replica.engine.pool) for replica in replica_router.replicas}
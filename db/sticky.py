@@ -0,0 +1,66 @@
+"""Read-your-writes for replica routing.
+
+When a request commits on the primary, its response carries a short-lived signed
+`db_sticky` cookie. While the cookie is valid, get_read_session sends that client's
+reads to the primary. The deadline travels with the client, so it holds whichever
+worker serves the next request.
+"""
+from datetime import datetime, timezone, timedelta
+from fastapi import Request
+from decouple import config
+from jose import jwt, JWTError
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from account.utils import JWT_SECRET_KEY, JWT_ALGORITHM
+
+# how long a client's reads stay on the primary after it wrote something
+DB_REPLICA_STICKY_SEC = config("DB_REPLICA_STICKY_SEC", default=5, cast=int)
+# nothing to track when every read already goes to the primary
+STICKY_WRITES_ENABLED = bool(config("DB_REPLICA_URLS", default="").strip())
+
+STICKY_COOKIE = "db_sticky"
+
+
+def mark_written(request: Request) -> None:
+  # picked up by StickyWritesMiddleware when the response starts
+  request.state.db_sticky = True
+
+
+def is_sticky(request: Request) -> bool:
+  if getattr(request.state, "db_sticky", False):
+    return True
+
+  token = request.cookies.get(STICKY_COOKIE)
+  if not token:
+    return False
+  try:
+    payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=JWT_ALGORITHM)
+  except JWTError:
+    # forged, or past its deadline
+    return False
+  return payload.get("type") == "db_sticky"
+
+
+def sticky_cookie(window: int = DB_REPLICA_STICKY_SEC) -> str:
+  expires_at = datetime.now(timezone.utc) + timedelta(seconds=window)
+  token = jwt.encode({"type": "db_sticky", "exp": expires_at}, JWT_SECRET_KEY, JWT_ALGORITHM)
+  return f"{STICKY_COOKIE}={token}; Max-Age={window}; Path=/; HttpOnly; Secure; SameSite=lax"
+
+
+class StickyWritesMiddleware:
+  """Sets the db_sticky cookie on responses to requests that committed, whatever the response class."""
+
+  def __init__(self, app: ASGIApp):
+    self.app = app
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+
+    async def send_wrapper(message: Message) -> None:
+      if message["type"] == "http.response.start" and scope.get("state", {}).get("db_sticky"):
+        MutableHeaders(scope=message).append("set-cookie", sticky_cookie())
+      await send(message)
+
+    await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,22 @@
+from __future__ import annotations
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import ForeignKey, DateTime, Index, UniqueConstraint
+from datetime import datetime, timezone
+from db.base import Base
+
+
+class StockReservation(Base):
+    # units held for a user's cart; they are already subtracted from products.stock_quantity
+    __tablename__ = "stock_reservations"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    quantity: Mapped[int] = mapped_column(nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "product_id", name="uq_stock_reservations_user_product"),
+        Index("ix_stock_reservations_expires_at", "expires_at"),
+    )
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from decouple import config
+from sqlalchemy import select, update, delete, case, func
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.config import async_session
+from order.models import OrderItem
+from product.models import Product
+from .models import StockReservation
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_HOLD_MINUTES = config("INVENTORY_HOLD_MINUTES", default=15, cast=int)
+INVENTORY_SWEEP_INTERVAL_SEC = config("INVENTORY_SWEEP_INTERVAL_SEC", default=30, cast=int)
+INVENTORY_SWEEP_BATCH_SIZE = config("INVENTORY_SWEEP_BATCH_SIZE", default=500, cast=int)
+
+# The stock functions below neither commit nor roll back: they run inside the caller's
+# transaction, and a shortage raises InsufficientStock for the caller to roll back
+# (only the reservation sweeper owns its transactions). Stock only ever moves through
+# single conditional UPDATEs, so there is no read-check-write window and no long-held
+# lock on a hot product row.
+
+
+class InsufficientStock(Exception): 
+  pass
+
+
+async def decrement_stock(session: AsyncSession, quantities: dict[int, int]) -> bool: 
+  # takes every quantity or nothing useful: False means at least one product was short
+  if not quantities: 
+    return True
+
+  amount = case(quantities, value=Product.id)
+  stmt = (
+    update(Product)
+    .where(Product.id.in_(quantities), Product.stock_quantity >= amount)
+    .values(stock_quantity=Product.stock_quantity - amount)
+    .execution_options(synchronize_session=False)
+  )
+  result = await session.execute(stmt)
+  return result.rowcount == len(quantities)
+
+
+async def restock(session: AsyncSession, quantities: dict[int, int]) -> None: 
+  if not quantities: 
+    return
+
+  amount = case(quantities, value=Product.id)
+  stmt = (
+    update(Product)
+    .where(Product.id.in_(quantities))
+    .values(stock_quantity=Product.stock_quantity + amount)
+    .execution_options(synchronize_session=False)
+  )
+  await session.execute(stmt)
+
+
+async def restock_order(session: AsyncSession, order_id: int) -> None: 
+  # gives back the stock an order took at checkout
+  stmt = (
+    select(OrderItem.product_id, func.sum(OrderItem.quantity).label("quantity"))
+    .where(OrderItem.order_id == order_id, OrderItem.product_id.is_not(None))
+    .group_by(OrderItem.product_id)
+  )
+  await restock(session, {row.product_id: int(row.quantity) for row in await session.execute(stmt)})
+
+
+async def reserve_stock(session: AsyncSession, user_id: int, product_id: int, quantity: int) -> None: 
+  await reserve_stock_many(session, user_id, {product_id: quantity})
+
+
+async def reserve_stock_many(session: AsyncSession, user_id: int, quantities: dict[int, int]) -> None: 
+  quantities = {pid: qty for pid, qty in quantities.items() if qty > 0}
+  if not quantities: 
+    return
+
+  if not await decrement_stock(session, quantities): 
+    raise InsufficientStock(sorted(quantities))
+
+  # add to the user's holds on these products and push their expiry forward
+  expires_at = datetime.now(timezone.utc) + timedelta(minutes=INVENTORY_HOLD_MINUTES)
+  stmt = insert(StockReservation).values([
+    {"user_id": user_id, "product_id": pid, "quantity": qty, "expires_at": expires_at}
+    for pid, qty in quantities.items()
+  ])
+  stmt = stmt.on_duplicate_key_update(
+    quantity=StockReservation.quantity + stmt.inserted.quantity,
+    expires_at=stmt.inserted.expires_at
+  )
+  await session.execute(stmt)
+
+
+async def release_stock(session: AsyncSession, user_id: int, product_id: int, quantity: int) -> None: 
+  await release_stock_many(session, user_id, {product_id: quantity})
+
+
+async def release_stock_many(session: AsyncSession, user_id: int, quantities: dict[int, int]) -> None: 
+  quantities = {pid: qty for pid, qty in quantities.items() if qty > 0}
+  if not quantities: 
+    return
+
+  stmt = (
+    select(StockReservation)
+    .where(StockReservation.user_id == user_id, StockReservation.product_id.in_(quantities))
+    .with_for_update()
+  )
+  reservations = (await session.execute(stmt)).scalars().all()
+
+  # a hold may already have expired and been swept, then there is nothing to give back
+  released: dict[int, int] = {}
+  for reservation in reservations: 
+    amount = min(quantities[reservation.product_id], reservation.quantity)
+    if amount == reservation.quantity: 
+      await session.delete(reservation)
+    else: 
+      reservation.quantity -= amount
+    released[reservation.product_id] = amount
+
+  await restock(session, released)
+
+
+async def commit_reservations(session: AsyncSession, user_id: int, quantities: dict[int, int]) -> None: 
+  # turns the user's holds into a sale of `quantities`, topping up any hold that expired
+  stmt = (
+    select(StockReservation.product_id, StockReservation.quantity)
+    .where(StockReservation.user_id == user_id)
+    .with_for_update()
+  )
+  held = {row.product_id: row.quantity for row in await session.execute(stmt)}
+
+  shortfall = {pid: qty - held.get(pid, 0) for pid, qty in quantities.items() if qty > held.get(pid, 0)}
+  surplus = {pid: qty - quantities.get(pid, 0) for pid, qty in held.items() if qty > quantities.get(pid, 0)}
+
+  if not await decrement_stock(session, shortfall): 
+    raise InsufficientStock(sorted(shortfall))
+
+  await restock(session, surplus)
+  await session.execute(delete(StockReservation).where(StockReservation.user_id == user_id))
+
+
+async def release_expired_reservations(session: AsyncSession, batch_size: int = INVENTORY_SWEEP_BATCH_SIZE) -> int: 
+  # SKIP LOCKED leaves holds that a checkout is committing right now alone
+  stmt = (
+    select(StockReservation.id, StockReservation.product_id, StockReservation.quantity)
+    .where(StockReservation.expires_at < datetime.now(timezone.utc))
+    .order_by(StockReservation.expires_at)
+    .limit(batch_size)
+    .with_for_update(skip_locked=True)
+  )
+  rows = (await session.execute(stmt)).all()
+  if not rows: 
+    await session.rollback()
+    return 0
+
+  quantities: dict[int, int] = {}
+  for row in rows: 
+    quantities[row.product_id] = quantities.get(row.product_id, 0) + row.quantity
+
+  await restock(session, quantities)
+  await session.execute(delete(StockReservation).where(StockReservation.id.in_([row.id for row in rows])))
+  await session.commit()
+  return len(rows)
+
+
+async def run_reservation_sweeper(
+    interval: int = INVENTORY_SWEEP_INTERVAL_SEC, 
+    batch_size: int = INVENTORY_SWEEP_BATCH_SIZE
+) -> None: 
+  while True: 
+    try: 
+      async with async_session() as session: 
+        while await release_expired_reservations(session, batch_size) == batch_size: 
+          pass
+    except asyncio.CancelledError: 
+      raise
+    except Exception: 
+      logger.exception("releasing expired stock reservations failed")
+
+    await asyncio.sleep(interval)
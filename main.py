@@ -1,4 +1,8 @@
+import asyncio
+from contextlib import asynccontextmanager
+from decouple import config
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from account.routers import router as account_router
 from product.routers.category import router as category_router
 from product.routers.product import router as product_router
@@ -6,8 +10,89 @@ from cart.router import router as cart_router
 from shipping.routers import router as shipping_router
 from payment.routers import router as payment_router
 from order.routers import router as order_router
+from media_server.routers import router as media_router
+from account.utils import password_hasher
+from inventory.services import run_reservation_sweeper
+from account.services import run_refresh_token_purge
+from core.idempotency import IDEMPOTENCY_STORE, run_idempotency_key_purge
+from product.images import image_variant_queue
+from payment.worker import payment_worker
+from core.responses import FastJSONResponse, fast_json_available
+from core.compression import CompressionMiddleware
+from db.config import DB_QUERY_STATS, db_pool_metrics
+from db.replicas import replica_pool_metrics
+from db.sticky import STICKY_WRITES_ENABLED, StickyWritesMiddleware
+from core.metrics import MetricsMiddleware, register_collector, gauges, router as metrics_router
+from product.cache import catalog_cache
+from product.utils import upload_stats
+from db.querystats import QueryStatsMiddleware
+from core.profiling import PROFILING_ENABLED, ProfilingMiddleware, start_route_sampler, stop_route_sampler, router as profiling_router
 
-app = FastAPI(title="this is sample project")
+INVENTORY_SWEEPER_ENABLED = config("INVENTORY_SWEEPER_ENABLED", default=True, cast=bool)
+REFRESH_TOKEN_PURGE_ENABLED = config("REFRESH_TOKEN_PURGE_ENABLED", default=True, cast=bool)
+IDEMPOTENCY_PURGE_ENABLED = config("IDEMPOTENCY_PURGE_ENABLED", default=True, cast=bool)
+# opt-in fast path for large list responses
+API_FAST_JSON = config("API_FAST_JSON", default=False, cast=bool)
+API_COMPRESSION = config("API_COMPRESSION", default=False, cast=bool)
+API_COMPRESSION_MIN_SIZE = config("API_COMPRESSION_MIN_SIZE", default=1024, cast=int)
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+  background_tasks: list[asyncio.Task] = []
+  if INVENTORY_SWEEPER_ENABLED:
+    background_tasks.append(asyncio.create_task(run_reservation_sweeper()))
+  if REFRESH_TOKEN_PURGE_ENABLED:
+    background_tasks.append(asyncio.create_task(run_refresh_token_purge()))
+  if IDEMPOTENCY_PURGE_ENABLED and IDEMPOTENCY_STORE == "db":
+    background_tasks.append(asyncio.create_task(run_idempotency_key_purge()))
+  background_tasks.extend(image_variant_queue.start())
+  # also re-queues unclaimed payments and claims whose lease ran out, on every worker
+  background_tasks.extend(payment_worker.start())
+  start_route_sampler(app.routes)
+
+  yield
+
+  for task in background_tasks:
+    task.cancel()
+  await asyncio.gather(*background_tasks, return_exceptions=True)
+  password_hasher.shutdown()
+  image_variant_queue.shutdown()
+  await payment_worker.shutdown()
+  stop_route_sampler()
+
+
+app = FastAPI(
+  title="this is sample project",
+  lifespan=lifespan,
+  default_response_class=FastJSONResponse if API_FAST_JSON and fast_json_available() else JSONResponse
+)
+
+if API_COMPRESSION:
+  app.add_middleware(CompressionMiddleware, minimum_size=API_COMPRESSION_MIN_SIZE)
+
+if STICKY_WRITES_ENABLED:
+  app.add_middleware(StickyWritesMiddleware)
+
+if DB_QUERY_STATS:
+  app.add_middleware(QueryStatsMiddleware)
+
+if PROFILING_ENABLED:
+  app.add_middleware(ProfilingMiddleware)
+
+if METRICS_ENABLED:
+  # added last so it is the outermost middleware and times everything else too
+  app.add_middleware(MetricsMiddleware)
+  app.include_router(metrics_router)
+  register_collector(lambda: (
+    gauges("db_pool", {**db_pool_metrics(), **replica_pool_metrics()}, label="pool")
+    + gauges("catalog_cache", catalog_cache.stats())
+    + gauges("password_hasher", password_hasher.metrics())
+    + gauges("image_upload", upload_stats.metrics(), label="source")
+    + gauges("image_variant_queue", image_variant_queue.metrics())
+    + gauges("payment_worker", payment_worker.metrics())
+  ))
 
 app.include_router(account_router, prefix='/api/account', tags=["Account"])
 app.include_router(category_router, prefix='/api/products-category', tags=['categories'])
@@ -16,3 +101,5 @@ app.include_router(cart_router, prefix="/api/cart", tags=['cart'])
 app.include_router(shipping_router, prefix="/api/shipping", tags=['shipping'])
 app.include_router(order_router, prefix="/api/order", tags=['order'])
 app.include_router(payment_router, prefix="/api/payment", tags=['payment'])
+app.include_router(media_router, prefix="/media", tags=['media'])
+app.include_router(profiling_router, prefix="/api/profiling", tags=['profiling'])
@@ -0,0 +1,8 @@
+from fastapi import APIRouter, Request
+from . import services as ss
+
+router = APIRouter()
+
+@router.api_route("/{file_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_media(file_path: str, request: Request): 
+  return await ss.media_response(request, file_path)
@@ -0,0 +1,185 @@
+import mimetypes
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+import anyio
+from decouple import config
+from fastapi import HTTPException, Request, status
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from product.utils import UPLOAD_DIR
+
+MEDIA_MAX_AGE_SEC = config("MEDIA_MAX_AGE_SEC", default=31536000, cast=int)
+MEDIA_MUTABLE_MAX_AGE_SEC = config("MEDIA_MUTABLE_MAX_AGE_SEC", default=300, cast=int)
+# when nginx fronts the app, hand the bytes to it with X-Accel-Redirect, e.g. "/protected-media/"
+MEDIA_X_ACCEL_PREFIX = config("MEDIA_X_ACCEL_PREFIX", default="")
+MEDIA_STAT_CACHE_SIZE = config("MEDIA_STAT_CACHE_SIZE", default=4096, cast=int)
+
+# uploads and their variants are named after their sha256, so their bytes never change
+HASHED_NAME_RE = re.compile(r"^[0-9a-f]{64}")
+
+
+@dataclass(frozen=True, slots=True)
+class MediaFile: 
+  path: Path
+  relative: str
+  size: int
+  etag: str
+  content_type: str
+  immutable: bool
+
+
+_stat_cache: OrderedDict[str, MediaFile] = OrderedDict()
+_media_root: Path | None = None
+
+
+async def resolve_media_file(relative: str) -> MediaFile: 
+  global _media_root
+  cached = _stat_cache.get(relative)
+  if cached is not None: 
+    _stat_cache.move_to_end(relative)
+    return cached
+
+  # resolve/stat hit the disk, so they run in a worker thread like the chunked reads below
+  if _media_root is None: 
+    _media_root = Path(await anyio.Path(UPLOAD_DIR).resolve())
+  root = _media_root
+  path = Path(await anyio.Path(root / relative).resolve())
+  if not path.is_relative_to(root) or not await anyio.Path(path).is_file(): 
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+
+  stat = await anyio.Path(path).stat()
+  immutable = bool(HASHED_NAME_RE.match(path.name))
+  media = MediaFile(
+    path=path,
+    relative=path.relative_to(root).as_posix(),
+    size=stat.st_size,
+    etag=f'"{path.stem}"' if immutable else f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+    content_type=mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+    immutable=immutable,
+  )
+
+  # only immutable files can skip the stat on later hits
+  if immutable: 
+    _stat_cache[relative] = media
+    while len(_stat_cache) > MEDIA_STAT_CACHE_SIZE: 
+      _stat_cache.popitem(last=False)
+  return media
+
+
+def etag_matches(header: str, etag: str) -> bool: 
+  # weak comparison, as If-None-Match requires
+  if header.strip() == "*": 
+    return True
+  return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None: 
+  # a single "bytes=" range as inclusive (start, end); None serves the whole file, which is
+  # also what RFC 9110 asks for when the header is malformed (e.g. last byte before first)
+  if not header.startswith("bytes=") or "," in header: 
+    return None
+
+  start_text, _, end_text = header[6:].strip().partition("-")
+  if not (start_text or end_text) or not all(text.isdigit() for text in (start_text, end_text) if text): 
+    return None
+
+  if not start_text: 
+    # the last N bytes; a zero-length suffix can never be satisfied
+    suffix = int(end_text)
+    start, end = (max(size - suffix, 0), size - 1) if suffix else (size, size - 1)
+  else: 
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if end < start: 
+      return None
+    end = min(end, size - 1)
+
+  # well-formed, but starting at or past the end of the file
+  if start >= size: 
+    raise HTTPException(
+      status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+      detail="Requested range not satisfiable",
+      headers={"Content-Range": f"bytes */{size}"}
+    )
+  return start, end
+
+
+class MediaFileResponse(Response): 
+  chunk_size = 64 * 1024
+
+  def __init__(self, media: MediaFile, start: int, end: int, status_code: int, headers: dict[str, str]): 
+    self.media = media
+    self.start = start
+    self.end = end
+    self.status_code = status_code
+    self.media_type = media.content_type
+    self.background: BackgroundTask | None = None
+    self.init_headers({**headers, "content-length": str(end - start + 1)})
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None: 
+    await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+    if scope["method"] == "HEAD": 
+      await send({"type": "http.response.body", "body": b"", "more_body": False})
+      return
+
+    count = self.end - self.start + 1
+    extensions = scope.get("extensions") or {}
+
+    # let the server sendfile() the bytes when it supports it
+    if "http.response.zerocopysend" in extensions: 
+      # opened (and closed) in a worker thread, the server gets the plain file object
+      async with await anyio.open_file(self.media.path, "rb") as f: 
+        await send({"type": "http.response.zerocopysend", "file": f.wrapped, "offset": self.start, "count": count})
+      return
+
+    if "http.response.pathsend" in extensions and count == self.media.size: 
+      await send({"type": "http.response.pathsend", "path": str(self.media.path)})
+      return
+
+    async with await anyio.open_file(self.media.path, "rb") as f: 
+      await f.seek(self.start)
+      remaining = count
+      while remaining > 0: 
+        chunk = await f.read(min(self.chunk_size, remaining))
+        if not chunk: 
+          break
+        remaining -= len(chunk)
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def media_response(request: Request, relative: str) -> Response: 
+  media = await resolve_media_file(relative)
+
+  max_age = MEDIA_MAX_AGE_SEC if media.immutable else MEDIA_MUTABLE_MAX_AGE_SEC
+  headers = {
+    "etag": media.etag,
+    "cache-control": f"public, max-age={max_age}" + (", immutable" if media.immutable else ""),
+    "accept-ranges": "bytes",
+  }
+
+  if_none_match = request.headers.get("if-none-match")
+  if if_none_match and etag_matches(if_none_match, media.etag): 
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+  if MEDIA_X_ACCEL_PREFIX: 
+    # nginx handles ranges and sendfile itself
+    headers["x-accel-redirect"] = MEDIA_X_ACCEL_PREFIX.rstrip("/") + "/" + media.relative
+    return Response(headers=headers, media_type=media.content_type)
+
+  byte_range = None
+  range_header = request.headers.get("range")
+  if_range = request.headers.get("if-range")
+  if range_header and (not if_range or if_range.strip() == media.etag): 
+    byte_range = parse_range(range_header, media.size)
+
+  if byte_range is None: 
+    return MediaFileResponse(media, 0, media.size - 1, status.HTTP_200_OK, headers)
+
+  start, end = byte_range
+  headers["content-range"] = f"bytes {start}-{end}/{media.size}"
+  return MediaFileResponse(media, start, end, status.HTTP_206_PARTIAL_CONTENT, headers)
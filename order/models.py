@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey, DateTime, Enum, func 
+from sqlalchemy import ForeignKey, DateTime, Enum, Index, func 
 from db.base import Base 
 from typing import TYPE_CHECKING, Optional
 from product.models import Product
@@ -36,6 +36,12 @@ class Order(Base):
 
   payment: Mapped[Optional['Payment']] = relationship("Payment", back_populates="order", uselist=False, cascade="all, delete-orphan")
 
+  __table_args__ = (
+    # order history per user and the admin listing, both newest first
+    Index("ix_orders_user_id_created_at", "user_id", "created_at"),
+    Index("ix_orders_status_created_at", "status", "created_at"),
+  )
+
 
 class OrderItem(Base): 
   __tablename__ = "order_items"
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from typing import Literal
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from account.dependency import get_current_user, require_admin
-from account.models import User
+from account.cache import AuthUser
 from db.config import session
-from order.schemas import OrderOut
-from order.services import all_placed_order, cancel_order, checkout, get_order_by_id, get_placed_order_for_user
+from db.replicas import read_session
+from core.idempotency import run_idempotent, fingerprint
+from core.metrics import checkout_outcomes
+from order.schemas import OrderOut, PaginatedOrderOut, PaginatedOrderSummaryOut
+from order.services import all_placed_order, cancel_order, checkout, export_placed_orders, get_order_by_id, get_placed_order_for_user
 from payment.schemas import PaymentCreate
 
 router = APIRouter()
@@ -12,22 +18,45 @@ router = APIRouter()
 async def checkout_order(
     session: session,
     payment_data: PaymentCreate,
-    user: User = Depends(get_current_user)
+    user: AuthUser = Depends(get_current_user),
+    idempotency_key: str | None = Header(default=None, max_length=255)
 ):
-  return await checkout(session, user.id, payment_data)
+  try:
+    if not idempotency_key:
+      order = await checkout(session, user.id, payment_data)
+      checkout_outcomes.inc(outcome="accepted")
+      return order
 
-@router.get("", response_model=list[OrderOut])
+    # a retry with the same key gets the first attempt's order back instead of a second checkout
+    async def run():
+      order = await checkout(session, user.id, payment_data)
+      checkout_outcomes.inc(outcome="accepted")
+      return OrderOut.model_validate(order).model_dump(mode="json")
+
+    return await run_idempotent(
+      scope=f"checkout:{user.id}",
+      key=idempotency_key,
+      fingerprint=fingerprint(payment_data.model_dump_json()),
+      handler=run
+    )
+  except HTTPException as exc:
+    checkout_outcomes.inc(outcome="rejected", status=exc.status_code)
+    raise
+
+@router.get("", response_model=PaginatedOrderSummaryOut)
 async def get_user_order_list(
-  session: session,
-  user: User = Depends(get_current_user)
+  session: read_session,
+  user: AuthUser = Depends(get_current_user),
+  limit: int = Query(default=20, ge=1, le=100),
+  cursor: str | None = None
 ):
-  return await get_placed_order_for_user(session, user.id)
+  return await get_placed_order_for_user(session, user.id, limit=limit, cursor=cursor)
 
 @router.get("/{order_id}", response_model=OrderOut)
 async def get_user_order_by_id(
-  session: session,
+  session: read_session,
   order_id: int,
-  user: User = Depends(get_current_user)
+  user: AuthUser = Depends(get_current_user)
 ):
   order = await get_order_by_id(session, user.id, order_id)
   if not order:
@@ -38,15 +67,43 @@ async def get_user_order_by_id(
 async def order_cancel(
   session: session,
   order_id : int,
-  user: User = Depends(get_current_user)
+  user: AuthUser = Depends(get_current_user)
 ):
   return await cancel_order(session, user.id, order_id)
 
-@router.get("/admin/all", response_model=list[OrderOut])
+@router.get("/admin/all", response_model=PaginatedOrderOut)
 async def all_order_list(
-    session: session,
-    user: User = Depends(require_admin),
+    session: read_session,
+    user: AuthUser = Depends(require_admin),
+    shipping_status: str | None = None,
+    user_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    limit: int = Query(default=50, ge=1, le=500),
+    cursor: str | None = None
+):
+    return await all_placed_order(
+      session,
+      shipping_status=shipping_status,
+      user_id=user_id,
+      date_from=date_from,
+      date_to=date_to,
+      limit=limit,
+      cursor=cursor
+    )
+
+@router.get("/admin/export")
+async def all_order_export(
+    user: AuthUser = Depends(require_admin),
+    format: Literal["ndjson", "csv"] = "ndjson",
     shipping_status: str | None = None,
-    user_id: int | None = None
+    user_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None
 ):
-    return await all_placed_order(session, shipping_status=shipping_status, user_id=user_id)
\ No newline at end of file
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+      export_placed_orders(format, shipping_status=shipping_status, user_id=user_id, date_from=date_from, date_to=date_to),
+      media_type=media_type,
+      headers={"Content-Disposition": f'attachment; filename="orders.{format}"'}
+    )
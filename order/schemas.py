@@ -28,4 +28,24 @@ class OrderOut(BaseModel):
   shipping_status: Optional[ShippingStatusOut] = None
   orderitems: list[OrderItemOut]
   model_config = {"from_attributes": True}
-  
\ No newline at end of file
+  
+
+class PaginatedOrderOut(BaseModel):
+  items: list[OrderOut]
+  limit: int
+  next_cursor: str | None = None
+
+
+class OrderSummaryOut(BaseModel):
+  id: int
+  total_price: float
+  status: str
+  item_count: int
+  created_at: datetime
+  model_config = {"from_attributes": True}
+
+
+class PaginatedOrderSummaryOut(BaseModel):
+  items: list[OrderSummaryOut]
+  limit: int
+  next_cursor: str | None = None
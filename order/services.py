@@ -1,58 +1,67 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncGenerator
 from fastapi import HTTPException, status
 from decimal import Decimal
+from decouple import config
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, delete, func, Select
 from sqlalchemy.orm import selectinload
 from cart.models import CartItem
 from payment.services import create_payment
+from inventory.services import InsufficientStock, commit_reservations, restock_order
 from product.models import Product
 from shipping.models import ShippingAddress, ShippingStatus, ShippingStatusEnum
 from order.models import Order, OrderItem, OrderStatusEnum
+from payment.models import Payment, PaymentStatusEnum
 from payment.schemas import PaymentCreate
+from payment.state import ORDER_TRANSITIONS, transition
+from payment.worker import payment_worker
+from db.pagination import encode_cursor, decode_cursor, apply_keyset, keyset_order
+from db.replicas import read_sessionmaker
+
+ORDER_EXPORT_BATCH_SIZE = config("ORDER_EXPORT_BATCH_SIZE", default=1000, cast=int)
 
 async def checkout(
     session: AsyncSession,
     user_id: int,
     payment_data: PaymentCreate
 ) -> Order:
-  # Fetch all cart items for the user, locking rows for update (to prevent race conditions)
-  stmt = select(CartItem).where(CartItem.user_id == user_id).options(selectinload(CartItem.product)).with_for_update()
+  # Fetch the cart joined to its products in one query, locking only the user's cart rows;
+  # stock is taken with conditional updates, so product rows are never held locked
+  stmt = (
+    select(CartItem.product_id, CartItem.quantity, CartItem.price, Product.price.label("product_price"))
+    .join(Product, Product.id == CartItem.product_id)
+    .where(CartItem.user_id == user_id)
+    .with_for_update(of=CartItem)
+  )
 
   result = await session.execute(stmt)
-  cart_items = result.scalars().all()
+  cart_rows = result.all()
 
   # If no items found, cart is empty → checkout not possible
-  if not cart_items:
+  if not cart_rows:
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cart is empty")
   
   # Track total cost
   total_price = Decimal("0.0")  
-  # Will store OrderItem instances for bulk add    
-  order_items: list[OrderItem] = [] 
+  # Quantity per product, used for the bulk stock update and the order items
+  quantities: dict[int, int] = {}
+  prices: dict[int, float] = {}
 
   # Validate each cart item
-  for item in cart_items:
-    if not item.product:
-      # Skip if product no longer exists (rare case)
-      continue
-
-    # Check stock availability
-    if item.product.stock_quantity < item.quantity:
-      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Insufficient stock")
-    
+  for row in cart_rows:
     # Ensure price consistency (prevents price manipulation on frontend)
-    if item.product.price != item.price:
+    if row.product_price != row.price:
       raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Price mismatch")
+
+    quantities[row.product_id] = quantities.get(row.product_id, 0) + row.quantity
+    prices[row.product_id] = row.price
     
     # Add to total price (Decimal used to prevent floating point errors)
-    total_price += Decimal(str(item.price)) * item.quantity
-
-    # Prepare OrderItem entry for this product
-    order_items.append(OrderItem(
-      product_id = item.product_id,
-      quantity = item.quantity,
-      price = item.price
-    ))
+    total_price += Decimal(str(row.price)) * row.quantity
 
   # Check that payment amount matches cart total (allowing 0.01 difference due to float precision)
   if abs(total_price - Decimal(str(payment_data.amount))) > Decimal("0.01"):
@@ -63,56 +72,49 @@ async def checkout(
   if not address or address.user_id != user_id:
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid shipping address")
   
-  # Create new Order (status will be updated after payment success)
+  # Create new Order; it stays pending until the payment worker settles the payment
   order = Order(
     user_id = user_id,
     total_price = float(total_price),
-    shipping_address_id = payment_data.shipping_address_id
+    shipping_address_id = payment_data.shipping_address_id,
+    status = OrderStatusEnum.pending
   )
   session.add(order)
   # Ensure order.id is generated before creating payment
   await session.flush()
 
-  # Process payment
+  # Record a pending payment (flushed only, it commits together with the order);
+  # the gateway is called after commit, so its latency never holds the cart locks
   payment = await create_payment(
     session = session,
     data = payment_data,
     user_id=user_id,
     order_id=order.id
   )
-
-  # If payment fails, rollback transaction and abort checkout
-  if not payment.is_paid:
-    await session.rollback()
-    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Payment failed")
   
-  # Update order status to confirmed after payment
-  order.status = OrderStatusEnum.confirmed
-  session.add(order)
-
-  # Create shipping status entry (starts as pending)
-  shipping_status = ShippingStatus(
-    order_id = order.id,
-    status = ShippingStatusEnum.pending
-  )
-  session.add(shipping_status)
+  # Turn the cart's stock holds into the sale (raises Insufficient stock if an expired hold can't be renewed);
+  # a failed payment puts the stock back
+  try: 
+    await commit_reservations(session, user_id, quantities)
+  except InsufficientStock: 
+    # drops the order and payment flushed above
+    await session.rollback()
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient stock")
 
-  # Add order items to DB and update product stock
-  for oi in order_items:
-    oi.order_id = order.id
-    session.add(oi)
-    # Reduce stock quantity for each product
-    product = await session.get(Product, oi.product_id)
-    if product:
-      product.stock_quantity -= oi.quantity
+  # Add all order items in a single bulk insert
+  await session.execute(insert(OrderItem), [
+    {"order_id": order.id, "product_id": product_id, "quantity": quantity, "price": prices[product_id]}
+    for product_id, quantity in quantities.items()
+  ])
 
   # Clear the user's cart
-  for item in cart_items:
-    await session.delete(item)
+  await session.execute(delete(CartItem).where(CartItem.user_id == user_id))
 
-  # Commit all changes to the database
+  # Commit all changes to the database, this releases the cart row locks
   await session.commit()
-  await session.refresh(order)
+
+  # Charge in the background; the order turns confirmed or cancelled when it settles
+  payment_worker.submit(payment.id)
 
   # Fetch the order again with related entities (items, address, shipping)
   stmt = (
@@ -123,20 +125,56 @@ async def checkout(
       selectinload(Order.shipping_address),
       selectinload(Order.shipping_status),
       )
+    .execution_options(populate_existing=True)
   )
 
   result = await session.execute(stmt)
   return result.scalar_one()
 
-async def get_placed_order_for_user(session: AsyncSession, user_id: int):
-  stmt = (select(Order)
-          .where(Order.user_id == user_id)
-          .options(
-            selectinload(Order.orderitems),
-            selectinload(Order.orderitems).selectinload(OrderItem.product))
-          )
+def _seek_newest_first(stmt: Select, cursor: str | None) -> Select:
+  # newest first, seeking past the last (created_at, id) seen instead of using OFFSET
+  if cursor:
+    data = decode_cursor(cursor)
+    try:
+      created_at, last_id = datetime.fromisoformat(data["v"]), int(data["id"])
+    except (KeyError, TypeError, ValueError):
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    stmt = apply_keyset(stmt, Order.created_at, Order.id, created_at, last_id, forward=True, descending=True)
+
+  return stmt.order_by(*keyset_order(Order.created_at, Order.id, forward=True, descending=True))
+
+
+def _next_cursor(rows: list, limit: int) -> tuple[list, str | None]:
+  if len(rows) <= limit:
+    return rows, None
+  rows = rows[:limit]
+  return rows, encode_cursor({"v": rows[-1].created_at, "id": rows[-1].id})
+
+
+async def get_placed_order_for_user(
+    session: AsyncSession,
+    user_id: int,
+    limit: int = 20,
+    cursor: str | None = None
+) -> dict:
+  # summary rows only, item count is aggregated in SQL; details load per order
+  stmt = (
+    select(
+      Order.id,
+      Order.total_price,
+      Order.status,
+      func.coalesce(func.sum(OrderItem.quantity), 0).label("item_count"),
+      Order.created_at
+    )
+    .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+    .where(Order.user_id == user_id)
+    .group_by(Order.id)
+  )
+  stmt = _seek_newest_first(stmt, cursor).limit(limit + 1)
+
   result = await session.execute(stmt)
-  return result.scalars().all()
+  rows, next_cursor = _next_cursor(list(result.all()), limit)
+  return {"items": rows, "limit": limit, "next_cursor": next_cursor}
 
 async def get_order_by_id(
     session: AsyncSession,
@@ -145,7 +183,10 @@ async def get_order_by_id(
 ):
   stmt = (select(Order)
           .where(Order.id == order_id, Order.user_id == user_id)
-          .options(selectinload(Order.orderitems)))
+          .options(
+            selectinload(Order.orderitems).selectinload(OrderItem.product),
+            selectinload(Order.shipping_address),
+            selectinload(Order.shipping_status)))
   result = await session.execute(stmt)
   return result.scalar_one_or_none()
 
@@ -158,6 +199,24 @@ async def cancel_order(
 
   if not order:
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+
+  if order.status == OrderStatusEnum.pending:
+    # not charged yet: cancel the payment before a worker claims it, then give the stock back
+    result = await session.execute(
+      update(Payment)
+      .where(Payment.order_id == order.id, Payment.status == PaymentStatusEnum.pending)
+      .values(status=PaymentStatusEnum.cancelled)
+      .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+      await session.rollback()
+      raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="The payment is being processed, try again shortly")
+
+    transition(order, OrderStatusEnum.cancelled, ORDER_TRANSITIONS)
+    await restock_order(session, order.id)
+    await session.commit()
+    await session.refresh(order)
+    return order
   
   if not order.shipping_status or order.shipping_status.status != ShippingStatusEnum.pending:
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only orders with pending shipping status can be cancelled")
@@ -168,26 +227,103 @@ async def cancel_order(
   await session.refresh(order)
   return order
 
+def _admin_order_filters(
+    stmt: Select,
+    shipping_status: str | None = None,
+    user_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None
+) -> Select:
+  stmt = stmt.where(Order.status == OrderStatusEnum.confirmed)
+
+  # Filter by user if provided
+  if user_id:
+    stmt = stmt.where(Order.user_id == user_id)
+
+  # Filter by order date if provided (date_to is exclusive)
+  if date_from:
+    stmt = stmt.where(Order.created_at >= date_from)
+  if date_to:
+    stmt = stmt.where(Order.created_at < date_to)
+
+  # Filter by shipping status if provided
+  if shipping_status:
+    stmt = stmt.join(Order.shipping_status).where(ShippingStatus.status == shipping_status)
+
+  return stmt
+
+
 async def all_placed_order(
     session: AsyncSession,
     shipping_status: str | None = None,
-    user_id: int | None = None
-):
-    stmt = select(Order).where(Order.status == OrderStatusEnum.confirmed).options(
+    user_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    limit: int = 50,
+    cursor: str | None = None
+) -> dict:
+    stmt = select(Order).options(
         selectinload(Order.orderitems).selectinload(OrderItem.product),
         selectinload(Order.shipping_status)
     )
+    stmt = _admin_order_filters(stmt, shipping_status, user_id, date_from, date_to)
 
-    # Filter by user if provided
-    if user_id:
-        stmt = stmt.where(Order.user_id == user_id)
-
-    # Filter by shipping status if provided
-    if shipping_status:
-        stmt = stmt.join(Order.shipping_status).where(ShippingStatus.status == shipping_status)
+    stmt = _seek_newest_first(stmt, cursor).limit(limit + 1)
 
     result = await session.execute(stmt)
-    return result.scalars().all()
+    orders, next_cursor = _next_cursor(list(result.scalars().all()), limit)
+
+    return {"items": orders, "limit": limit, "next_cursor": next_cursor}
+
+
+EXPORT_COLUMNS = ("id", "user_id", "total_price", "status", "shipping_status", "created_at")
+
+
+async def export_placed_orders(
+    export_format: str,
+    shipping_status: str | None = None,
+    user_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None
+) -> AsyncGenerator[str, None]:
+  # flat rows read through a server-side cursor in batches, so memory stays constant
+  # however many orders match; uses its own session because it outlives the request handler
+  stmt = (
+    select(
+      Order.id,
+      Order.user_id,
+      Order.total_price,
+      Order.status,
+      ShippingStatus.status.label("shipping_status"),
+      Order.created_at
+    )
+    .outerjoin(ShippingStatus, ShippingStatus.order_id == Order.id)
+    .order_by(Order.id)
+  )
+  stmt = _admin_order_filters(stmt, None, user_id, date_from, date_to)
+  if shipping_status:
+    stmt = stmt.where(ShippingStatus.status == shipping_status)
 
+  if export_format == "csv":
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
 
+  maker = await read_sessionmaker()
+  async with maker() as session:
+    result = await session.stream(stmt.execution_options(yield_per=ORDER_EXPORT_BATCH_SIZE))
+    async for rows in result.partitions():
+      records = [
+        (row.id, row.user_id, row.total_price, row.status.value,
+         row.shipping_status.value if row.shipping_status else None, row.created_at.isoformat())
+        for row in rows
+      ]
 
+      if export_format == "csv":
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(records)
+        yield buffer.getvalue()
+      else:
+        yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, record))) + "\n" for record in records)
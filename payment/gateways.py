@@ -0,0 +1,122 @@
+"""Payment gateways the payment worker charges through.
+
+A gateway only talks to the provider; it never touches the database. Charges are keyed
+by the payment's pg_order_id, so charging the same payment twice (a retry, or a
+payment recovered after its worker's lease ran out) is answered with the first result.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+import httpx
+from decouple import config
+from payment.models import PaymentGatewayEnum
+from payment.utils import generate_mock_ids
+
+# when set, the mock gateway is the HTTP server in payment/mock_gateway.py instead of in-process
+PAYMENT_MOCK_GATEWAY_URL = config("PAYMENT_MOCK_GATEWAY_URL", default="")
+PAYMENT_MOCK_LATENCY_MS = config("PAYMENT_MOCK_LATENCY_MS", default=0, cast=int)
+# outcome for mock charges whose checkout did not set simulate_success
+PAYMENT_MOCK_DEFAULT_SUCCESS = config("PAYMENT_MOCK_DEFAULT_SUCCESS", default=False, cast=bool)
+PAYMENT_GATEWAY_TIMEOUT_SEC = config("PAYMENT_GATEWAY_TIMEOUT_SEC", default=10, cast=float)
+
+
+@dataclass(frozen=True)
+class ChargeRequest: 
+  payment_id: int
+  order_id: int
+  amount: int
+  pg_order_id: str
+  simulate_success: bool | None = None
+
+
+@dataclass(frozen=True)
+class ChargeResult: 
+  success: bool
+  pg_payment_id: str | None = None
+  pg_signature: str | None = None
+  reason: str | None = None
+
+
+class GatewayError(Exception): 
+  # the gateway could not be reached or gave no answer; the charge may be retried
+  pass
+
+
+class PaymentGateway(ABC): 
+  @abstractmethod
+  async def charge(self, request: ChargeRequest) -> ChargeResult: ...
+
+  async def close(self) -> None: 
+    pass
+
+
+class MockGateway(PaymentGateway): 
+  def __init__(self, latency_ms: int = 0): 
+    self.latency_ms = latency_ms
+    self._results: dict[str, ChargeResult] = {}
+
+  async def charge(self, request): 
+    if request.pg_order_id in self._results: 
+      return self._results[request.pg_order_id]
+
+    if self.latency_ms: 
+      await asyncio.sleep(self.latency_ms / 1000)
+
+    success = request.simulate_success if request.simulate_success is not None else PAYMENT_MOCK_DEFAULT_SUCCESS
+    _, pg_payment_id, pg_signature = generate_mock_ids()
+    result = (
+      ChargeResult(success=True, pg_payment_id=pg_payment_id, pg_signature=pg_signature)
+      if success else ChargeResult(success=False, reason="declined")
+    )
+    self._results[request.pg_order_id] = result
+    return result
+
+
+class HttpGateway(PaymentGateway): 
+  def __init__(self, base_url: str, timeout: float = PAYMENT_GATEWAY_TIMEOUT_SEC): 
+    self.base_url = base_url
+    self.timeout = timeout
+    self._client: httpx.AsyncClient | None = None
+
+  async def charge(self, request): 
+    if self._client is None: 
+      self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+
+    try: 
+      response = await self._client.post("/charges", json={
+        "pg_order_id": request.pg_order_id,
+        "amount": request.amount,
+        "simulate_success": request.simulate_success,
+      })
+      response.raise_for_status()
+    except httpx.HTTPError as exc: 
+      raise GatewayError(str(exc)) from exc
+
+    data = response.json()
+    return ChargeResult(
+      success=data["status"] == "success",
+      pg_payment_id=data.get("pg_payment_id"),
+      pg_signature=data.get("pg_signature"),
+      reason=data.get("reason"),
+    )
+
+  async def close(self): 
+    if self._client is not None: 
+      await self._client.aclose()
+      self._client = None
+
+
+def _mock_gateway() -> PaymentGateway: 
+  if PAYMENT_MOCK_GATEWAY_URL: 
+    return HttpGateway(PAYMENT_MOCK_GATEWAY_URL)
+  return MockGateway(PAYMENT_MOCK_LATENCY_MS)
+
+
+# razorpay gets its entry here once it is integrated
+GATEWAYS: dict[PaymentGatewayEnum, PaymentGateway] = {
+  PaymentGatewayEnum.mock: _mock_gateway(),
+}
+
+
+def get_gateway(gateway: PaymentGatewayEnum) -> PaymentGateway | None: 
+  return GATEWAYS.get(gateway)
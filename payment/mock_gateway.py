@@ -0,0 +1,48 @@
+"""A stand-alone fake payment provider for local runs and tests.
+
+  uvicorn payment.mock_gateway:app --port 8001
+  PAYMENT_MOCK_GATEWAY_URL=http://127.0.0.1:8001
+
+POST /charges answers like a real gateway would, after `latency_ms` (per request, or
+PAYMENT_MOCK_LATENCY_MS), and returns the stored result when a pg_order_id is charged again.
+"""
+import asyncio
+from fastapi import FastAPI
+from pydantic import BaseModel
+from payment.gateways import PAYMENT_MOCK_LATENCY_MS, PAYMENT_MOCK_DEFAULT_SUCCESS
+from payment.utils import generate_mock_ids
+
+app = FastAPI(title="mock payment gateway")
+
+_charges: dict[str, dict] = {}
+
+
+class ChargeIn(BaseModel): 
+  pg_order_id: str
+  amount: int
+  simulate_success: bool | None = None
+
+
+@app.post("/charges")
+async def create_charge(data: ChargeIn, latency_ms: int | None = None): 
+  if data.pg_order_id in _charges: 
+    return _charges[data.pg_order_id]
+
+  delay = PAYMENT_MOCK_LATENCY_MS if latency_ms is None else latency_ms
+  if delay: 
+    await asyncio.sleep(delay / 1000)
+
+  success = data.simulate_success if data.simulate_success is not None else PAYMENT_MOCK_DEFAULT_SUCCESS
+  if success: 
+    _, pg_payment_id, pg_signature = generate_mock_ids()
+    charge = {"status": "success", "pg_payment_id": pg_payment_id, "pg_signature": pg_signature}
+  else: 
+    charge = {"status": "failed", "reason": "declined"}
+
+  _charges[data.pg_order_id] = charge
+  return charge
+
+
+@app.get("/charges/{pg_order_id}")
+async def get_charge(pg_order_id: str): 
+  return _charges.get(pg_order_id, {"status": "unknown"})
@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import Boolean, ForeignKey, DateTime, Enum, String
+from sqlalchemy import Boolean, ForeignKey, DateTime, Enum, Index, String
 from db.base import Base
 from typing import TYPE_CHECKING
 from enum import Enum as PyEnum
@@ -11,6 +11,8 @@ if TYPE_CHECKING:
 
 class PaymentStatusEnum(str, PyEnum):
   pending = "pending"
+  # claimed by a payment worker that is charging it, until lease_expires_at
+  processing = "processing"
   success = "success"
   failed = "failed"
   cancelled = "cancelled"
@@ -33,12 +35,23 @@ class Payment(Base):
     pg_order_id: Mapped[str | None] = mapped_column(String(100), nullable=True)
     pg_payment_id: Mapped[str | None] = mapped_column(String(100), nullable=True)
     pg_signature: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # outcome asked for at checkout (mock gateway), so a recovered payment is charged the same way
+    simulate_success: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
+    # which payment worker holds a processing payment, and until when
+    lease_owner: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    lease_expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc),onupdate=lambda: datetime.now(timezone.utc))
 
     order: Mapped["Order"] = relationship("Order", back_populates="payment")
     user: Mapped["User"] = relationship("User", back_populates="payments")
+
+    __table_args__ = (
+        Index("ix_payments_user_id", "user_id"),
+        # unclaimed and expired payments are found by status
+        Index("ix_payments_status", "status"),
+    )
     
 
     
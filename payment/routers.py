@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from db.config import session
-from account.models import User
+from db.replicas import read_session
+from account.cache import AuthUser
 from account.dependency import get_current_user
 from payment.schemas import PaymentOut
 from payment.services import get_payment_by_order_id, list_payments_by_user
@@ -9,9 +9,9 @@ router = APIRouter()
 
 @router.get("/{order_id}", response_model=PaymentOut)
 async def get_payment_status_by_order(
-  session: session,
+  session: read_session,
   order_id: int,
-  user: User = Depends(get_current_user)
+  user: AuthUser = Depends(get_current_user)
 ):
   payment = await get_payment_by_order_id(session, order_id, user.id)
   if not payment:
@@ -20,8 +20,8 @@ async def get_payment_status_by_order(
 
 @router.get("", response_model=list[PaymentOut])
 async def get_all_payments_by_user(
-  session: session,
-  user: User = Depends(get_current_user)
+  session: read_session,
+  user: AuthUser = Depends(get_current_user)
 ):
   payments =  await list_payments_by_user(session, user.id)
   return payments
\ No newline at end of file
@@ -4,6 +4,7 @@ from fastapi import HTTPException, status
 from payment.models import Payment, PaymentGatewayEnum, PaymentStatusEnum
 from payment.schemas import PaymentCreate
 from payment.utils import generate_mock_ids
+from payment.gateways import get_gateway
 
 # This function will be used in order/services.py - checkout
 async def create_payment(
@@ -16,35 +17,27 @@ async def create_payment(
   # Convert the provided gateway string into a PaymentGatewayEnum instance
   gateway = PaymentGatewayEnum(data.gateway)
 
-  # Handle payments based on the selected gateway
-  if gateway == PaymentGatewayEnum.mock:
-    is_success = data.simulate_success
-    payment_status = PaymentStatusEnum.success if is_success else PaymentStatusEnum.failed
-    pg_order_id, pg_payment_id, pg_signature = generate_mock_ids()
-
-  elif gateway == PaymentGatewayEnum.razorpay:
-    # Razorpay integration will be implemented here in the future
-    pass
-
-  else:
+  # Only gateways with an integration can take payments (razorpay is not wired up yet)
+  if get_gateway(gateway) is None:
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported payment gateway")
   
-  # Create a Payment model instance with the collected data
+  # The payment starts pending, the payment worker charges it after checkout commits;
+  # pg_order_id is the gateway-side key that makes charging it more than once safe
+  pg_order_id, _, _ = generate_mock_ids()
   payment = Payment(
     order_id=order_id,
     user_id=user_id,
     amount=data.amount,
-    status=payment_status,
-    is_paid = (payment_status == PaymentStatusEnum.success),
+    status=PaymentStatusEnum.pending,
+    is_paid=False,
     payment_gateway=gateway,
     pg_order_id=pg_order_id,
-    pg_payment_id=pg_payment_id,
-    pg_signature=pg_signature,
+    simulate_success=data.simulate_success,
   )
 
+  # flush only, the caller owns the transaction
   session.add(payment)
-  await session.commit()
-  await session.refresh(payment)
+  await session.flush()
   return payment
 
 async def get_payment_by_order_id(
@@ -0,0 +1,29 @@
+from order.models import OrderStatusEnum
+from payment.models import PaymentStatusEnum
+
+# allowed status changes; anything else is a bug or a race lost to another worker
+ORDER_TRANSITIONS: dict[OrderStatusEnum, set[OrderStatusEnum]] = {
+  OrderStatusEnum.pending: {OrderStatusEnum.confirmed, OrderStatusEnum.cancelled},
+  OrderStatusEnum.confirmed: {OrderStatusEnum.cancelled},
+  OrderStatusEnum.cancelled: set(),
+}
+
+PAYMENT_TRANSITIONS: dict[PaymentStatusEnum, set[PaymentStatusEnum]] = {
+  # pending -> processing is the worker's conditional claim UPDATE, see payment/worker.py;
+  # pending -> cancelled is cancel_order's, so only one of the two wins
+  PaymentStatusEnum.pending: {PaymentStatusEnum.processing, PaymentStatusEnum.cancelled},
+  PaymentStatusEnum.processing: {PaymentStatusEnum.success, PaymentStatusEnum.failed},
+  PaymentStatusEnum.success: set(),
+  PaymentStatusEnum.failed: set(),
+  PaymentStatusEnum.cancelled: set(),
+}
+
+
+class InvalidTransition(Exception): 
+  pass
+
+
+def transition(obj, new_status, transitions: dict) -> None: 
+  if new_status not in transitions[obj.status]: 
+    raise InvalidTransition(f"{type(obj).__name__} {obj.id}: {obj.status.value} -> {new_status.value}")
+  obj.status = new_status
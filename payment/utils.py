@@ -2,8 +2,8 @@ import uuid
 
 def generate_mock_ids() -> tuple[str, str, str]:
   rand = lambda: uuid.uuid4().hex[:8].upper()
-  return {
+  return (
     f"MOCK-OD-{rand()}",
     f"MOCK-PY-{rand()}",
     f"MOCK-SI-{rand()}",
-  }
\ No newline at end of file
+  )
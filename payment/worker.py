@@ -0,0 +1,216 @@
+"""Background payment processing.
+
+Checkout commits the order as pending with a pending payment and hands the payment id
+to this worker, so no cart or order lock is held while the gateway is called. The worker
+first claims the payment with one conditional UPDATE (pending -> processing, with its
+own name and a lease of PAYMENT_LEASE_SEC), charges the gateway outside any transaction,
+then settles the result in a short one:
+
+  success  payment success, order confirmed, shipping status pending
+  failure  payment failed, order cancelled, its stock put back
+
+An order can be cancelled while its payment is still pending (order.services.cancel_order
+takes pending -> cancelled with the same kind of conditional UPDATE), never once a
+worker has claimed it.
+
+Only the worker still holding the claim can settle, so two workers never settle the
+same payment. Every PAYMENT_RECOVERY_INTERVAL_SEC each worker re-queues payments nobody
+claimed (e.g. the process died between checkout and submit) and claims whose lease ran
+out (the worker died mid-charge); charges are keyed by pg_order_id, so the gateway
+answers a repeated charge with the first result.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+from decouple import config
+from sqlalchemy import select, update, or_, and_
+from db.config import async_session
+from inventory.services import restock_order
+from order.models import Order, OrderStatusEnum
+from payment.gateways import ChargeRequest, ChargeResult, GatewayError, GATEWAYS, get_gateway
+from payment.models import Payment, PaymentStatusEnum
+from payment.state import ORDER_TRANSITIONS, PAYMENT_TRANSITIONS, InvalidTransition, transition
+from shipping.models import ShippingStatus, ShippingStatusEnum
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_WORKERS = config("PAYMENT_WORKERS", default=4, cast=int)
+PAYMENT_MAX_ATTEMPTS = config("PAYMENT_MAX_ATTEMPTS", default=3, cast=int)
+PAYMENT_RETRY_BACKOFF_SEC = config("PAYMENT_RETRY_BACKOFF_SEC", default=1.0, cast=float)
+# must outlast every attempt and backoff of one charge, or another worker may take it over
+PAYMENT_LEASE_SEC = config("PAYMENT_LEASE_SEC", default=120, cast=int)
+PAYMENT_RECOVERY_INTERVAL_SEC = config("PAYMENT_RECOVERY_INTERVAL_SEC", default=60, cast=int)
+
+
+class PaymentWorker: 
+  def __init__(self, workers: int, lease: int = PAYMENT_LEASE_SEC): 
+    self.workers = workers
+    self.lease = lease
+    # names this process in lease_owner
+    self.name = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[-64:]
+    self._queue: asyncio.Queue[int] = asyncio.Queue()
+
+    self.succeeded = 0
+    self.failed = 0
+    self.errors = 0
+
+  def submit(self, payment_id: int) -> None: 
+    self._queue.put_nowait(payment_id)
+
+  async def _charge(self, request: ChargeRequest, gateway) -> ChargeResult: 
+    for attempt in range(1, PAYMENT_MAX_ATTEMPTS + 1): 
+      try: 
+        return await gateway.charge(request)
+      except GatewayError: 
+        if attempt == PAYMENT_MAX_ATTEMPTS: 
+          raise
+        logger.warning("charging payment %s failed (attempt %s), retrying", request.payment_id, attempt)
+        await asyncio.sleep(PAYMENT_RETRY_BACKOFF_SEC * 2 ** (attempt - 1))
+
+  async def claim(self, payment_id: int) -> Payment | None: 
+    # pending, or processing under a lease that ran out; rowcount tells whether we won
+    now = datetime.now(timezone.utc)
+    async with async_session() as session: 
+      result = await session.execute(
+        update(Payment)
+        .where(
+          Payment.id == payment_id,
+          or_(
+            Payment.status == PaymentStatusEnum.pending,
+            and_(Payment.status == PaymentStatusEnum.processing, Payment.lease_expires_at < now),
+          )
+        )
+        .values(
+          status=PaymentStatusEnum.processing,
+          lease_owner=self.name,
+          lease_expires_at=now + timedelta(seconds=self.lease)
+        )
+        .execution_options(synchronize_session=False)
+      )
+      await session.commit()
+      if result.rowcount != 1: 
+        return None
+      return await session.get(Payment, payment_id)
+
+  async def process(self, payment_id: int) -> None: 
+    # no transaction is open while the gateway is called
+    payment = await self.claim(payment_id)
+    if payment is None: 
+      return
+
+    gateway = get_gateway(payment.payment_gateway)
+    request = ChargeRequest(
+      payment_id=payment.id,
+      order_id=payment.order_id,
+      amount=payment.amount,
+      pg_order_id=payment.pg_order_id,
+      simulate_success=payment.simulate_success
+    )
+    try: 
+      result = await self._charge(request, gateway) if gateway else ChargeResult(success=False, reason="unsupported gateway")
+    except GatewayError as exc: 
+      result = ChargeResult(success=False, reason=f"gateway unavailable: {exc}")
+
+    await self.settle(payment_id, result)
+
+  async def settle(self, payment_id: int, result: ChargeResult) -> None: 
+    async with async_session() as session: 
+      payment = (await session.execute(
+        select(Payment).where(Payment.id == payment_id).with_for_update()
+      )).scalar_one_or_none()
+      order = (await session.execute(
+        select(Order).where(Order.id == payment.order_id).with_for_update()
+      )).scalar_one_or_none() if payment else None
+
+      # our lease ran out and another worker took the payment over (or already settled it)
+      if payment is None or order is None or payment.status != PaymentStatusEnum.processing or payment.lease_owner != self.name: 
+        logger.warning("payment %s is no longer claimed by this worker, dropping its result", payment_id)
+        return
+
+      payment.lease_owner = None
+      payment.lease_expires_at = None
+      try: 
+        if result.success: 
+          transition(payment, PaymentStatusEnum.success, PAYMENT_TRANSITIONS)
+          transition(order, OrderStatusEnum.confirmed, ORDER_TRANSITIONS)
+          payment.is_paid = True
+          payment.pg_payment_id = result.pg_payment_id
+          payment.pg_signature = result.pg_signature
+          session.add(ShippingStatus(order_id=order.id, status=ShippingStatusEnum.pending))
+        else: 
+          transition(payment, PaymentStatusEnum.failed, PAYMENT_TRANSITIONS)
+          transition(order, OrderStatusEnum.cancelled, ORDER_TRANSITIONS)
+          # the stock was taken at checkout, give it back
+          await restock_order(session, order.id)
+      except InvalidTransition: 
+        logger.exception("settling payment %s", payment_id)
+        await session.rollback()
+        return
+
+      await session.commit()
+
+    if result.success: 
+      self.succeeded += 1
+    else: 
+      self.failed += 1
+      logger.info("payment %s failed: %s", payment_id, result.reason)
+
+  async def recover(self) -> int: 
+    # payments left unclaimed for a whole lease, and claims whose lease ran out; process()
+    # claims atomically, so every worker may queue the same ids and only one charges each
+    now = datetime.now(timezone.utc)
+    async with async_session() as session: 
+      result = await session.execute(
+        select(Payment.id)
+        .where(or_(
+          and_(Payment.status == PaymentStatusEnum.pending, Payment.created_at < now - timedelta(seconds=self.lease)),
+          and_(Payment.status == PaymentStatusEnum.processing, Payment.lease_expires_at < now),
+        ))
+        .order_by(Payment.id)
+      )
+      payment_ids = list(result.scalars().all())
+
+    for payment_id in payment_ids: 
+      self.submit(payment_id)
+    if payment_ids: 
+      logger.info("re-queued %s unclaimed or expired payments", len(payment_ids))
+    return len(payment_ids)
+
+  async def run_recovery(self, interval: int = PAYMENT_RECOVERY_INTERVAL_SEC) -> None: 
+    while True: 
+      try: 
+        await self.recover()
+      except asyncio.CancelledError: 
+        raise
+      except Exception: 
+        logger.exception("recovering payments failed")
+      await asyncio.sleep(interval)
+
+  async def _worker(self) -> None: 
+    while True: 
+      payment_id = await self._queue.get()
+      try: 
+        await self.process(payment_id)
+      except Exception: 
+        self.errors += 1
+        logger.exception("processing payment %s failed", payment_id)
+      finally: 
+        self._queue.task_done()
+
+  def start(self) -> list[asyncio.Task]: 
+    tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    tasks.append(asyncio.create_task(self.run_recovery()))
+    return tasks
+
+  async def shutdown(self) -> None: 
+    for gateway in GATEWAYS.values(): 
+      await gateway.close()
+
+  def metrics(self) -> dict: 
+    return {"queued": self._queue.qsize(), "succeeded": self.succeeded, "failed": self.failed, "errors": self.errors}
+
+
+payment_worker = PaymentWorker(PAYMENT_WORKERS)
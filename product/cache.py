@@ -0,0 +1,257 @@
+"""Read-through cache for catalog reads (categories, product lists, product pages).
+
+Entries hold the JSON-ready payload the router returns. Every entry is tagged
+("products", "categories") and the current version of each tag is part of its key,
+so invalidating a tag just bumps its version and the stale entries age out.
+
+Tag versions must be seen by every worker, otherwise an edit only invalidates the
+worker that made it: with WEB_CONCURRENCY > 1 the cache needs a real shared backend
+("redis") and refuses to start without one. The check only sees WEB_CONCURRENCY, which
+`uvicorn --workers N` and `gunicorn -w N` do not set: run several workers with
+WEB_CONCURRENCY=N in the environment (both servers read it as their worker count when
+the flag is left out), or set PRODUCT_CACHE_SHARED_BACKEND=redis yourself. Stock changes on every cart update: product
+lists show it as of the cached entry (at most PRODUCT_CACHE_TTL_SEC old), the product
+page overlays it from a live read.
+"""
+import asyncio
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from decouple import config
+
+try:
+  from redis import asyncio as redis
+except ImportError:
+  redis = None
+
+PRODUCT_CACHE_ENABLED = config("PRODUCT_CACHE_ENABLED", default=True, cast=bool)
+PRODUCT_CACHE_TTL_SEC = config("PRODUCT_CACHE_TTL_SEC", default=30, cast=int)
+PRODUCT_CACHE_SIZE = config("PRODUCT_CACHE_SIZE", default=2048, cast=int)
+# "" keeps the cache per process, "memory" uses the in-memory shared backend stand-in
+# (also per process), "redis" shares entries and tag versions through PRODUCT_CACHE_REDIS_URL
+PRODUCT_CACHE_SHARED_BACKEND = config("PRODUCT_CACHE_SHARED_BACKEND", default="")
+PRODUCT_CACHE_REDIS_URL = config("PRODUCT_CACHE_REDIS_URL", default="redis://localhost:6379/0")
+# worker processes serving the app; must be set for multi-worker runs, the --workers/-w
+# flags of uvicorn and gunicorn are invisible here (both read this variable instead of the flag)
+WEB_CONCURRENCY = config("WEB_CONCURRENCY", default=1, cast=int)
+
+_MISSING = object()
+
+
+class LRUCache:
+  def __init__(self, maxsize: int, ttl: int):
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+  def get(self, key: str) -> Any:
+    entry = self._entries.get(key)
+    if entry is None:
+      return _MISSING
+
+    expires_at, value = entry
+    if expires_at < time.monotonic():
+      del self._entries[key]
+      return _MISSING
+
+    self._entries.move_to_end(key)
+    return value
+
+  def set(self, key: str, value: Any) -> None:
+    self._entries[key] = (time.monotonic() + self.ttl, value)
+    self._entries.move_to_end(key)
+    while len(self._entries) > self.maxsize:
+      self._entries.popitem(last=False)
+
+  def clear(self) -> None:
+    self._entries.clear()
+
+
+class SharedCacheBackend(ABC):
+  """A cache shared by all workers, e.g. Redis or memcached."""
+
+  @abstractmethod
+  async def get(self, key: str) -> bytes | None: ...
+
+  @abstractmethod
+  async def set(self, key: str, value: bytes, ttl: int) -> None: ...
+
+  @abstractmethod
+  async def incr(self, key: str) -> int: ...
+
+  @abstractmethod
+  async def counters(self, keys: list[str]) -> list[int]:
+    """Current values of several counters (0 when unset), in one round trip."""
+
+
+class InMemorySharedBackend(SharedCacheBackend):
+  """Stand-in for a shared backend in tests and local runs."""
+
+  def __init__(self):
+    self._values: dict[str, tuple[float | None, bytes]] = {}
+    self._counters: dict[str, int] = {}
+
+  async def get(self, key):
+    entry = self._values.get(key)
+    if entry is None:
+      return None
+    expires_at, value = entry
+    if expires_at is not None and expires_at < time.monotonic():
+      del self._values[key]
+      return None
+    return value
+
+  async def set(self, key, value, ttl):
+    self._values[key] = (time.monotonic() + ttl, value)
+
+  async def incr(self, key):
+    self._counters[key] = self._counters.get(key, 0) + 1
+    return self._counters[key]
+
+  async def counters(self, keys):
+    return [self._counters.get(key, 0) for key in keys]
+
+
+class RedisSharedBackend(SharedCacheBackend):
+  def __init__(self, url: str):
+    self._client = redis.from_url(url)
+
+  async def get(self, key):
+    return await self._client.get(key)
+
+  async def set(self, key, value, ttl):
+    await self._client.set(key, value, ex=ttl)
+
+  async def incr(self, key):
+    return await self._client.incr(key)
+
+  async def counters(self, keys):
+    values = await self._client.mget(keys)
+    return [int(value) if value is not None else 0 for value in values]
+
+
+class ReadThroughCache:
+  def __init__(self, local: LRUCache, shared: SharedCacheBackend | None = None, enabled: bool = True):
+    self.local = local
+    self.shared = shared
+    self.enabled = enabled
+    self._tag_versions: dict[str, int] = {}
+    self._inflight: dict[str, asyncio.Future] = {}
+
+    self.hits = 0
+    self.misses = 0
+    self.coalesced = 0
+    self.invalidations = 0
+
+  async def _versions(self, tags: tuple[str, ...]) -> str:
+    if self.shared is not None:
+      versions = await self.shared.counters([f"tag:{tag}" for tag in tags])
+    else:
+      versions = [self._tag_versions.get(tag, 0) for tag in tags]
+    return ",".join(f"{tag}={version}" for tag, version in zip(tags, versions))
+
+  async def get_or_load(self, key: str, tags: tuple[str, ...], loader: Callable[[], Awaitable[Any]]) -> Any:
+    if not self.enabled:
+      return await loader()
+
+    full_key = f"{key}|{await self._versions(tags)}"
+
+    value = self.local.get(full_key)
+    if value is not _MISSING:
+      self.hits += 1
+      return value
+
+    if self.shared is not None:
+      raw = await self.shared.get(full_key)
+      if raw is not None:
+        self.hits += 1
+        value = json.loads(raw)
+        self.local.set(full_key, value)
+        return value
+
+    # single flight: concurrent misses for the same key wait on the first load
+    while (pending := self._inflight.get(full_key)) is not None:
+      self.coalesced += 1
+      try:
+        return await asyncio.shield(pending)
+      except asyncio.CancelledError:
+        # only the loading request was cancelled, not this one: load (or wait) again
+        if not pending.cancelled() or asyncio.current_task().cancelling():
+          raise
+
+    self.misses += 1
+    future = asyncio.get_running_loop().create_future()
+    self._inflight[full_key] = future
+    try:
+      value = await loader()
+    except Exception as exc:
+      future.set_exception(exc)
+      # mark it retrieved, nobody may be waiting on it
+      future.exception()
+      raise
+    except BaseException:
+      # the loading request was cancelled; its waiters are not, they retry on their own
+      future.cancel()
+      raise
+    finally:
+      self._inflight.pop(full_key, None)
+
+    # misses are not cached, so a product created right after a 404 shows up at once
+    if value is not None:
+      self.local.set(full_key, value)
+      if self.shared is not None:
+        await self.shared.set(full_key, json.dumps(value).encode(), self.local.ttl)
+
+    future.set_result(value)
+    return value
+
+  async def invalidate(self, *tags: str) -> None:
+    self.invalidations += 1
+    for tag in tags:
+      if self.shared is not None:
+        await self.shared.incr(f"tag:{tag}")
+      else:
+        self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+
+  def stats(self) -> dict:
+    lookups = self.hits + self.misses + self.coalesced
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "coalesced": self.coalesced,
+      "invalidations": self.invalidations,
+      "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+    }
+
+
+def cache_key(namespace: str, **params) -> str:
+  return f"{namespace}:{json.dumps(params, sort_keys=True, default=str)}"
+
+
+def _shared_backend() -> SharedCacheBackend | None:
+  if PRODUCT_CACHE_SHARED_BACKEND == "redis":
+    if redis is None:
+      raise ValueError("PRODUCT_CACHE_SHARED_BACKEND='redis' needs the redis package")
+    return RedisSharedBackend(PRODUCT_CACHE_REDIS_URL)
+
+  if PRODUCT_CACHE_SHARED_BACKEND not in ("", "memory"):
+    raise ValueError(f"Unknown PRODUCT_CACHE_SHARED_BACKEND {PRODUCT_CACHE_SHARED_BACKEND!r}")
+  if PRODUCT_CACHE_ENABLED and WEB_CONCURRENCY > 1:
+    # each worker would keep its own tag versions and serve its stale entries after edits elsewhere
+    raise ValueError(
+      "PRODUCT_CACHE_ENABLED with WEB_CONCURRENCY > 1 needs PRODUCT_CACHE_SHARED_BACKEND='redis' "
+      "(or PRODUCT_CACHE_ENABLED=False)"
+    )
+  if PRODUCT_CACHE_SHARED_BACKEND == "memory":
+    return InMemorySharedBackend()
+  return None
+
+
+catalog_cache = ReadThroughCache(
+  LRUCache(maxsize=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL_SEC),
+  shared=_shared_backend(),
+  enabled=PRODUCT_CACHE_ENABLED,
+)
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from decouple import config
+from sqlalchemy import update
+from db.config import async_session
+from .models import Product
+from .cache import catalog_cache
+
+try: 
+  from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, products then only have their original image
+  Image = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_VARIANT_WORKERS = config("IMAGE_VARIANT_WORKERS", default=2, cast=int)
+IMAGE_VARIANT_QUALITY = config("IMAGE_VARIANT_QUALITY", default=80, cast=int)
+
+# variant name -> longest edge in pixels
+IMAGE_VARIANTS = {
+  "thumbnail": 320,
+  "medium": 800,
+}
+
+
+def generate_variants(source: str) -> dict[str, str]: 
+  # runs in a worker process; originals are content addressed, so variant names are too
+  src = Path(source)
+  out_dir = src.parent / "variants"
+  out_dir.mkdir(parents=True, exist_ok=True)
+
+  variants = {}
+  with Image.open(src) as original: 
+    image = ImageOps.exif_transpose(original)
+    if image.mode not in ("RGB", "RGBA"): 
+      image = image.convert("RGBA")
+
+    for name, edge in IMAGE_VARIANTS.items(): 
+      target = out_dir / f"{src.stem}_{name}.webp"
+      if not target.exists(): 
+        resized = image.copy()
+        resized.thumbnail((edge, edge))
+        resized.save(target, "WEBP", quality=IMAGE_VARIANT_QUALITY, method=4)
+      variants[name] = str(target)
+
+  return variants
+
+
+class ImageVariantQueue: 
+  def __init__(self, workers: int): 
+    self.workers = workers
+    self._queue: asyncio.Queue[tuple[int, str]] = asyncio.Queue()
+    self._executor: ProcessPoolExecutor | None = None
+    self.processed = 0
+    self.failed = 0
+
+  def submit(self, product_id: int, image_path: str | None) -> None: 
+    if Image is None or not image_path: 
+      return
+    self._queue.put_nowait((product_id, image_path))
+
+  async def _process(self, product_id: int, image_path: str) -> None: 
+    loop = asyncio.get_running_loop()
+    variants = await loop.run_in_executor(self._executor, generate_variants, image_path)
+
+    async with async_session() as session: 
+      # skip if the product got another image in the meantime
+      stmt = (
+        update(Product)
+        .where(Product.id == product_id, Product.image_url == image_path)
+        .values(image_variants=variants)
+      )
+      await session.execute(stmt)
+      await session.commit()
+
+    await catalog_cache.invalidate("products")
+
+  async def _worker(self) -> None: 
+    while True: 
+      product_id, image_path = await self._queue.get()
+      try: 
+        await self._process(product_id, image_path)
+        self.processed += 1
+      except Exception: 
+        self.failed += 1
+        logger.exception("generating image variants for product %s failed", product_id)
+      finally: 
+        self._queue.task_done()
+
+  def start(self) -> list[asyncio.Task]: 
+    if Image is None: 
+      logger.warning("Pillow is not installed, product image variants are disabled")
+      return []
+    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+    return [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+  def shutdown(self) -> None: 
+    if self._executor is not None: 
+      self._executor.shutdown(wait=False, cancel_futures=True)
+      self._executor = None
+
+  def metrics(self) -> dict: 
+    return {"queued": self._queue.qsize(), "processed": self.processed, "failed": self.failed}
+
+
+image_variant_queue = ImageVariantQueue(IMAGE_VARIANT_WORKERS)
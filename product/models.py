@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, Text, Float, DateTime, ForeignKey, Table, Column
+from sqlalchemy import String, Integer, Text, Float, DateTime, ForeignKey, Table, Column, Index, JSON
 from datetime import datetime, timezone
 from db.base import Base
 from typing import TYPE_CHECKING
@@ -27,6 +27,8 @@ class Product(Base):
     stock_quantity: Mapped[int] = mapped_column(Integer, default=0)
 
     image_url: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # resized WebP copies of image_url by variant name, filled in by product/images.py
+    image_variants: Mapped[dict | None] = mapped_column(JSON, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
@@ -39,6 +41,15 @@ class Product(Base):
 
     cart_items: Mapped[list["CartItem"]] = relationship("CartItem", back_populates="product", cascade="all, delete-orphan")
 
+    # keyset pagination seeks on (sort column, id)
+    __table_args__ = (
+        Index("ix_products_created_at_id", "created_at", "id"),
+        Index("ix_products_price_id", "price", "id"),
+        # used by the "fulltext" product search backend, one per searchable field
+        Index("ft_products_title", "title", mysql_prefix="FULLTEXT"),
+        Index("ft_products_description", "description", mysql_prefix="FULLTEXT"),
+    )
+
 
 class Category(Base):
     __tablename__ = "categories"
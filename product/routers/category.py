@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status 
-from account.models import User
+from account.cache import AuthUser
 from db.config import session
+from db.replicas import read_session
 from product import schemas as sc
 from product import services as ss
 from account.dependency import require_admin
@@ -8,17 +9,17 @@ from account.dependency import require_admin
 router = APIRouter()
 
 @router.post("/", response_model=sc.CategoryOut)
-async def category_create(session: session, category: sc.CategoryCreate, admin_user: User = Depends(require_admin)):
+async def category_create(session: session, category: sc.CategoryCreate, admin_user: AuthUser = Depends(require_admin)):
   return await ss.create_category(session, category)
 
 
 @router.get("/categories", response_model=list[sc.CategoryOut])
-async def list_categories(session: session): 
+async def list_categories(session: read_session): 
   return await ss.list_categories(session)
 
  
 @router.delete("/category")
-async def delete_category(session: session, category_id: int, admin_user: User = Depends(require_admin)): 
+async def delete_category(session: session, category_id: int, admin_user: AuthUser = Depends(require_admin)): 
   output = await ss.delete_category(session, category_id)
   if not output: 
     raise HTTPException(detail="not deleted", status_code=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, status, Query
-from account.models import User
+from account.cache import AuthUser
 from db.config import session
+from db.replicas import read_session
 from product.schemas import ProductCreate, ProductOut, PaginatedProductOut, ProductUpdate
 from account.dependency import require_admin
-from typing import Annotated
+from typing import Annotated, Literal
 from product.services import *
 
 router = APIRouter()
@@ -17,7 +18,7 @@ async def product_create(
     stock_quantity: int =Form(...),
     category_ids: Annotated[list[int], Form()] = [],
     image: UploadFile | None = File(None), 
-    admin_user: User = Depends(require_admin)
+    admin_user: AuthUser = Depends(require_admin)
   ):
 
   data = ProductCreate(
@@ -34,12 +35,15 @@ async def product_create(
 
 @router.get("", response_model=PaginatedProductOut)
 async def list_products(
-  session: session, 
+  session: read_session, 
   categories: list[str] | None = Query(default=None), 
   limit: int = Query(default=5, ge=1, le=100),
-  page: int = Query(default=1, ge=1)
+  page: int = Query(default=1, ge=1),
+  sort: Literal["created_at", "price"] = Query(default="created_at"),
+  cursor: str | None = Query(default=None),
+  include_total: bool | None = Query(default=None)
 ): 
-  return await get_all_products(session, categories, limit, page)
+  return await get_all_products(session, categories, limit, page, sort, cursor, include_total)
 
 
 
@@ -47,29 +51,37 @@ async def list_products(
 
 @router.get("/search", response_model=PaginatedProductOut)
 async def products_search(
-  session: session, 
+  session: read_session, 
   categories: list[str] | None = Query(default=None), 
   title: str | None = Query(None),
+  description: str | None = Query(None),
   min_price: float | None = Query(None),
   max_price: float | None = Query(None),
   limit: int = Query(default=5, ge=1, le=100),
-  page: int = Query(default=1, ge=1)
+  page: int = Query(default=1, ge=1),
+  sort: Literal["relevance", "created_at", "price"] | None = Query(default=None),
+  cursor: str | None = Query(default=None),
+  include_total: bool | None = Query(default=None)
   ) -> PaginatedProductOut:
   
   return await search_product(
     session=session,
     category_name=categories, 
     title=title, 
+    description=description,
     min_price=min_price, 
     max_price=max_price,
     limit=limit,
-    page = page
+    page = page,
+    sort=sort,
+    cursor=cursor,
+    include_total=include_total
   )
 
 
 
 @router.get("/{slug}", response_model=ProductOut)
-async def product_get_by_slug(session: session, slug: str): 
+async def product_get_by_slug(session: read_session, slug: str): 
   product = await get_product_by_slug(session, slug)
 
   if not product: 
@@ -88,7 +100,7 @@ async def product_update_by_id(
   stock_quantity: int | None  = Form(None), 
   category_ids: list[int] | None = None, 
   image_url: UploadFile | None = File(None),
-  admin_user: User = Depends(require_admin)
+  admin_user: AuthUser = Depends(require_admin)
 ): 
   data = ProductUpdate(
     title=title, 
@@ -110,7 +122,7 @@ async def product_update_by_id(
 async def delete_one_product(
   session: session, 
   product_id: int, 
-  admin_user: User = Depends(require_admin)
+  admin_user: AuthUser = Depends(require_admin)
   ):
 
   success = await delete_product(session, product_id)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, computed_field
 
 class CategoryBase(BaseModel): 
   name: str
@@ -28,6 +28,15 @@ class ProductOut(ProductBase):
     slug: str 
     categories: list[CategoryOut] = []
     image_url: str | None = None 
+    image_variants: dict[str, str] | None = None
+
+    # lets list pages render the small image, falls back to the original until it exists
+    @computed_field
+    @property
+    def thumbnail_url(self) -> str | None: 
+        if self.image_variants and "thumbnail" in self.image_variants: 
+            return self.image_variants["thumbnail"]
+        return self.image_url
   
     model_config = {
         'from_attributes': True
@@ -35,10 +44,12 @@ class ProductOut(ProductBase):
 
 
 class PaginatedProductOut(BaseModel): 
-    total: int 
+    total: int | None = None
     page: int 
     limit: int 
     items: list[ProductOut]
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
 
     model_config = {
         'from_attributes': True
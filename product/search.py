@@ -0,0 +1,355 @@
+"""Pluggable full-text search for products.
+
+`search_product` delegates its title/description matching to one backend, picked
+with PRODUCT_SEARCH_BACKEND:
+
+  like      the original LIKE '%term%' scan, kept as the baseline
+  fulltext  MySQL FULLTEXT indexes on title and on description, ranked by MATCH score
+  memory    in-process BM25 indexes over title and description tokens
+
+title only searches titles and description only descriptions, on every backend.
+
+The memory backend matches every query token as a prefix of a word, like fulltext's
+`term*`, and answers from its postings: SQL only sees the candidate ids, to apply the
+category and price filters, never the text. Its index is per process, built on the first
+search and updated in place by the product services of this process; writes made by
+other workers are picked up every PRODUCT_SEARCH_REFRESH_SEC by re-reading the products
+whose updated_at moved (and rebuilding when the product count no longer agrees).
+"""
+import asyncio
+import bisect
+import math
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime, timedelta
+from statistics import median
+
+from decouple import config
+from sqlalchemy import Select, and_, desc, func, literal, select
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from product.models import Product
+
+PRODUCT_SEARCH_BACKEND = config("PRODUCT_SEARCH_BACKEND", default="like")
+# how often the memory backend looks for products changed by other workers
+PRODUCT_SEARCH_REFRESH_SEC = config("PRODUCT_SEARCH_REFRESH_SEC", default=5, cast=float)
+# updated_at comes from each worker's clock, so look back this far past the last change seen
+PRODUCT_SEARCH_CLOCK_SKEW_SEC = config("PRODUCT_SEARCH_CLOCK_SKEW_SEC", default=60, cast=int)
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str | None) -> list[str]:
+  return TOKEN_RE.findall(text.lower()) if text else []
+
+
+class SearchBackend(ABC):
+  name: str
+
+  @abstractmethod
+  async def filter(self, session: AsyncSession, stmt: Select, title: str | None, description: str | None) -> Select:
+    """Restrict stmt to products matching the text query, without ordering."""
+
+  @abstractmethod
+  async def rank(
+      self,
+      session: AsyncSession,
+      stmt: Select,
+      title: str | None,
+      description: str | None,
+      limit: int,
+      offset: int
+  ) -> tuple[list[int], int]:
+    """Return one page of matching product ids (best match first) and the match count."""
+
+  # index maintenance hooks, only the in-process backend needs them
+  def index_product(self, product: Product) -> None:
+    pass
+
+  def remove_product(self, product_id: int) -> None:
+    pass
+
+
+class LikeSearchBackend(SearchBackend):
+  name = "like"
+
+  async def filter(self, session, stmt, title, description):
+    filters = []
+    if title:
+      filters.append(Product.title.like(f"%{title}%"))
+    if description:
+      filters.append(Product.description.like(f"%{description}%"))
+    return stmt.where(and_(*filters)) if filters else stmt
+
+  async def rank(self, session, stmt, title, description, limit, offset):
+    stmt = await self.filter(session, stmt, title, description)
+    total = await session.scalar(stmt.with_only_columns(func.count(Product.id.distinct())).order_by(None))
+    result = await session.execute(stmt.with_only_columns(Product.id).order_by(Product.id).limit(limit).offset(offset))
+    return list(result.scalars().all()), total
+
+
+class FullTextSearchBackend(SearchBackend):
+  name = "fulltext"
+
+  def _matches(self, title, description):
+    # every term is required and matched as a prefix; terms shorter than
+    # innodb_ft_min_token_size are ignored by the server
+    clauses = []
+    for column, text in ((Product.title, title), (Product.description, description)):
+      terms = tokenize(text)
+      if terms:
+        query = " ".join(f"+{term}*" for term in terms)
+        clauses.append(match(column, against=query).in_boolean_mode())
+    return clauses
+
+  async def filter(self, session, stmt, title, description):
+    clauses = self._matches(title, description)
+    return stmt.where(and_(*clauses)) if clauses else stmt
+
+  async def rank(self, session, stmt, title, description, limit, offset):
+    clauses = self._matches(title, description)
+    score = sum(clauses[1:], clauses[0]) if clauses else literal(0)
+    stmt = stmt.where(and_(*clauses)) if clauses else stmt
+    total = await session.scalar(stmt.with_only_columns(func.count(Product.id.distinct())).order_by(None))
+    page_stmt = (
+      stmt.with_only_columns(Product.id, score.label("score"))
+      .order_by(desc("score"), Product.id)
+      .limit(limit)
+      .offset(offset)
+    )
+    result = await session.execute(page_stmt)
+    return [row.id for row in result], total
+
+
+class InvertedIndex:
+  # one field of every product; BM25 over prefix-expanded query terms
+  def __init__(self, k1: float = 1.2, b: float = 0.75, max_expansions: int = 50):
+    self.k1 = k1
+    self.b = b
+    self.max_expansions = max_expansions
+    self.postings: dict[str, dict[int, int]] = {}
+    self.doc_terms: dict[int, Counter] = {}
+    self.doc_len: dict[int, int] = {}
+    self.total_len = 0
+    self.vocabulary: list[str] = []
+
+  def add(self, product_id: int, text: str | None) -> None:
+    self.remove(product_id)
+
+    terms = Counter(tokenize(text))
+    for term, tf in terms.items():
+      posting = self.postings.get(term)
+      if posting is None:
+        posting = self.postings[term] = {}
+        bisect.insort(self.vocabulary, term)
+      posting[product_id] = tf
+
+    length = sum(terms.values())
+    self.doc_terms[product_id] = terms
+    self.doc_len[product_id] = length
+    self.total_len += length
+
+  def remove(self, product_id: int) -> None:
+    terms = self.doc_terms.pop(product_id, None)
+    if terms is None:
+      return
+
+    for term in terms:
+      posting = self.postings[term]
+      posting.pop(product_id, None)
+      if not posting:
+        del self.postings[term]
+        del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+
+    self.total_len -= self.doc_len.pop(product_id)
+
+  def expand(self, prefix: str) -> list[str]:
+    start = bisect.bisect_left(self.vocabulary, prefix)
+    terms = []
+    for term in self.vocabulary[start:start + self.max_expansions]:
+      if not term.startswith(prefix):
+        break
+      terms.append(term)
+    return terms
+
+  def scores(self, query: str | None) -> dict[int, float]:
+    """BM25 score of every product that matches all query tokens (as prefixes)."""
+    tokens = tokenize(query)
+    if not tokens or not self.doc_len:
+      return {}
+
+    n_docs = len(self.doc_len)
+    avg_len = self.total_len / n_docs or 1
+    scores: dict[int, float] | None = None
+
+    for token in tokens:
+      token_scores: dict[int, float] = {}
+      for term in self.expand(token):
+        posting = self.postings[term]
+        idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+        for product_id, tf in posting.items():
+          norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[product_id] / avg_len)
+          token_scores[product_id] = token_scores.get(product_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+      if scores is None:
+        scores = token_scores
+      else:
+        scores = {pid: score + token_scores[pid] for pid, score in scores.items() if pid in token_scores}
+
+      if not scores:
+        return {}
+
+    return scores
+
+  def clear(self) -> None:
+    self.postings.clear()
+    self.doc_terms.clear()
+    self.doc_len.clear()
+    self.total_len = 0
+    self.vocabulary.clear()
+
+
+class InvertedIndexSearchBackend(SearchBackend):
+  name = "memory"
+
+  def __init__(self, title_weight: float = 2.0):
+    # title matches count more than description matches
+    self.title_weight = title_weight
+    self.title_index = InvertedIndex()
+    self.description_index = InvertedIndex()
+    self.built = False
+    self.watermark: datetime | None = None
+    self.checked_at = 0.0
+    self._lock = asyncio.Lock()
+
+  def _fresh(self) -> bool:
+    return self.built and time.monotonic() - self.checked_at < PRODUCT_SEARCH_REFRESH_SEC
+
+  async def _load(self, session: AsyncSession, since: datetime | None) -> None:
+    stmt = select(Product.id, Product.title, Product.description, Product.updated_at)
+    if since is not None:
+      stmt = stmt.where(Product.updated_at >= since)
+
+    for row in await session.execute(stmt):
+      self.title_index.add(row.id, row.title)
+      self.description_index.add(row.id, row.description)
+      if row.updated_at is not None and (self.watermark is None or row.updated_at > self.watermark):
+        self.watermark = row.updated_at
+
+  async def ensure_built(self, session: AsyncSession) -> None:
+    if self._fresh():
+      return
+
+    async with self._lock:
+      if self._fresh():
+        return
+
+      if self.built and self.watermark is not None:
+        await self._load(session, self.watermark - timedelta(seconds=PRODUCT_SEARCH_CLOCK_SKEW_SEC))
+        count = await session.scalar(select(func.count(Product.id)))
+        # deletes leave no updated_at behind; a count mismatch means one happened elsewhere
+        if count == len(self.title_index.doc_len):
+          self.checked_at = time.monotonic()
+          return
+
+      self.title_index.clear()
+      self.description_index.clear()
+      self.watermark = None
+      await self._load(session, None)
+      self.built = True
+      self.checked_at = time.monotonic()
+
+  def _scores(self, title: str | None, description: str | None) -> dict[int, float]:
+    # products matching every given field, with their combined score
+    fields = []
+    if title:
+      fields.append((self.title_weight, self.title_index.scores(title)))
+    if description:
+      fields.append((1.0, self.description_index.scores(description)))
+    if not fields:
+      return {}
+
+    weight, scores = fields[0]
+    combined = {pid: weight * score for pid, score in scores.items()}
+    for weight, scores in fields[1:]:
+      combined = {pid: score + weight * scores[pid] for pid, score in combined.items() if pid in scores}
+    return combined
+
+  async def filter(self, session, stmt, title, description):
+    if not (title or description):
+      return stmt
+    await self.ensure_built(session)
+    return stmt.where(Product.id.in_(list(self._scores(title, description))))
+
+  async def rank(self, session, stmt, title, description, limit, offset):
+    await self.ensure_built(session)
+    scores = self._scores(title, description)
+    product_ids = sorted(scores, key=lambda product_id: (-scores[product_id], product_id))
+
+    # category or price filters: keep the candidates SQL lets through, by primary key
+    if stmt.whereclause is not None and product_ids:
+      result = await session.execute(stmt.with_only_columns(Product.id).where(Product.id.in_(product_ids)).order_by(None))
+      allowed = set(result.scalars().all())
+      product_ids = [product_id for product_id in product_ids if product_id in allowed]
+
+    return product_ids[offset:offset + limit], len(product_ids)
+
+  def index_product(self, product: Product) -> None:
+    if self.built:
+      self.title_index.add(product.id, product.title)
+      self.description_index.add(product.id, product.description)
+
+  def remove_product(self, product_id: int) -> None:
+    if self.built:
+      self.title_index.remove(product_id)
+      self.description_index.remove(product_id)
+
+
+BACKENDS: dict[str, type[SearchBackend]] = {
+  "like": LikeSearchBackend,
+  "fulltext": FullTextSearchBackend,
+  "memory": InvertedIndexSearchBackend,
+}
+
+
+def get_search_backend(name: str) -> SearchBackend:
+  if name not in BACKENDS:
+    raise ValueError(f"Unknown PRODUCT_SEARCH_BACKEND {name!r}, expected one of {sorted(BACKENDS)}")
+  return BACKENDS[name]()
+
+
+search_backend = get_search_backend(PRODUCT_SEARCH_BACKEND)
+
+
+async def benchmark(
+    session: AsyncSession,
+    queries: list[str],
+    backends: list[str] | None = None,
+    limit: int = 20,
+    repeat: int = 5
+) -> dict[str, dict[str, float]]:
+  """Median latency in milliseconds of a ranked search, per backend and query.
+
+  The LIKE backend is always included as the baseline.
+  """
+  names = ["like", *[name for name in (backends or BACKENDS) if name != "like"]]
+  timings: dict[str, dict[str, float]] = {}
+
+  for name in names:
+    backend = search_backend if name == search_backend.name else get_search_backend(name)
+    if isinstance(backend, InvertedIndexSearchBackend):
+      await backend.ensure_built(session)
+
+    timings[name] = {}
+    for query in queries:
+      samples = []
+      for _ in range(repeat):
+        start = time.perf_counter()
+        await backend.rank(session, select(Product), query, None, limit, 0)
+        samples.append((time.perf_counter() - start) * 1000)
+      timings[name][query] = round(median(samples), 3)
+
+  return timings
@@ -1,24 +1,43 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from product.models import Product, Category
 from product import schemas as sc
-from sqlalchemy import select, func, and_
+from sqlalchemy import select, func, and_, Select
 from fastapi import UploadFile, HTTPException, status
 from .utils import save_upload_file, generate_slug
 from slugify import slugify
 from sqlalchemy.orm import selectinload
+from datetime import datetime, timezone
+from db.pagination import encode_cursor, decode_cursor, apply_keyset, keyset_order
+from .search import search_backend
+from .cache import catalog_cache, cache_key
+from .images import image_variant_queue
+
+# cache tags, see product/cache.py
+PRODUCTS_TAG = "products"
+CATEGORIES_TAG = "categories"
+
+# columns a product page can be ordered (and seeked) by, each backed by a (column, id) index
+SORT_COLUMNS = {
+  "created_at": Product.created_at,
+  "price": Product.price,
+}
 
 async def create_category(session: AsyncSession, category: sc.CategoryCreate) -> sc.CategoryOut: 
   category = Category(name=category.name)
   session.add(category)
   await session.commit()
   await session.refresh(category)
+  await catalog_cache.invalidate(CATEGORIES_TAG)
   return category
 
 
-async def list_categories(session: AsyncSession) -> list[Category]: 
-  stmt = select(Category)
-  result = await session.execute(stmt)
-  return result.scalars().all()
+async def list_categories(session: AsyncSession) -> list[dict]: 
+  async def load(): 
+    stmt = select(Category)
+    result = await session.execute(stmt)
+    return [sc.CategoryOut.model_validate(c).model_dump(mode="json") for c in result.scalars().all()]
+
+  return await catalog_cache.get_or_load("categories", (CATEGORIES_TAG,), load)
 
 
 async def delete_category(session: AsyncSession, category_id: int) -> bool:
@@ -27,15 +46,88 @@ async def delete_category(session: AsyncSession, category_id: int) -> bool:
     return False
   await session.delete(category)
   await session.commit()
+  await catalog_cache.invalidate(CATEGORIES_TAG)
   return True
 
 
 ################# Products ##########33
+def _product_cursor(sort: str, product: Product, direction: str) -> str: 
+  return encode_cursor({"s": sort, "v": getattr(product, sort), "id": product.id, "d": direction})
+
+
+def _parse_cursor(sort: str, cursor: str) -> tuple: 
+  data = decode_cursor(cursor)
+  if data.get("s") != sort or "v" not in data or "id" not in data: 
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor does not match the requested sort")
+
+  try: 
+    value = datetime.fromisoformat(data["v"]) if sort == "created_at" else float(data["v"])
+    return value, int(data["id"]), data.get("d", "next") == "next"
+  except (TypeError, ValueError): 
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+async def _paginate_products(
+    session: AsyncSession, 
+    stmt: Select, 
+    sort: str, 
+    limit: int, 
+    page: int, 
+    cursor: str | None, 
+    include_total: bool | None
+) -> dict: 
+  column = SORT_COLUMNS.get(sort)
+  if column is None: 
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unsupported sort: {sort}")
+
+  # the full count is the expensive part of a deep page, so cursor pages skip it unless asked
+  if include_total is None: 
+    include_total = cursor is None
+
+  total = None
+  if include_total: 
+    count_stmt = stmt.with_only_columns(func.count(Product.id.distinct())).order_by(None)
+    total = await session.scalar(count_stmt)
+
+  forward = True
+  if cursor: 
+    value, last_id, forward = _parse_cursor(sort, cursor)
+    page_stmt = apply_keyset(stmt, column, Product.id, value, last_id, forward)
+  else: 
+    page_stmt = stmt.offset((page-1)*limit)
+
+  # fetch one extra row to know whether another page exists without counting
+  page_stmt = page_stmt.order_by(*keyset_order(column, Product.id, forward)).limit(limit + 1)
+  result = await session.execute(page_stmt)
+  products = list(result.scalars().all())
+
+  has_more = len(products) > limit
+  products = products[:limit]
+  if not forward: 
+    products.reverse()
+
+  next_cursor = prev_cursor = None
+  if products: 
+    if has_more or not forward: 
+      next_cursor = _product_cursor(sort, products[-1], "next")
+    if (has_more and not forward) or (forward and (cursor or page > 1)): 
+      prev_cursor = _product_cursor(sort, products[0], "prev")
+
+  return {
+    "total": total, 
+    "page": page, 
+    "limit": limit, 
+    "items": products,
+    "next_cursor": next_cursor,
+    "prev_cursor": prev_cursor
+  }
+
+
 async def create_product(session: AsyncSession, data: sc.ProductCreate, image_url: UploadFile | None = None) -> Product: 
   if data.stock_quantity < 0: 
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="stock quantity can not be negative :)")
   
-  image_path = await save_upload_file(image_url, "images")
+  image_path = await save_upload_file(image_url, "images", source="create_product")
 
   categories = []
   if data.category_ids: 
@@ -53,6 +145,9 @@ async def create_product(session: AsyncSession, data: sc.ProductCreate, image_ur
 
   session.add(new_product)
   await session.commit()
+  search_backend.index_product(new_product)
+  await catalog_cache.invalidate(PRODUCTS_TAG)
+  image_variant_queue.submit(new_product.id, image_path)
   return new_product
 
 
@@ -60,38 +155,58 @@ async def get_all_products(
     session: AsyncSession, 
     category_names: list[str] | None = None, 
     limit: int = 5, 
-    page: int = 1
+    page: int = 1,
+    sort: str = "created_at",
+    cursor: str | None = None,
+    include_total: bool | None = None
 ) -> dict: 
   
-  stmt  = select(Product).options(selectinload(Product.categories))
+  async def load(): 
+    stmt  = select(Product).options(selectinload(Product.categories))
 
-  if category_names: 
-    stmt = stmt.join(Product.categories).where(Category.name.in_(category_names)).distinct()
+    if category_names: 
+      stmt = stmt.join(Product.categories).where(Category.name.in_(category_names)).distinct()
 
-  count_stmt = stmt.with_only_columns(func.count(Product.id)).order_by(None)
-  total = await session.scalar(count_stmt) 
+    page_data = await _paginate_products(session, stmt, sort, limit, page, cursor, include_total)
+    return sc.PaginatedProductOut.model_validate(page_data).model_dump(mode="json")
 
-  stmt = stmt.limit(limit).offset((page-1)*limit)
-
-  result = await session.execute(stmt)
-  products = result.scalars().all()
-
-  return {
-    "total": total, 
-    "page": page, 
-    "limit": limit, 
-    "items": products
-  }
+  key = cache_key(
+    "products",
+    categories=sorted(category_names or []),
+    limit=limit,
+    page=page,
+    sort=sort,
+    cursor=cursor,
+    include_total=include_total
+  )
+  return await catalog_cache.get_or_load(key, (PRODUCTS_TAG, CATEGORIES_TAG), load)
 
 
 async def get_product_by_slug(
     session: AsyncSession, 
     slug: str
-  ) -> sc.ProductOut | None: 
+  ) -> dict | None: 
   
-  stmt = select(Product).options(selectinload(Product.categories)).where(Product.slug == slug)
-  result = await session.execute(stmt)
-  return result.scalars()
+  async def load(): 
+    stmt = select(Product).options(selectinload(Product.categories)).where(Product.slug == slug)
+    result = await session.execute(stmt)
+    product = result.scalars().first()
+    return sc.ProductOut.model_validate(product).model_dump(mode="json") if product else None
+
+  product = await catalog_cache.get_or_load(cache_key("product", slug=slug), (PRODUCTS_TAG, CATEGORIES_TAG), load)
+  if product is None: 
+    return None
+  return await _with_live_stock(session, product)
+
+
+async def _with_live_stock(session: AsyncSession, product: dict) -> dict: 
+  # the product page is where buying happens, so its stock comes from one primary key read;
+  # a copy, the cached dict is shared between requests
+  if not catalog_cache.enabled: 
+    return product
+
+  stock = await session.scalar(select(Product.stock_quantity).where(Product.id == product["id"]))
+  return {**product, "stock_quantity": stock or 0}
 
 
 async def search_product(
@@ -102,7 +217,10 @@ async def search_product(
     min_price: float | None = None, 
     max_price: float | None = None,  
     limit: int = 5, 
-    page: int = 1
+    page: int = 1,
+    sort: str | None = None,
+    cursor: str | None = None,
+    include_total: bool | None = None
   ) -> sc.PaginatedProductOut: 
   
   stmt = select(Product).options(selectinload(Product.categories))
@@ -111,12 +229,6 @@ async def search_product(
     stmt = stmt.join(Product.categories).where(Category.name.in_(category_name)).distinct()
 
   filters = []
-  if title: 
-    filters.append(Product.title.like(f"%{title}%"))
-
-  if description: 
-    filters.append(Product.description.like(f"%{description}%"))
-
   if min_price: 
     filters.append(Product.price >= min_price)
   
@@ -126,19 +238,53 @@ async def search_product(
   if filters: 
     stmt = stmt.where(and_(*filters))
 
-  count_stmt = stmt.with_only_columns(func.count(Product.id)).order_by(None)
-  total = await session.scalar(count_stmt) 
+  has_text_query = bool(title or description)
+  if sort is None: 
+    sort = "relevance" if has_text_query else "created_at"
 
-  stmt = stmt.limit(limit).offset((page-1)*limit)
+  if sort == "relevance": 
+    if not has_text_query: 
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="relevance sort needs a title or description query")
+    return await _rank_products(session, stmt, title, description, limit, page, cursor)
+
+  if has_text_query: 
+    stmt = await search_backend.filter(session, stmt, title, description)
+
+  return await _paginate_products(session, stmt, sort, limit, page, cursor, include_total)
 
-  result = await session.execute(stmt)
-  products = result.scalars().all()
+
+async def _rank_products(
+    session: AsyncSession, 
+    stmt: Select, 
+    title: str | None, 
+    description: str | None, 
+    limit: int, 
+    page: int, 
+    cursor: str | None
+) -> dict: 
+  # relevance order has no stable seek key, so its cursor just carries the offset into the ranking
+  offset = (page-1)*limit
+  if cursor: 
+    data = decode_cursor(cursor)
+    if data.get("s") != "relevance" or not isinstance(data.get("o"), int) or data["o"] < 0: 
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor does not match the requested sort")
+    offset = data["o"]
+
+  product_ids, total = await search_backend.rank(session, stmt, title, description, limit, offset)
+
+  products = []
+  if product_ids: 
+    result = await session.execute(select(Product).options(selectinload(Product.categories)).where(Product.id.in_(product_ids)))
+    by_id = {product.id: product for product in result.scalars().all()}
+    products = [by_id[product_id] for product_id in product_ids if product_id in by_id]
 
   return {
     "total": total, 
     "page": page, 
     "limit": limit, 
-    "items": products
+    "items": products,
+    "next_cursor": encode_cursor({"s": "relevance", "o": offset + limit}) if offset + limit < total else None,
+    "prev_cursor": encode_cursor({"s": "relevance", "o": max(offset - limit, 0)}) if offset > 0 else None
   }
 
 
@@ -165,11 +311,18 @@ async def update_product(
     setattr(product, key, value)
 
   if image_url: 
-    image_path = await save_upload_file(image_url, "images")
+    image_path = await save_upload_file(image_url, "images", source="update_product")
     product.image_url = image_path 
+    product.image_variants = None
 
+  # other workers' search indexes pick up edits by updated_at
+  product.updated_at = datetime.now(timezone.utc)
   await session.commit()
   await session.refresh(product)
+  search_backend.index_product(product)
+  await catalog_cache.invalidate(PRODUCTS_TAG)
+  if image_url: 
+    image_variant_queue.submit(product.id, product.image_url)
   
   return product
 
@@ -188,4 +341,6 @@ async def delete_product(
   
   await session.delete(product)
   await session.commit()
+  search_backend.remove_product(product_id)
+  await catalog_cache.invalidate(PRODUCTS_TAG)
   return True
\ No newline at end of file
@@ -1,29 +1,115 @@
+import hashlib
+import time
 from pathlib import Path
 from uuid import uuid4
-from fastapi import UploadFile
+import anyio
+from decouple import config
+from fastapi import UploadFile, HTTPException, status
 from slugify import slugify
 
 UPLOAD_DIR = Path('media')
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-async def save_upload_file(upload_file: UploadFile, sub_dir: str) -> str: 
+UPLOAD_CHUNK_SIZE = config("UPLOAD_CHUNK_SIZE", default=64 * 1024, cast=int)
+UPLOAD_MAX_BYTES = config("UPLOAD_MAX_BYTES", default=5 * 1024 * 1024, cast=int)
+
+# content type -> stored extension
+ALLOWED_IMAGE_TYPES = {
+  "image/jpeg": ".jpg",
+  "image/png": ".png",
+  "image/gif": ".gif",
+  "image/webp": ".webp",
+}
+
+
+def sniff_image_type(head: bytes) -> str | None: 
+  # trust the file's magic bytes, not the client supplied content type or filename
+  if head.startswith(b"\xff\xd8\xff"): 
+    return "image/jpeg"
+  if head.startswith(b"\x89PNG\r\n\x1a\n"): 
+    return "image/png"
+  if head[:6] in (b"GIF87a", b"GIF89a"): 
+    return "image/gif"
+  if head[:4] == b"RIFF" and head[8:12] == b"WEBP": 
+    return "image/webp"
+  return None
+
+
+class UploadStats: 
+  def __init__(self): 
+    self.by_source: dict[str, dict[str, float]] = {}
+
+  def record(self, source: str, size: int, seconds: float, outcome: str) -> None: 
+    stats = self.by_source.setdefault(source, {"stored": 0, "deduplicated": 0, "rejected": 0, "bytes": 0, "seconds": 0.0})
+    stats[outcome] += 1
+    stats["bytes"] += size
+    stats["seconds"] += seconds
+
+  def metrics(self) -> dict[str, dict[str, float]]: 
+    return {
+      source: {**stats, "bytes_per_second": stats["bytes"] / stats["seconds"] if stats["seconds"] else 0.0}
+      for source, stats in self.by_source.items()
+    }
+
+
+upload_stats = UploadStats()
+
+
+async def save_upload_file(upload_file: UploadFile, sub_dir: str, source: str = "upload") -> str: 
 
   if not upload_file or not upload_file.filename:
     return None
   
-  ext = Path(upload_file.filename).suffix
-  filename = f"{uuid4().hex}{ext}"
-  dir_path = UPLOAD_DIR / sub_dir
-  dir_path.mkdir(parents=True, exist_ok=True) 
-  file_path = dir_path / filename
+  if upload_file.content_type not in ALLOWED_IMAGE_TYPES: 
+    raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported image type")
+
+  started_at = time.perf_counter()
+  dir_path = anyio.Path(UPLOAD_DIR / sub_dir)
+  await dir_path.mkdir(parents=True, exist_ok=True) 
+  tmp_path = dir_path / f".{uuid4().hex}.part"
+
+  digest = hashlib.sha256()
+  size = 0
+  ext = None
+
+  # stream to a temp file in fixed chunks, so memory stays flat whatever the upload size
+  try: 
+    async with await anyio.open_file(tmp_path, "wb") as f: 
+      while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE): 
+        if ext is None: 
+          content_type = sniff_image_type(chunk)
+          if content_type is None: 
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported image type")
+          ext = ALLOWED_IMAGE_TYPES[content_type]
+
+        size += len(chunk)
+        if size > UPLOAD_MAX_BYTES: 
+          raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Image larger than {UPLOAD_MAX_BYTES} bytes")
+
+        digest.update(chunk)
+        await f.write(chunk)
+
+    if ext is None: 
+      raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty image file")
+
+    # content addressed name: the same image uploaded twice is stored once
+    file_path = dir_path / f"{digest.hexdigest()}{ext}"
+    if await file_path.exists(): 
+      await tmp_path.unlink()
+      outcome = "deduplicated"
+    else: 
+      await tmp_path.rename(file_path)
+      outcome = "stored"
 
-  content = await upload_file.read() 
-  with file_path.open("wb") as f: 
-    f.write(content)
+  except BaseException: 
+    await tmp_path.unlink(missing_ok=True)
+    upload_stats.record(source, size, time.perf_counter() - started_at, "rejected")
+    raise
 
+  upload_stats.record(source, size, time.perf_counter() - started_at, outcome)
   return str(file_path)
 
 
 
 def generate_slug(text: str) -> str: 
-  return slugify(text=text)
\ No newline at end of file
+  return slugify(text=text)
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, ForeignKey, Enum, DateTime
+from sqlalchemy import String, ForeignKey, Enum, DateTime, Index, UniqueConstraint
 from db.base import Base 
 from account.models import User
 from typing import TYPE_CHECKING
@@ -31,6 +31,10 @@ class ShippingAddress(Base):
   user: Mapped["User"] = relationship("User", back_populates="shipping_address")
   orders: Mapped[list['Order']] = relationship("Order", back_populates="shipping_address")
 
+  __table_args__ = (
+    Index("ix_shipping_address_user_id", "user_id"),
+  )
+
 
 
 class ShippingStatus(Base): 
@@ -42,3 +46,8 @@ class ShippingStatus(Base):
 
   updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
   order: Mapped["Order"] = relationship("Order", back_populates="shipping_status")
+
+  # an order has one shipping status
+  __table_args__ = (
+    UniqueConstraint("order_id", name="uq_shipping_status_order_id"),
+  )
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from db.config import session
-from account.models import User
+from db.replicas import read_session
+from account.cache import AuthUser
 from account.dependency import get_current_user, require_admin
 from shipping import schemas as sc
 from shipping.models import ShippingAddress
@@ -12,7 +13,7 @@ router = APIRouter()
 async def create_user_address(
   session: session, 
   data: sc.Create,
-  user: User = Depends(get_current_user), 
+  user: AuthUser = Depends(get_current_user), 
   ): 
 
   return await ss.create_shipping_address(session, user.id, data)
@@ -20,8 +21,8 @@ async def create_user_address(
 
 @router.get("/address", response_model=list[sc.Out])
 async def list_user_addresses(
-  session: session, 
-  user: User = Depends(get_current_user)
+  session: read_session, 
+  user: AuthUser = Depends(get_current_user)
   ) -> list[sc.Out]:
 
   return await ss.list_user_address(session, user.id) 
@@ -32,7 +33,7 @@ async def list_user_addresses(
 async def get_user_address(
   session: session, 
   address_id: int,
-  user: User = Depends(get_current_user)
+  user: AuthUser = Depends(get_current_user)
   ) -> sc.Out:
 
   return await ss.get_user_shipping_address(session, user.id, address_id)
@@ -44,7 +45,7 @@ async def update_user_shipping_address(
   session: session, 
   address_id: int, 
   data: sc.Update,
-  user: User = Depends(get_user_address)
+  user: AuthUser = Depends(get_user_address)
   ): 
   return await ss.update_user_shipping_address(session, user.id, address_id, data)
 
@@ -53,7 +54,7 @@ async def update_user_shipping_address(
 async def delete_user_address(
   session: session,
   address_id: int, 
-  user: User = Depends(get_current_user)
+  user: AuthUser = Depends(get_current_user)
   ) -> dict:
   
   return await ss.delete_user_shipping_address(session, user.id, address_id)
@@ -63,7 +64,7 @@ async def delete_user_address(
 async def get_user_order_shipping_status_out(
   session: session, 
   order_id: int, 
-  user: User = Depends(get_current_user)
+  user: AuthUser = Depends(get_current_user)
   ): 
   return await ss.get_user_shipping_address(session, user.id, order_id)
 
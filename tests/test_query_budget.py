@@ -0,0 +1,55 @@
+"""Pins the N+1 fixes: these service calls run a fixed number of statements, however
+many rows they handle.
+"""
+import pytest
+from sqlalchemy import delete, insert, text
+from sqlalchemy.exc import DBAPIError
+from cart.models import CartItem
+from cart.services import list_user_cart
+from db.querystats import query_budget, track_queries
+from order.services import checkout
+from payment.schemas import PaymentCreate
+
+pytestmark = pytest.mark.anyio
+
+
+async def fill_cart(session, user_id: int, product_ids: list[int]) -> int:
+  # replaces the user's cart, every seeded product costs 10
+  await session.execute(delete(CartItem).where(CartItem.user_id == user_id))
+  await session.execute(insert(CartItem), [
+    {"user_id": user_id, "product_id": product_id, "quantity": 1, "price": 10.0}
+    for product_id in product_ids
+  ])
+  await session.flush()
+  return 10 * len(product_ids)
+
+
+async def test_list_user_cart_is_one_query(session, seeded):
+  async with query_budget(1, max_duplicates=1):
+    cart = await list_user_cart(session, seeded.user_id)
+
+  assert len(cart.items) == len(seeded.cart_product_ids)
+
+
+async def test_checkout_query_count_is_independent_of_cart_size(session, seeded):
+  counts = {}
+  for cart_size in (1, 50):
+    amount = await fill_cart(session, seeded.user_id, seeded.product_ids[:cart_size])
+    payment = PaymentCreate(amount=amount, shipping_address_id=seeded.address_id, simulate_success=True)
+
+    async with query_budget(20, max_duplicates=1) as stats:
+      order = await checkout(session, seeded.user_id, payment)
+
+    assert len(order.orderitems) == cart_size
+    counts[cart_size] = stats.count
+
+  assert counts[1] == counts[50], counts
+
+
+async def test_failed_statement_leaves_no_start_time(session):
+  conn = await session.connection()
+  with track_queries():
+    with pytest.raises(DBAPIError):
+      await conn.execute(text("SELECT * FROM no_such_table"))
+
+  assert not conn.info.get("query_start")
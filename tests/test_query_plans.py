@@ -0,0 +1,88 @@
+"""EXPLAIN the statements the hot service calls run and check they use the indexes from
+the e7b4d2a8c935 migration, so a dropped index or a rewritten query that stops using
+one fails here rather than as a full scan in production.
+"""
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from account.services import get_user_via_email
+from cart.schemas import CartItemCreate
+from cart.services import add_to_cart, list_user_cart
+from order.services import all_placed_order, get_placed_order_for_user
+from payment.services import get_payment_by_order_id, list_payments_by_user
+from shipping.services import get_user_shipping_address
+
+pytestmark = pytest.mark.anyio
+
+
+@contextmanager
+def capture_statements(engine):
+  statements = []
+
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # EXPLAIN covers SELECT, UPDATE and DELETE; inserts have no plan
+    if not executemany and statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+      statements.append((statement, parameters))
+
+  event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+  try:
+    yield statements
+  finally:
+    event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+async def explain(session, statement, parameters) -> list[dict]:
+  conn = await session.connection()
+  result = await conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+  return [dict(row) for row in result.mappings()]
+
+
+CASES = {
+  "cart by user": (
+    lambda s, seeded: list_user_cart(s, seeded.user_id),
+    "cart_items", "uq_cart_items_user_product",
+  ),
+  "cart by user and product": (
+    lambda s, seeded: add_to_cart(s, seeded.user_id, CartItemCreate(product_id=seeded.cart_product_ids[0], quantity=1)),
+    "cart_items", "uq_cart_items_user_product",
+  ),
+  "orders by user": (
+    lambda s, seeded: get_placed_order_for_user(s, seeded.user_id),
+    "orders", "ix_orders_user_id_created_at",
+  ),
+  "orders by status": (
+    lambda s, seeded: all_placed_order(s),
+    "orders", "ix_orders_status_created_at",
+  ),
+  "payments by user": (
+    lambda s, seeded: list_payments_by_user(s, seeded.user_id),
+    "payments", "ix_payments_user_id",
+  ),
+  "payment by order": (
+    lambda s, seeded: get_payment_by_order_id(s, seeded.order_id, seeded.user_id),
+    "payments", "order_id",
+  ),
+  "shipping status by order": (
+    lambda s, seeded: get_user_shipping_address(s, seeded.user_id, seeded.order_id),
+    "shipping_status", "uq_shipping_status_order_id",
+  ),
+  "user by email": (
+    lambda s, seeded: get_user_via_email(s, seeded.email),
+    "users", "email",
+  ),
+}
+
+
+@pytest.mark.parametrize("case", CASES)
+async def test_service_query_uses_index(case, engine, session, seeded):
+  call, table, expected_key = CASES[case]
+
+  with capture_statements(engine) as statements:
+    await call(session, seeded)
+
+  plans = [(statement, row) for statement, parameters in statements for row in await explain(session, statement, parameters) if row["table"] == table]
+  assert plans, f"no statement touched {table}"
+
+  for statement, row in plans:
+    assert row["type"] != "ALL", f"full scan of {table}:\n{statement}\n{row}"
+  assert expected_key in {row["key"] for _, row in plans}, f"{expected_key} unused on {table}: {[row for _, row in plans]}"